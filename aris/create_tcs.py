@@ -18,6 +18,9 @@ from my_jira_app.utils import (
     # MyDefaultDict,
     path_leaf,
 )  # noqa: E501
+from excel_stream import write_frame
+from throttle import shared_adapter, mount
+from stage_profiler import Profiler, generate_argparser
 
 
 class CreateTCS(MyLogger, Loader, QtCore.QRunnable):
@@ -53,6 +56,18 @@ class CreateTCS(MyLogger, Loader, QtCore.QRunnable):
         self.delete_all_xlsx = self.yml["delete_all_xlsx_files_from_temp_and_download"]
         self.delete_json_dump_file = self.yml["delete_json_dump_file"]
         self.clear_everything_create = self.yml["would_like_to_clear_everything_create"]
+        # rate limit and retries shared by every JIRA call of the app
+        self.adapter = shared_adapter(
+            rate=self.yml.get("rate_limit", 5), max_retries=self.yml.get("max_retries", 5)
+        )
+        # cProfile and tracemalloc top allocations of each stage of run()
+        self.profiler = Profiler(
+            self.script_name,
+            os.path.join(self.parent, self.apps, "profiles"),
+            enabled=self.yml.get("profile", False) is True,
+            memory=self.yml.get("profile_memory", True),
+            top=self.yml.get("profile_top", 25),
+        )
 
         super().__init__(log_name=self.log_name, name=self.script_name)
 
@@ -738,12 +753,8 @@ class CreateTCS(MyLogger, Loader, QtCore.QRunnable):
     def generate_excel(df: pd.DataFrame, file_name: str) -> None:
         timerz = time.strftime("%Y%m%d_%H%M%S")
         filename = file_name + "_" + timerz + ".xlsx"
-        # compress all dataframes into a single dataframe for xray import
-        writer = pd.ExcelWriter(
-            filename, engine="xlsxwriter", options={"remove_timezone": True}
-        )
-        df.to_excel(writer, sheet_name="Data", header=True, index=False)
-        writer.save()
+        # rows are streamed to disk, the workbook is never held in memory
+        write_frame(filename, "Data", df, index=False)
 
     def generate_csv(self, df: pd.DataFrame, file_name: str) -> None:
         timerz = time.strftime("_%Y%m%d_%H%M%S")
@@ -833,11 +844,17 @@ class CreateTCS(MyLogger, Loader, QtCore.QRunnable):
             logging.getLogger(self.script_name).error(f"File is empty: {file}")
             return {}
 
-    def create_jira_ticket(self, payload: dict) -> str:
+    def jira_client(self) -> atlassian.Jira:
         loader = Loader(self.yml_name)
         jira = atlassian.Jira(
             url=self.target, username=loader.cfg.user, password=loader.cfg.password,
         )
+        # atlassian.Jira sends everything through its requests session
+        mount(jira._session, self.adapter)
+        return jira
+
+    def create_jira_ticket(self, payload: dict) -> str:
+        jira = self.jira_client()
         response = jira.issue_create(fields=payload)
         if "key" in response.keys():
             key = response["key"]
@@ -936,10 +953,11 @@ class CreateTCS(MyLogger, Loader, QtCore.QRunnable):
         loader = Loader(self.yml_name)
         headers = {"Authorization": "Basic %s" % loader.cfg.u,
                    "Content-Type": "application/json"}
+        session = mount(requests.Session(), self.adapter)
         for i in range(label_df.shape[1]):
             label = "Label"+str(i+1)
             label_value = str(df.loc[first_index, label]).replace(" ", "")
-            response = requests.put(self.target + 'rest/api/2/issue/' + str(jira_key), data=json.dumps(
+            response = session.put(self.target + 'rest/api/2/issue/' + str(jira_key), data=json.dumps(
                 {"update": {"labels": [{"add": label_value}]}}), headers=headers, verify=False)
 
             if len(response.text) > 0:
@@ -1054,21 +1072,26 @@ class CreateTCS(MyLogger, Loader, QtCore.QRunnable):
             """
         )
 
-        self.process_files()
-        consolidated = self.compress_into_one_file()
-        os.chdir(os.path.join(self.parent, self.master, "consolidated"))
-        self.generate_csv(
-            consolidated, self.consolidated_file_name)
-        self.generate_excel(
-            consolidated, self.consolidated_file_name
+        with self.profiler.stage("process_files"):
+            self.process_files()
+        with self.profiler.stage("compress_into_one_file"):
+            consolidated = self.compress_into_one_file()
+        consolidated_file = os.path.join(
+            self.parent, self.master, "consolidated", self.consolidated_file_name
         )
-        os.chdir(os.path.join(self.parent, self.apps))
+        with self.profiler.stage("generate_csv"):
+            self.generate_csv(consolidated, consolidated_file)
+        with self.profiler.stage("generate_excel"):
+            self.generate_excel(consolidated, consolidated_file)
         self.update_progress_bar(100)
         self.statusbar.showMessage("Done")
 
 
 def main():
+    args = generate_argparser("Create the test cases of the mapping file on JIRA").parse_args()
     creator_instance = CreateTCS()
+    if args.profile is not None:
+        creator_instance.profiler.enabled = args.profile
     creator_instance.run()
 
 
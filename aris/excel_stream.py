@@ -0,0 +1,89 @@
+import os
+from datetime import date, datetime
+
+import pandas as pd
+import xlsxwriter
+
+
+def write_frame(path: str, sheet: str, df: pd.DataFrame, index: bool = True) -> int:
+    """
+    Stream df into a new .xlsx in xlsxwriter constant_memory mode, return the rows written.
+    Rows are flushed one after the other: pandas' ExcelWriter writes column by column
+    and cannot use that mode. The writer of a column (date, number or any value) is
+    picked once from its dtype, timezones are removed. Header and index label are
+    written like DataFrame.to_excel(header=True, index=index)
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    for column in df.columns:
+        if getattr(getattr(df[column], "dt", None), "tz", None) is not None:
+            df = df.assign(**{column: df[column].dt.tz_localize(None)})
+    writers = [_column_writer(df[column]) for column in df.columns]
+    header = [df.index.name or ""] if index is True else []
+    header += [str(column) for column in df.columns]
+    offset = 1 if index is True else 0
+
+    workbook = xlsxwriter.Workbook(
+        path,
+        {
+            "constant_memory": True,
+            "remove_timezone": True,
+            "default_date_format": "yyyy/mm/dd hh:mm:ss",
+        },
+    )
+    try:
+        worksheet = workbook.add_worksheet(sheet)
+        bold = workbook.add_format({"bold": True, "border": 1, "align": "center"})
+        for j, title in enumerate(header):
+            worksheet.write_string(0, j, title, bold)
+        count = 0
+        for count, row in enumerate(df.itertuples(index=True, name=None), 1):
+            if index is True:
+                _write_value(worksheet, count, 0, row[0])
+            for j, value in enumerate(row[1:]):
+                writers[j](worksheet, count, j + offset, value)
+    finally:
+        workbook.close()
+    return count
+
+
+def _column_writer(column: pd.Series):
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return _write_date
+    if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+        return _write_number
+    return _write_value
+
+
+def _missing(value) -> bool:
+    """None, NaN and NaT are written as blank cells"""
+    return value is None or (
+        not isinstance(value, (str, list, dict, tuple)) and value != value
+    )
+
+
+def _write_date(worksheet, row: int, col: int, value) -> None:
+    if not _missing(value):
+        worksheet.write_datetime(row, col, value)
+
+
+def _write_number(worksheet, row: int, col: int, value) -> None:
+    if not _missing(value):
+        worksheet.write_number(row, col, value)
+
+
+def _write_value(worksheet, row: int, col: int, value) -> None:
+    if _missing(value):
+        return
+    if hasattr(value, "item") and not isinstance(value, (datetime, date)):
+        # numpy scalars
+        value = value.item()
+    if isinstance(value, str):
+        worksheet.write_string(row, col, value)
+    elif isinstance(value, bool):
+        worksheet.write_boolean(row, col, value)
+    elif isinstance(value, (int, float)):
+        worksheet.write_number(row, col, value)
+    elif isinstance(value, (datetime, date)):
+        worksheet.write_datetime(row, col, value)
+    else:
+        worksheet.write_string(row, col, str(value))
@@ -15,9 +15,11 @@ from selenium.common.exceptions import (
     WebDriverException,
     ElementNotVisibleException,
 )
-from pandas import ExcelWriter, DataFrame
+from pandas import DataFrame
 from typing import List, Union
 from my_jira_app.utils import MyLogger, Loader, search_import_file, path_leaf
+from excel_stream import write_frame
+from stage_profiler import Profiler, generate_argparser
 
 
 class Scrape_ARIS(MyLogger, Loader, QtCore.QRunnable):
@@ -54,6 +56,14 @@ class Scrape_ARIS(MyLogger, Loader, QtCore.QRunnable):
         self.skip_url_retrieval = self.yml["skip_url_retrieval"]
         self.clear_everything_scape = self.yml["would_like_to_clear_everything_scrape"]
         self.delete_pickle = self.yml["delete_pickle"]
+        # cProfile and tracemalloc top allocations of each stage of run()
+        self.profiler = Profiler(
+            self.script_name,
+            os.path.join(self.parent, self.apps, "profiles"),
+            enabled=self.yml.get("profile", False) is True,
+            memory=self.yml.get("profile_memory", True),
+            top=self.yml.get("profile_top", 25),
+        )
 
         super().__init__(log_name=self.log_name, name=self.script_name)
 
@@ -543,16 +553,10 @@ class Scrape_ARIS(MyLogger, Loader, QtCore.QRunnable):
 
     def generate_excel(self, df: DataFrame) -> None:
         "Generate an excel from the df provided in the grab_report method"
-        writer = pd.ExcelWriter(
-            self.mapping, engine="xlsxwriter", options={"remove_timezone": True}
-        )
-        df.to_excel(writer, sheet_name="mapping", header=True, index=True)
-        self.save_excel(writer, df)
+        self.save_excel(df)
 
-    def save_excel(self, writer: ExcelWriter, new_mapping: DataFrame) -> None:
-        """ Save the generated excel """
-        if new_mapping.shape[1] > 4:
-            new_mapping.set_index("Unnamed: 0", inplace=True)
+    def save_excel(self, new_mapping: DataFrame) -> None:
+        """ Save the generated excel, rows are streamed to the mapping file """
         path_to_mapping = os.path.join(self.parent, self.master, self.mapping)
         if os.path.exists(path_to_mapping):
 
@@ -560,22 +564,18 @@ class Scrape_ARIS(MyLogger, Loader, QtCore.QRunnable):
                 f"Folder name '{self.mapping}' already exists, updating file"
             )
 
+            if new_mapping.shape[1] > 4:
+                new_mapping.set_index("Unnamed: 0", inplace=True)
             previous = self.load_mapping_file()
             previous.set_index("Unnamed: 0", inplace=True)
             if new_mapping.empty is False:
                 result = pd.concat([previous, new_mapping])
-                result.to_excel(writer, sheet_name="mapping",
-                                header=True, index=True)
-                os.chdir(os.path.join(self.parent, self.master))
-                writer.save()
-                os.chdir(os.path.join(self.parent, self.apps))
+                write_frame(path_to_mapping, "mapping", result)
         else:
             logging.getLogger(self.script_name).info(
                 f"File '{self.mapping}' does not exist, creating"
             )
-            os.chdir(os.path.join(self.parent, self.master))
-            writer.save()
-            os.chdir(os.path.join(self.parent, self.apps))
+            write_frame(path_to_mapping, "mapping", new_mapping)
 
     def run(self):
         driver, _, _ = self.launch_firefox()
@@ -616,21 +616,27 @@ class Scrape_ARIS(MyLogger, Loader, QtCore.QRunnable):
                 """
                   )
         if self.skip_url_retrieval is False:
-            liste = self.grab_urls(driver, list())
-            liste = self.next_page(driver, liste)
+            with self.profiler.stage("grab_urls"):
+                liste = self.grab_urls(driver, list())
+                liste = self.next_page(driver, liste)
             print(f"{len(liste)} urls were saved on your {self.pickle_file}")
             self.save_pickle(liste)
         liste = self.load_pickle()
         self.totalRequest = len(liste)
         self.check_download_folder_exists()
-        mapping_file = self.grab_report(liste, driver)
-        self.generate_excel(mapping_file)
+        with self.profiler.stage("grab_report"):
+            mapping_file = self.grab_report(liste, driver)
+        with self.profiler.stage("generate_excel"):
+            self.generate_excel(mapping_file)
         self.update_progress_bar(100)
         self.statusbar.showMessage("Done")
 
 
 def main():
+    args = generate_argparser("Crawl ARIS and download the reports of every process").parse_args()
     scraper = Scrape_ARIS()
+    if args.profile is not None:
+        scraper.profiler.enabled = args.profile
     scraper.run()
 
 
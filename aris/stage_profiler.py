@@ -0,0 +1,89 @@
+import argparse
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Profiler:
+    """
+    Profile the stages of run() on demand: profile in config_aris.yml or --profile.
+    Every stage writes a cProfile .prof (snakeviz, pstats) and its top functions
+    in a .txt, memory adds the tracemalloc top allocations by line and the peak
+    in a .memory.txt.
+    Files are written to folder as soon as the stage ends: <name>_<stamp>_<stage>.<ext>
+    Disabled, stage() does nothing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        folder: str,
+        enabled: bool = False,
+        memory: bool = True,
+        top: int = 25,
+    ):
+        self.name = name
+        self.folder = folder
+        self.enabled = enabled
+        self.memory = memory
+        self.top = top
+        self.stamp = time.strftime("%Y%m%d_%H%M%S")
+
+    @contextmanager
+    def stage(self, stage: str):
+        if self.enabled is not True:
+            yield self
+            return
+        # the caller may already trace, e.g. python -X tracemalloc
+        started = self.memory is True and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot() if self.memory is True else None
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield self
+        finally:
+            profile.disable()
+            profile.dump_stats(self.path(stage, "prof"))
+            stream = io.StringIO()
+            stats = pstats.Stats(profile, stream=stream).sort_stats("cumulative")
+            stats.print_stats(self.top)
+            self.write(stage, "txt", stream.getvalue())
+            if before is not None:
+                after = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                if started:
+                    tracemalloc.stop()
+                lines = [f"{self.name} {stage}: peak {peak / 2**20:.1f} MB traced"]
+                top = after.compare_to(before, "lineno")[: self.top]
+                lines.extend(str(difference) for difference in top)
+                self.write(stage, "memory.txt", "\n".join(lines) + "\n")
+
+    def path(self, stage: str, extension: str) -> str:
+        os.makedirs(self.folder, exist_ok=True)
+        return os.path.join(
+            self.folder, f"{self.name}_{self.stamp}_{stage}.{extension}"
+        )
+
+    def write(self, stage: str, extension: str, text: str) -> None:
+        path = self.path(stage, extension)
+        with open(path, "w") as file:
+            file.write(text)
+        logging.getLogger(self.name).info(f"Profile of {stage} written to {path}")
+
+
+def generate_argparser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=None,
+        help="profile every stage of the run, overrides profile in config_aris.yml",
+    )
+    return parser
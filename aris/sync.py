@@ -6,6 +6,8 @@ import os
 import logging
 from numpy import nan
 from my_jira_app.utils import MyLogger, Loader, path_leaf
+from throttle import shared_adapter, mount
+from stage_profiler import Profiler, generate_argparser
 from collections import ChainMap
 
 
@@ -31,6 +33,18 @@ class SyncJIRA(MyLogger, Loader, QtCore.QRunnable):
         self.cfg = self.grab_configuration()
         self.master = self.yml["master"]
         self.apps = self.yml["apps"]
+        # rate limit and retries shared by every JIRA call of the app
+        self.adapter = shared_adapter(
+            rate=self.yml.get("rate_limit", 5), max_retries=self.yml.get("max_retries", 5)
+        )
+        # cProfile and tracemalloc top allocations of each stage of run()
+        self.profiler = Profiler(
+            self.script_name,
+            os.path.join(self.parent, self.apps, "profiles"),
+            enabled=self.yml.get("profile", False) is True,
+            memory=self.yml.get("profile_memory", True),
+            top=self.yml.get("profile_top", 25),
+        )
 
         super().__init__(log_name=self.log_name, name=self.script_name)
 
@@ -50,6 +64,8 @@ class SyncJIRA(MyLogger, Loader, QtCore.QRunnable):
         jira = atlassian.Jira(
             url=self.target, username=self.cfg.user, password=self.cfg.password
         )
+        # atlassian.Jira sends everything through its requests session
+        mount(jira._session, self.adapter)
         return jira
 
     def grab_jira_keys(self):
@@ -155,16 +171,22 @@ class SyncJIRA(MyLogger, Loader, QtCore.QRunnable):
         self.handle_QMessageBox_upstream_requests()
         logging.getLogger(self.script_name).info(
             "Starting sync.py")
-        data = self.load_json()
-        JIRA_keys = self.grab_jira_keys()
+        with self.profiler.stage("load_json"):
+            data = self.load_json()
+        with self.profiler.stage("grab_jira_keys"):
+            JIRA_keys = self.grab_jira_keys()
         jira = self.load_jira_client()
-        self.compare_offline_online(JIRA_keys, jira, data)
+        with self.profiler.stage("compare_offline_online"):
+            self.compare_offline_online(JIRA_keys, jira, data)
         self.update_progress_bar(100)
         self.statusbar.showMessage("Done")
 
 
 def main():
+    args = generate_argparser("Sync ARIS and JIRA").parse_args()
     sync_instance = SyncJIRA()
+    if args.profile is not None:
+        sync_instance.profiler.enabled = args.profile
     sync_instance.run()
 
 
@@ -0,0 +1,61 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 429, 5xx and broken connections are retried, POST is not: a ticket could be created twice
+RETRIED_METHODS = frozenset({"GET", "PUT", "DELETE", "HEAD", "OPTIONS"})
+RETRIED_STATUS = (429, 500, 502, 503, 504)
+
+
+class ThrottledAdapter(HTTPAdapter):
+    """
+    Transport adapter that spaces the requests of every session it is mounted on
+    by 1 / rate seconds, whatever the thread that sends them.
+    urllib3 retries the calls JIRA throttles or fails on, waiting Retry-After
+    or an exponential backoff of backoff * 2 ** attempt seconds.
+    """
+
+    def __init__(self, rate: float = 5, max_retries: int = 5, backoff: float = 0.5):
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRIED_STATUS,
+            allowed_methods=RETRIED_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        super().__init__(max_retries=retry)
+        self.interval = 1 / rate
+        self.lock = threading.Lock()
+        self.next_call = 0.0
+
+    def send(self, request, **kwargs):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+        return super().send(request, **kwargs)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_adapter(**kwargs) -> ThrottledAdapter:
+    """Adapter of the whole app, created with the arguments of the first call"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ThrottledAdapter(**kwargs)
+        return _shared
+
+
+def mount(session: requests.Session, adapter: ThrottledAdapter) -> requests.Session:
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
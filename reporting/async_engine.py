@@ -0,0 +1,63 @@
+import asyncio
+from typing import Iterable
+from scheduler import RequestScheduler
+
+
+class AsyncFetcher:
+    '''
+    Alternative to the ThreadPoolExecutor of BaseExtractor: every url is awaited on a single event loop
+    so hundreds of requests can be in flight without spawning hundreds of threads.
+    The semaphore is the global concurrency limit, JIRA never sees more than `concurrency` open requests.
+    aiohttp is only imported when the engine is selected in config.yml or through --engine asyncio
+    The token bucket, Retry-After, the backoff and the calls per endpoint of the scheduler apply as they do to the threads,
+    the waits are awaited so that the loop keeps serving the other requests.
+    endpoint_concurrency caps the calls in flight per endpoint, concurrency by default: every search page is the same endpoint,
+    so the endpoint limit of the threads (MAX_WORKERS by default) would bring the loop back to the size of the thread pool.
+    '''
+    def __init__(self, headers: dict, concurrency: int = 100, timeout: tuple = (5, 60), verify: bool = False, scheduler: RequestScheduler = None,
+                 endpoint_concurrency: int = None) -> None:
+        self.headers = headers
+        self.concurrency = concurrency
+        self.endpoint_concurrency = endpoint_concurrency or concurrency
+        self.connect_timeout, self.read_timeout = timeout
+        self.verify = verify
+        self.scheduler = scheduler or RequestScheduler()
+        ''' bytes of the bodies, aiohttp hands them over already inflated '''
+        self.received = 0
+
+    async def _fetch(self, session, semaphore: asyncio.Semaphore, endpoints: dict, url: str) -> dict:
+        import aiohttp
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.scheduler.reserve())
+            try:
+                async with semaphore, self.scheduler.async_slot(url, endpoints, self.endpoint_concurrency):
+                    async with session.get(url) as response:
+                        delay = self.scheduler.retry_delay(response.status, response.headers, attempt)
+                        if delay is None:
+                            self.received += len(await response.read())
+                            ''' JIRA does not always send application/json on error pages, let the caller fail on the payload like requests would '''
+                            return await response.json(content_type=None)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                delay = self.scheduler.error_delay(attempt)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _gather(self, urls: list) -> list:
+        import aiohttp
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ssl=None if self.verify else False)
+        timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+        async with aiohttp.ClientSession(headers=self.headers, connector=connector, timeout=timeout) as session:
+            ''' the asyncio semaphores of the endpoints belong to this loop, fetch() runs a new loop every time '''
+            endpoints = dict()
+            return await asyncio.gather(*[self._fetch(session, semaphore, endpoints, url) for url in urls])
+
+    def fetch(self, urls: Iterable[str]) -> list:
+        ''' Return the decoded payloads in the same order as the urls '''
+        urls = list(urls)
+        if len(urls) == 0:
+            return list()
+        return asyncio.run(self._gather(urls))
@@ -1,26 +1,53 @@
-import requests, math, os, time
+from __future__ import annotations
+import requests, math, os, time, logging
 from timeit import default_timer as timer
-import unittest
 from typing import Callable
-from pandas import ExcelWriter
 from requests.models import Response
 import argparse, sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from utils import Loader, MyLogger
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from itertools import repeat
+from utils import Loader, MyLogger, lazy_import, load_module
+from async_engine import AsyncFetcher
+from scheduler import shared_scheduler, mount
+from metrics import RunMetrics, received
+from profiling import Profiler
+from streaming import IssueStream, ijson
+from incremental import IssueStore
+from columnar import ColumnarStore
+from report_writer import ReportWriter
+from field_mapping import FieldMapping
+from timestamps import normalize_timestamps, unparsed
+pd = lazy_import('pandas')
 
 
 
 class BaseExtractor(Loader, MyLogger):
     ''' Base class for our extractors. '''
     ''' Without it a lot of utility functions would be repeated accross classes. '''
-    def __init__(self, name: str, verbose = None) -> None:
-        
+    ''' maxResults of the search API, see URL_2 in config.yml '''
+    PAGE_SIZE = 1000
+    ''' Fields read by clean_json, sent as a projection to the search API. Empty means every field is returned '''
+    FIELDS = ()
+    EXPAND = ()
+    ''' Fields of the linked issues read by clean_json and number of keys per bulk search '''
+    LINKED_FIELDS = ()
+    LINK_BATCH_SIZE = 100
+    ''' Columns mapped by clean_json, see field_mapping.Field '''
+    MAPPING = ()
+    ''' Custom fields kept by remove_custom_fields before clean_json '''
+    CUSTOM_FIELDS = ()
+    ''' Smaller reports are cleaned in the main process, starting the workers would cost more than it saves '''
+    SHARD_MIN_ISSUES = 2000
+
+    def __init__(self, name: str, verbose = None, yml: dict = None, cfg = None, parse_cli: bool = True) -> None:
+        ''' yml and cfg are passed by the batch runner so that config.yml and the credentials are loaded once for every report '''
         self.start = timer()
         self.end = 0
         self.wdirectory = os.path.dirname(os.path.abspath(__file__))
         self.name = name
         self.log = self.setLogger()
-        self.yml = self.load_yml()
+        self.yml = self.load_yml() if yml is None else yml
         ''' yml parameters can be overriden by CLI parameters with load_argparser() '''
         self.credentials = self.yml['jira']['CREDENTIALS']
         if verbose is None:
@@ -28,13 +55,77 @@ class BaseExtractor(Loader, MyLogger):
         else:
             self.verbose = verbose
         self.runtests = self.yml['jira']['RUN_UNIT_TEST']
-        ''' if args are specified through the CLI then load_argparser is triggered '''
-        self.load_argparser()
-        self.cfg = self.retrieve_credentials(self.credentials)
+        ''' threads or asyncio '''
+        self.engine = self.yml['jira'].get('FETCH_ENGINE', 'threads')
+        ''' only fetch the issues updated since the last run and merge them into a local store '''
+        self.incremental = self.yml['jira'].get('INCREMENTAL', False)
+        ''' profile the stages of this run, production runs can be profiled on demand from config.yml '''
+        self.profile = self.yml['jira'].get('PROFILE', False)
+        ''' if args are specified through the CLI then load_argparser is triggered, the batch runner parses its own CLI '''
+        if parse_cli is True:
+            self.load_argparser()
+        self.cfg = self.retrieve_credentials(self.credentials) if cfg is None else cfg
+        self.store = None
+        if self.incremental is True:
+            self.store = IssueStore(os.path.join(self.wdirectory, '.store'), self.name, self.yml['jira'].get('WATERMARK_OVERLAP', 5)).load()
+        ''' one keep-alive session per extractor, shared by every thread of grab_tickets '''
+        self.max_workers = self.yml['jira'].get('MAX_WORKERS', 10)
+        self.timeout = (self.yml['jira'].get('CONNECT_TIMEOUT', 5), self.yml['jira'].get('READ_TIMEOUT', 60))
+        ''' rate limit and retries of every call of the process, shared with the other extractors of a batch '''
+        self.scheduler = shared_scheduler(rate = self.yml['jira'].get('RATE_LIMIT', 20),
+                                          burst = self.yml['jira'].get('RATE_BURST', 10),
+                                          max_retries = self.yml['jira'].get('MAX_RETRIES', 5),
+                                          backoff = self.yml['jira'].get('BACKOFF', 0.5),
+                                          max_backoff = self.yml['jira'].get('MAX_BACKOFF', 60),
+                                          endpoint_concurrency = self.yml['jira'].get('ENDPOINT_CONCURRENCY') or self.max_workers)
+        ''' cProfile or sampled stacks and tracemalloc top allocations of every span, next to jira_extract.log by default '''
+        self.profiler = Profiler(self.name, self.yml['jira'].get('PROFILE_FOLDER') or 'profiles', enabled = self.profile is True,
+                                 mode = self.yml['jira'].get('PROFILE_MODE', 'cprofile'), memory = self.yml['jira'].get('PROFILE_MEMORY', True),
+                                 top = self.yml['jira'].get('PROFILE_TOP', 25))
+        ''' spans, counters and peak memory of the run, written next to the report by closeTimer '''
+        self.metrics = RunMetrics(self.name, os.path.join(self.wdirectory, self.name) if self.yml['jira'].get('METRICS', True) is True else None,
+                                  self.yml['jira'].get('METRICS_TEXTFILE'), self.scheduler, self.profiler)
+        self.session = self.build_session()
+        self.concurrency = self.yml['jira'].get('ASYNC_CONCURRENCY', 100)
+        ''' decode search pages issue by issue when ijson is installed '''
+        self.stream_decode = self.yml['jira'].get('STREAM_DECODE', True) is True and ijson is not None
+        ''' merge the pages of grab_tickets in JQL order instead of completion order '''
+        self.ordered_merge = self.yml['jira'].get('ORDERED_MERGE', False)
+        ''' parquet copy of the output of clean_json, partitioned by run date '''
+        self.columnar = None
+        if self.yml['jira'].get('COLUMNAR', False) is True:
+            if ColumnarStore.available() is True:
+                self.columnar = ColumnarStore(os.path.join(self.wdirectory, self.yml['jira'].get('COLUMNAR_FOLDER', 'datasets')), self.name)
+            else:
+                logging.getLogger(__name__).warning('COLUMNAR is set but pyarrow is not installed, no dataset is written')
+        ''' csv or parquet copy of every sheet written next to the excel '''
+        self.sidecar = self.yml['jira'].get('SIDECAR', None)
+        ''' columns of the report, extended by the EXTRA_COLUMNS of config.yml listed under the name of the report '''
+        extra = (self.yml['jira'].get('EXTRA_COLUMNS') or dict()).get(self.name)
+        self.mapping = FieldMapping.from_config(self.MAPPING, extra)
+        self.extra_fields = FieldMapping.from_config((), extra).top_fields()
+        ''' projection of the search API, widened by the batch runner when several reports share one search '''
+        self.fields = tuple(dict.fromkeys(self.FIELDS + tuple(self.extra_fields))) if len(self.FIELDS) > 0 else ()
+        self.expand = tuple(self.EXPAND)
+        ''' issues already fetched by the batch runner, resolve_linked_issues reads them instead of fetching them again '''
+        self.shared_issues = dict()
+        self.vectorized_mapping = self.yml['jira'].get('VECTORIZED_MAPPING', False)
+        ''' worker processes of remove_custom_fields and clean_json, 1 keeps them in the main process '''
+        self.processes = self.yml['jira'].get('PROCESSES') or 1
+        ''' timestamps are written to the excel in this timezone '''
+        self.timezone = self.yml['jira'].get('TIMEZONE', 'Europe/Luxembourg')
 
     def __repr__(self) -> str:
         ''' Called when instance is called directly '''
         return self.name
+
+    def __getstate__(self) -> dict:
+        ''' Sent to the clean_json workers: the session, the credentials and the local stores stay in the main process '''
+        state = dict(self.__dict__)
+        for name in ('session', 'cfg', 'store', 'columnar', 'scheduler', 'metrics', 'profiler'):
+            state[name] = None
+        state['shared_issues'] = dict()
+        return state
     
     def __setattr__(self, name, val) -> object:
         ''' Called when class attributes are updated '''
@@ -71,6 +162,9 @@ class BaseExtractor(Loader, MyLogger):
         parser.add_argument('-v', '--verbose', action = 'store_true', help = 'enable print statements', default=False)
         parser.add_argument('-test', '--runtests', action = 'store_true', help = 'run unit tests before script execution', default=False)
         parser.add_argument('-cred', '--credentials', help = 'specify the path with your JIRA user and password', required=True)
+        parser.add_argument('-e', '--engine', choices=['threads', 'asyncio'], help = 'fetch engine, overrides FETCH_ENGINE in config.yml', default=None)
+        parser.add_argument('-i', '--incremental', action = 'store_true', help = 'only fetch the issues updated since the last run', default=None)
+        parser.add_argument('--profile', action = 'store_true', help = 'profile every stage of the run, overrides PROFILE in config.yml', default=None)
         return parser
     
     def load_argparser(self) -> None:
@@ -82,6 +176,12 @@ class BaseExtractor(Loader, MyLogger):
             self.verbose = args.verbose
             self.runtests = args.runtests
             self.credentials = args.credentials
+            if args.engine is not None:
+                self.engine = args.engine
+            if args.incremental is not None:
+                self.incremental = args.incremental
+            if args.profile is not None:
+                self.profile = args.profile
             try:
                 self.release_version = args.release
                 self.system = args.system
@@ -96,112 +196,335 @@ class BaseExtractor(Loader, MyLogger):
     
     @staticmethod
     def run_tests() -> None: 
-        import custom_test
+        import unittest, custom_test
         suite = unittest.TestLoader().loadTestsFromModule(custom_test)
         unittest.TextTestRunner(verbosity=2).run(suite)
 
-    def wrapper(self, url, dictionary) -> dict:
-        response = self.consult_url(url).json()
-        return self.list_to_json(response['issues'], dictionary)
+    def wrapper(self, url: str) -> dict:
+        ''' Download one page into a dictionary of its own, only the collector of grab_tickets touches the consolidated one '''
+        ''' decode is thread time, with stream=True it includes reading the body from the socket '''
+        if self.stream_decode is True:
+            with self.consult_url(url, stream = True) as response:
+                with self.metrics.span('decode'):
+                    page = self.list_to_json(IssueStream(response), dict())
+                self.metrics.count('bytes', received(response))
+                return page
+        response = self.consult_url(url)
+        with self.metrics.span('decode'):
+            page = self.list_to_json(response.json()['issues'], dict())
+        self.metrics.count('bytes', received(response))
+        return page
+
+    def first_page(self, dictionary: dict) -> int:
+        ''' Feed the dictionary with the first page of the JQL and return the total number of issues it matches '''
+        if self.stream_decode is True:
+            with self.consult_url(self.search, stream = True) as response:
+                issues = IssueStream(response)
+                with self.metrics.span('decode'):
+                    page = self.list_to_json(issues, dict())
+                self.metrics.count('bytes', received(response))
+                self.collect(dictionary, page)
+                return issues.total
+        response = self.consult_url(self.search)
+        with self.metrics.span('decode'):
+            payload = response.json()
+            page = self.list_to_json(payload['issues'], dict())
+        self.metrics.count('bytes', received(response))
+        self.collect(dictionary, page)
+        return payload['total']
+
+    def collect(self, dictionary: dict, page: dict) -> dict:
+        ''' Merge one page into the consolidated dictionary, each page is merged exactly once '''
+        dictionary.update(page)
+        if self.verbose is True:
+            print(str(len(dictionary))+' retrieved so far')
+        return dictionary
             
-    def consult_url(self, url: str) -> Response:
+    def build_session(self) -> requests.Session:
+        ''' Pooled session: TLS handshakes are paid once per connection instead of once per request '''
+        ''' The pool is as large as the thread pool so that no thread waits for or discards a connection '''
+        ''' Every call goes through the scheduler: token bucket, Retry-After and backoff on 5xx '''
+        session = mount(requests.Session(), self.scheduler, pool_connections = 1, pool_maxsize = self.max_workers, pool_block = True)
+        session.headers.update({"Authorization": "Basic %s" % self.cfg.u, "Content-Type": "application/json", "Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+        session.verify = False
+        return session
+
+    def consult_url(self, url: str, stream: bool = False) -> Response:
         ''' Consult the API and return the field values of 1000 tickets at a time (maximum value)'''
-        return requests.get(url, headers = {"Authorization": "Basic %s" % self.cfg.u, "Content-Type": "application/json"}, verify = False)
+        ''' With stream=True the body is left on the socket for IssueStream, the caller has to close the response '''
+        return self.session.get(url, timeout = self.timeout, stream = stream)
+
+    def consult_json(self, url: str) -> dict:
+        ''' Decoded payload of one url, the bytes received are added to the metrics '''
+        response = self.consult_url(url)
+        payload = response.json()
+        self.metrics.count('bytes', received(response))
+        return payload
 
     def list_to_json(self, liste: list, dictionary: dict) -> dict:
         ''' Feed the dictionary with the newly grabbed list of dictionaries from the API '''
         for ticket in liste:
             dictionary[ticket['key']] = ticket['fields']
-        if self.verbose is True:
-            print(str(len(dictionary))+' retrieved so far')
         return dictionary
 
-    def number_iter_counter(self) -> int:
-        response = self.consult_url(self.search).json()
-        return math.ceil(response['total'] / 1000)
-
-    def url_builder(self) -> list:
-        urls = list()
-        for _ in range(self.number_iter_counter()):
-            urls.append(self.search)
-            self.yml['jira']['START_AT'] += 1000
-            self.search = self.URL + self.yml['jira']['LINK'] + str(self.yml['jira']['START_AT'])
-        return urls
+    def jql_filter(self) -> str:
+        ''' JQL clause that restricts an incremental run to the issues updated since the watermark of the store '''
+        if self.store is None or self.store.watermark is None:
+            return ''
+        return ' AND updated >= "' + self.store.watermark + '"'
+
+    def incremental_jql(self, jql: str) -> str:
+        ''' Wrap the JQL in parentheses before appending the filter so that OR clauses keep their meaning '''
+        if len(self.jql_filter()) == 0:
+            return jql
+        return '(' + jql + ')' + self.jql_filter()
+
+    def search_url(self, url_1: str, jql: str, url_2: str) -> str:
+        '''
+        Search URL of a report: url_1 + jql + url_2 with the watermark clause of incremental_jql after the whole JQL.
+        url_1 may end with the start of the JQL (jql=project = T2L AND PSP in () and url_2 start with its end ()&maxResults=1000),
+        both are moved into the JQL so that the parentheses and quotes they open are closed before the clause.
+        '''
+        prefix, marker, head = url_1.partition('jql=')
+        if len(marker) == 0:
+            prefix, head = url_1, ''
+        else:
+            prefix += marker
+        tail, amp, rest = str(url_2).partition('&')
+        if self.store is not None:
+            self.store.bind(prefix + head + str(jql) + tail + amp + rest + self.projection())
+        return prefix + self.incremental_jql(head + str(jql) + tail) + amp + rest
+
+    def projection(self) -> str:
+        ''' Only ask JIRA for what the extractor reads, this shrinks the payload and the decoding time of every page '''
+        query = ''
+        if len(self.fields) > 0:
+            query += '&fields=' + ','.join(self.fields)
+        if len(self.expand) > 0:
+            query += '&expand=' + ','.join(self.expand)
+        return query
+
+    def widen_projection(self, fields: tuple, expand: tuple) -> None:
+        ''' Search with the projection of several reports, an empty fields asks for every field '''
+        self.fields = tuple(fields)
+        self.expand = tuple(expand)
+        self.search = self.page_url(self.yml['jira']['START_AT'])
+
+    def page_url(self, start_at: int) -> str:
+        return self.URL + self.projection() + self.yml['jira']['LINK'] + str(start_at)
+
+    def url_builder(self, total: int) -> list:
+        ''' Urls of the pages that follow the first one, the total comes from the first page so no extra count request is needed '''
+        ''' self.yml is left untouched so grab_tickets can be called twice on the same instance '''
+        start_at = self.yml['jira']['START_AT']
+        return [self.page_url(start_at + i * self.PAGE_SIZE) for i in range(1, math.ceil(total / self.PAGE_SIZE))]
     
+    def fetch_json(self, urls: list) -> list:
+        ''' Consult every url with the selected engine and return the decoded payloads in the same order '''
+        if self.engine == 'asyncio':
+            ''' the endpoint limit of the loop is ASYNC_CONCURRENCY unless ENDPOINT_CONCURRENCY is set '''
+            fetcher = AsyncFetcher(dict(self.session.headers), concurrency = self.concurrency, timeout = self.timeout, verify = self.session.verify, scheduler = self.scheduler,
+                                   endpoint_concurrency = self.yml['jira'].get('ENDPOINT_CONCURRENCY'))
+            payloads = fetcher.fetch(urls)
+            self.metrics.count('bytes', fetcher.received)
+            return payloads
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self.consult_json, urls))
+
     def grab_tickets(self, dictionary: dict) -> dict:
         ''' Fire individual threads that consult the API, return the field values of 1000 tickets each and return the consolidated dictionary '''
-        processes, json = list(), dict()
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            for url in self.url_builder():
-                # Schedules the callable: wrapper to be executed and returns a Future object representing the execution of the callable.
-                processes.append(executor.submit(self.wrapper, url, dictionary))                
-        for task in as_completed(processes):
-            json.update(task.result())
-        return json
+        ''' The first page is read on its own: it carries the total that is needed to schedule the remaining pages '''
+        with self.metrics.span('fetch'):
+            urls = self.url_builder(self.first_page(dictionary))
+            if self.engine == 'asyncio':
+                for response in self.fetch_json(urls):
+                    self.collect(dictionary, self.list_to_json(response['issues'], dict()))
+            else:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    # Schedules the callable: wrapper to be executed and returns a Future object representing the execution of the callable.
+                    processes = [executor.submit(self.wrapper, url) for url in urls]
+                    ''' Pages are merged while the others are still downloading, either in JQL order or as soon as they land '''
+                    tasks = processes if self.ordered_merge is True else as_completed(processes)
+                    for task in tasks:
+                        self.collect(dictionary, task.result())
+        self.metrics.count('issues', len(dictionary))
+        return dictionary
 
-    def grab_linked_tickets(self, liste: list) -> dict:
-        ''' grab linked tickets asynchronously '''
-        processes, json = list(), dict()
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            for url in liste:
-                # Schedules the callable: wrapper to be executed and returns a Future object representing the execution of the callable.
-                processes.append(executor.submit(self.consult_url, url))                
-        for task in as_completed(processes):
-            json.update(task.result().json())
-        return json
+    def grab_incremental(self, dictionary: dict) -> dict:
+        ''' Incremental mode: fetch the issues changed since the last run, merge them into the store and return the whole store '''
+        if self.store is None:
+            return self.grab_tickets(dictionary)
+        started_at = time.time()
+        return self.merge_incremental(self.grab_tickets(dictionary), started_at)
+
+    def merge_incremental(self, changed: dict, started_at: float) -> dict:
+        ''' Merge the issues changed since the watermark into the store, save it and return the whole store '''
+        if self.verbose is True:
+            print(f"{len(changed)} tickets changed since {self.store.watermark}")
+        issues = self.store.merge(changed)
+        self.store.save(started_at)
+        return dict(issues)
+
+    @staticmethod
+    def linked_keys(fields: dict) -> list:
+        ''' Keys of the inward and outward links of one issue, in the order of the issuelinks field '''
+        keys = list()
+        for link in fields.get('issuelinks') or list():
+            for direction in ('inwardIssue', 'outwardIssue'):
+                if direction in link:
+                    keys.append(link[direction]['key'])
+        return keys
+
+    def key_search_url(self, keys: list, fields: tuple = None, expand: tuple = ()) -> str:
+        ''' validateQuery=warn keeps JIRA from rejecting the whole batch when one of the keys was deleted or moved '''
+        ''' fields default to LINKED_FIELDS '''
+        if fields is None:
+            fields = self.LINKED_FIELDS
+        url = self.yml['jira']['SEARCH'] + quote('key in (' + ','.join(keys) + ')') + '&validateQuery=warn&maxResults=' + str(len(keys))
+        if len(fields) > 0:
+            url += '&fields=' + ','.join(fields)
+        if len(expand) > 0:
+            url += '&expand=' + ','.join(expand)
+        return url
+
+    def fetch_keys(self, keys: list, fields: tuple = None, expand: tuple = ()) -> dict:
+        ''' Fetch the given issues through bulk key in (...) searches, the same shape as grab_tickets '''
+        urls = [self.key_search_url(keys[i:i + self.LINK_BATCH_SIZE], fields, expand) for i in range(0, len(keys), self.LINK_BATCH_SIZE)]
+        issues = dict()
+        for response in self.fetch_json(urls):
+            self.list_to_json(response['issues'], issues)
+        return issues
+
+    def resolve_linked_issues(self, dictionary: dict) -> dict:
+        ''' Collect the links of every issue first and fetch each linked issue once through bulk key in (...) searches '''
+        ''' Return the field values of the linked issues by key, the same shape as grab_tickets '''
+        keys = sorted({key for fields in dictionary.values() for key in self.linked_keys(fields)})
+        ''' linked issues that the batch runner already fetched with every linked field are not fetched again '''
+        linked = {key: self.shared_issues[key] for key in keys
+                  if key in self.shared_issues and all(field in self.shared_issues[key] for field in self.LINKED_FIELDS)}
+        linked.update(self.fetch_keys([key for key in keys if key not in linked]))
+        if self.verbose is True:
+            print(f"{len(linked)} linked tickets retrieved for {len(keys)} distinct links")
+        return linked
     
+    def report(self, dictionary: dict) -> dict:
+        ''' Stages that follow the fetch: keep the custom fields of the report, map, persist and write the excel '''
+        json = self.clean_stage(dictionary)
+        self.save_columnar(json)
+        with self.metrics.span('generate_excel'):
+            self.generate_excel(json)
+        return json
+
+    def prefetch(self, dictionary: dict) -> dict:
+        ''' Network lookups of clean_json done before the workers start, passed to clean_json as keyword arguments '''
+        return dict()
+
+    def clean_stage(self, dictionary: dict):
+        ''' remove_custom_fields and clean_json, split in shards over a process pool when PROCESSES is above 1 '''
+        args = self.CUSTOM_FIELDS + tuple(self.extra_fields)
+        ''' clean_json only maps, the linked tickets and the watchers are fetched here with the session '''
+        with self.metrics.span('linked_fetch'):
+            context = self.prefetch(dictionary)
+        if self.processes <= 1 or len(dictionary) < self.SHARD_MIN_ISSUES:
+            with self.metrics.span('remove_custom_fields'):
+                trimmed = self.remove_custom_fields(dictionary, *args)
+            with self.metrics.span('clean_json'):
+                return self.clean_json(trimmed, **context)
+        keys = list(dictionary)
+        size = math.ceil(len(keys) / self.processes)
+        shards = [{key: dictionary[key] for key in keys[i:i + size]} for i in range(0, len(keys), size)]
+        ''' the workers run remove_custom_fields and clean_json of their shard, both are counted as clean_json '''
+        with self.metrics.span('clean_json'), ProcessPoolExecutor(max_workers=self.processes) as executor:
+            results = list(executor.map(clean_shard, repeat(self), shards, repeat(args), repeat(context)))
+        if self.verbose is True:
+            print(f"{len(dictionary)} tickets cleaned in {len(shards)} shards")
+        return self.merge_shards(results)
+
+    @staticmethod
+    def merge_shards(results: list):
+        ''' Put the clean_json of every shard back together, in the order of the issues '''
+        final_json = dict()
+        for result in results:
+            final_json.update(result)
+        return final_json
+
+    def map_fields(self, dictionary: dict) -> dict:
+        ''' Apply the compiled column mapping to every issue, issue key -> row '''
+        return self.mapping.apply_all(dictionary, self.vectorized_mapping)
+
+    def save_columnar(self, dictionary: dict) -> None:
+        ''' Persist the output of clean_json when COLUMNAR is set in config.yml '''
+        if self.columnar is None:
+            return
+        with self.metrics.span('save_columnar'):
+            path = self.columnar.write(dictionary)
+        if self.verbose is True:
+            print(f"{len(dictionary)} rows written to {path}")
+
     @staticmethod
     def remove_custom_fields(json: dict, *args) -> dict: 
         ''' All custom fields are removed except the ones passed in as parameters '''
+        ''' Without any parameter no field at all is kept '''
+        if len(args) == 0:
+            return {key: dict() for key in json}
+        ''' the issues share their field names, each name is decided once for the whole report '''
+        kept = dict()
         final_json = dict()
-        for key, _ in json.items():
+        for key, fields in json.items():
             main_fields_json = dict()
-            for field in json[key].keys():
-                for _arg in args:
-                    if _arg in field:
-                        main_fields_json[field] = json[key][field]
-                    elif 'customfield' not in field:
-                        main_fields_json[field] = json[key][field]
+            for field, value in fields.items():
+                keep = kept.get(field)
+                if keep is None:
+                    keep = kept[field] = 'customfield' not in field or any(_arg in field for _arg in args)
+                if keep is True:
+                    main_fields_json[field] = value
             final_json[key] = main_fields_json
         return final_json
     
     def retrieve_credentials(self, path: str) -> Callable: 
         ''' Return a callable module with my credentials '''
-        if os.path.isfile(path):
-            path = os.path.dirname(path)
-        ''' By default, Python looks for its modules and packages in $PYTHONPATH '''
-        sys.path.append(path)
-        os.chdir(path)
-        import configuration
-        os.chdir(self.wdirectory)
-        return configuration
+        folder = os.path.dirname(path) if os.path.isfile(path) else path
+        ''' imported from its file, sys.path and the working directory are left untouched '''
+        return load_module(os.path.join(folder, 'configuration.py'), 'configuration')
     
-    def save_excel(self, writer: ExcelWriter) -> None:
-        ''' Save the previously generated excel '''
-        if not os.path.exists(self.name):
-            if self.verbose is True:
-                print(f"Folder name '{self}' was created")
-            os.makedirs(self.name)
-            os.chdir(self.name)
-        else:
-            if self.verbose is True:
+    def normalize_dates(self, df: pd.DataFrame, columns: list) -> pd.DataFrame:
+        ''' Parse the JIRA timestamps of each column at once, the rows that could not be parsed are logged and keep their text '''
+        for column in dict.fromkeys(columns):
+            if column not in df.columns:
+                continue
+            parsed = normalize_timestamps(df[column], self.timezone)
+            rejected = unparsed(df[column], parsed)
+            if len(rejected) > 0:
+                message = f"{len(rejected)} values of '{column}' are not JIRA timestamps: {list(rejected[:10])}"
+                logging.getLogger(__name__).warning(message)
+                if self.verbose is True:
+                    print(message)
+                ''' the column then holds the dates and the values JIRA sent that are not dates '''
+                parsed = parsed.astype(object).where(parsed.notnull(), df[column])
+            df[column] = parsed
+        return df
+
+    def report_writer(self, filename: str) -> ReportWriter:
+        ''' Streaming excel writer for a file of the report folder, the folder is created if needed '''
+        folder = os.path.join(self.wdirectory, self.name)
+        if self.verbose is True:
+            if os.path.exists(folder):
                 print(f"Folder name '{self}' already exists")
-            os.chdir(self.name)
-        writer.save()
+            else:
+                print(f"Folder name '{self}' was created")
+        return ReportWriter(os.path.join(folder, filename), sidecar = self.sidecar)
 
     @property
     def test_file_creation(self) -> None:
-        os.chdir(os.path.join(self.wdirectory, self.name))
         timerz=time.strftime("%Y%m%d")
         filename = str(self.name)+'_'+timerz
-        self.search_import_file(filename,".xlsx")
-        os.chdir(self.wdirectory)
+        self.search_import_file(filename,".xlsx", os.path.join(self.wdirectory, self.name))
     
-    def search_import_file(self, a, b) -> str:
-        _directory = [i for i in os.listdir(os.path.curdir)]
+    def search_import_file(self, a, b, folder = os.path.curdir) -> str:
+        _directory = [i for i in os.listdir(folder)]
         for file in _directory: 
             if (file.startswith(a) and file.endswith(b)):
-                curdir = os.path.abspath(os.path.curdir)
+                curdir = os.path.abspath(folder)
                 path_to_file = os.path.join(curdir,file)
                 if self.verbose is True:
                     size = os.path.getsize(path_to_file)
@@ -214,3 +537,6 @@ class BaseExtractor(Loader, MyLogger):
         raise ValueError("IO Error: No file was created")
 
 
+def clean_shard(extractor: BaseExtractor, shard: dict, args: tuple, context: dict):
+    ''' Run in a worker process of clean_stage, module level so that it can be pickled '''
+    return extractor.clean_json(extractor.remove_custom_fields(shard, *args), **context)
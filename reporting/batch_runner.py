@@ -0,0 +1,181 @@
+import argparse, importlib, logging, math, os, sys, time
+from timeit import default_timer as timer
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils import Loader, MyLogger
+from metrics import RunMetrics
+from profiling import Profiler
+
+NAME = 'JIRA_Batch'
+
+''' report module -> extractor class '''
+REPORTS = {'jira_routine_V2': 'LogExtractor',
+           'deployment_log_UAT': 'DeployExtractor',
+           'test_extraction_V2': 'TestExtractor',
+           'release_notes': 'ReleaseNoteExtractor'}
+
+
+class BatchRunner(Loader, MyLogger):
+    '''
+    Run several reports in one process: config.yml and the credentials are loaded once,
+    every distinct search is run once and every issue is fetched once into a shared store.
+    Reports with the same search share one fetch with the union of their projections.
+    The searches that follow only ask for the keys, the issues a previous search did not return are fetched by key.
+    The clean_json and generate_excel stages of the reports then run in parallel.
+    Usage:
+    runner = BatchRunner(['jira_routine_V2', 'deployment_log_UAT'])
+    failed = runner.run()
+    '''
+    ''' projection of the searches that follow the first one, only the keys are needed '''
+    KEYS_ONLY = ('updated',)
+
+    def __init__(self, reports: list = None, verbose = None, credentials: str = None, profile: bool = None) -> None:
+        self.start = timer()
+        self.end = 0
+        self.wdirectory = os.path.dirname(os.path.abspath(__file__))
+        self.name = NAME
+        self.log = self.setLogger()
+        self.yml = self.load_yml()
+        if credentials is not None:
+            self.yml['jira']['CREDENTIALS'] = credentials
+        if profile is not None:
+            self.yml['jira']['PROFILE'] = profile
+        if verbose is None:
+            self.verbose = self.yml['jira']['VERBOSE']
+        else:
+            self.verbose = verbose
+        ''' every report of the batch section of config.yml when none is given '''
+        if reports is None or len(reports) == 0:
+            reports = (self.yml.get('batch') or dict()).get('REPORTS') or list(REPORTS)
+        ''' reports cleaned and written at the same time '''
+        self.max_workers = (self.yml.get('batch') or dict()).get('MAX_WORKERS') or len(reports)
+        ''' the credentials of the first report are handed to the others '''
+        self.extractors = list()
+        cfg = None
+        for report in reports:
+            extractor = self.load_extractor(report, cfg)
+            cfg = extractor.cfg
+            self.extractors.append(extractor)
+        ''' issue key -> fields, filled by fetch '''
+        self.issues = dict()
+        ''' the shared fetch, every report writes its own metrics and profiles '''
+        profiler = self.extractors[0].profiler
+        self.metrics = RunMetrics(self.name, os.path.join(self.wdirectory, self.name) if self.yml['jira'].get('METRICS', True) is True else None,
+                                  self.yml['jira'].get('METRICS_TEXTFILE'), self.extractors[0].scheduler,
+                                  Profiler(self.name, profiler.folder, enabled = profiler.enabled, mode = profiler.mode, memory = profiler.memory, top = profiler.top))
+
+    def __repr__(self) -> str:
+        return self.name
+
+    def stats(self, elapsed) -> str:
+        return f"{self} ({', '.join(map(str, self.extractors))}) done in ~ {elapsed} minutes"
+
+    def load_extractor(self, report: str, cfg = None):
+        if report not in REPORTS:
+            raise ValueError(f"Unknown report {report}, expected one of {list(REPORTS)}")
+        module = importlib.import_module(report)
+        extractor = getattr(module, REPORTS[report])
+        return extractor(name = module.NAME, verbose = self.verbose, yml = self.yml, cfg = cfg, parse_cli = False)
+
+    def searches(self) -> dict:
+        ''' Search of the reports (the url without projection nor paging) -> reports reading it, in the order of the batch '''
+        searches = dict()
+        for extractor in self.extractors:
+            searches.setdefault(extractor.URL, list()).append(extractor)
+        return searches
+
+    def union_projection(self) -> tuple:
+        ''' Fields and expand of every report, no fields at all when one of the reports reads every field '''
+        if any(len(extractor.fields) == 0 for extractor in self.extractors):
+            fields = ()
+        else:
+            fields = tuple(dict.fromkeys(field for extractor in self.extractors for field in extractor.fields))
+        expand = tuple(dict.fromkeys(value for extractor in self.extractors for value in extractor.expand))
+        return fields, expand
+
+    def fetch(self) -> dict:
+        ''' Run every distinct search once and return the keys each report matched, the issues are kept in self.issues '''
+        fields, expand = self.union_projection()
+        projections = {extractor: extractor.fields for extractor in self.extractors}
+        matched = dict()
+        for search, extractors in self.searches().items():
+            leader = extractors[0]
+            if len(self.issues) == 0:
+                leader.widen_projection(fields, expand)
+                found = leader.grab_tickets(dict())
+                self.issues.update(found)
+            else:
+                leader.widen_projection(self.KEYS_ONLY, ())
+                found = leader.grab_tickets(dict())
+                missing = [key for key in found if key not in self.issues]
+                if math.ceil(len(missing) / leader.LINK_BATCH_SIZE) > math.ceil(len(found) / leader.PAGE_SIZE):
+                    ''' little overlap: the full search takes fewer requests than the searches by key '''
+                    leader.widen_projection(fields, expand)
+                    self.issues.update(leader.grab_tickets(dict()))
+                else:
+                    self.issues.update(leader.fetch_keys(missing, fields, expand))
+            if self.verbose is True:
+                print(f"{', '.join(map(str, extractors))}: {len(found)} tickets, {len(self.issues)} in the batch so far")
+            for extractor in extractors:
+                matched[extractor] = list(found)
+        ''' the projection of every report is restored, the issues are handed out as each report would have fetched them '''
+        for extractor, projection in projections.items():
+            extractor.fields = projection
+        return matched
+
+    def issues_of(self, extractor, keys: list) -> dict:
+        ''' Issues of one report restricted to its own projection '''
+        if len(extractor.fields) == 0:
+            return {key: self.issues[key] for key in keys if key in self.issues}
+        fields = set(extractor.fields)
+        return {key: {field: value for field, value in self.issues[key].items() if field in fields} for key in keys if key in self.issues}
+
+    def run_report(self, extractor, keys: list, started_at: float) -> dict:
+        extractor.startTimer
+        json = self.issues_of(extractor, keys)
+        if extractor.store is not None:
+            json = extractor.merge_incremental(json, started_at)
+        extractor.shared_issues = self.issues
+        json = extractor.report(json)
+        extractor.closeTimer
+        return json
+
+    def run(self) -> dict:
+        ''' Fetch, then clean and write every report in parallel. Return report name -> exception of the reports that failed '''
+        self.startTimer
+        started_at = time.time()
+        with self.metrics.span('fetch'):
+            matched = self.fetch()
+        self.metrics.count('issues', len(self.issues))
+        failed = dict()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            tasks = {executor.submit(self.run_report, extractor, matched[extractor], started_at): extractor for extractor in self.extractors}
+            ''' one report failing does not stop the others '''
+            for task in as_completed(tasks):
+                try:
+                    task.result()
+                except Exception as e:
+                    logging.getLogger(__name__).exception(f'Report {tasks[task]} failed: {e}')
+                    if self.verbose is True:
+                        print(f'Report {tasks[task]} failed: {e}')
+                    failed[str(tasks[task])] = e
+        self.closeTimer
+        return failed
+
+
+def generate_argparser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Run several reports with a single fetch of the JIRA API')
+    parser.add_argument('reports', nargs='*', help = f'reports to run, REPORTS of the batch section in config.yml by default: {list(REPORTS)}')
+    parser.add_argument('-v', '--verbose', action = 'store_true', help = 'enable print statements', default=None)
+    parser.add_argument('-cred', '--credentials', help = 'specify the path with your JIRA user and password', default=None)
+    parser.add_argument('--profile', action = 'store_true', help = 'profile every stage of every report, overrides PROFILE in config.yml', default=None)
+    return parser
+
+def main() -> int:
+    ''' Nightly job: every report of the batch section of config.yml, or the reports given on the command line '''
+    args = generate_argparser().parse_args()
+    runner = BatchRunner(args.reports, verbose = args.verbose, credentials = args.credentials, profile = args.profile)
+    failed = runner.run()
+    return 1 if len(failed) > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import argparse, importlib, json, os, platform, statistics, tempfile, time
+from types import SimpleNamespace
+from timeit import default_timer as timer
+from base_class import BaseExtractor
+from batch_runner import REPORTS
+from jira_stub import JiraStub
+
+''' issues served by the stub for each run, the same sizes for every report '''
+SIZES = (1000, 10000, 100000)
+STAGES = ('grab_tickets', 'clean_json', 'generate_excel')
+OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.benchmarks', 'results.jsonl')
+
+
+def stub_yml(url: str, engine: str = 'threads', max_workers: int = 10, processes: int = 1) -> dict:
+    ''' config.yml of every report pointed at the stub, no throttling so that the stages are timed and not the rate limit '''
+    search = url + '/rest/api/2/search?jql='
+    return {'jira': {'URL_1': search, 'URL_2': '&maxResults=1000', 'JQL': 'project in (T2L)', 'CREDENTIALS': '',
+                     'LINK': '&startAt=', 'START_AT': 0, 'VERBOSE': False, 'RUN_UNIT_TEST': False,
+                     'BASE_URL': url + '/browse/', 'SEARCH': search, 'MAX_WORKERS': max_workers,
+                     'FETCH_ENGINE': engine, 'RATE_LIMIT': 1e6, 'RATE_BURST': 1000, 'PROCESSES': processes},
+            'test': {'URL_1': search + 'project = T2L AND PSP = ', 'URL_2': '&maxResults=1000', 'PSP': 'P3304', 'BASE_URL': url + '/browse/'},
+            'deploy': {'URL_1': search, 'URL_2': '&maxResults=1000', 'JQL': 'project = T2L AND issuetype = Deployment', 'BASE_URL': url + '/browse/'},
+            'release': {'URL_1': search + "fixVersion in ('", 'URL_2': "')&maxResults=1000",
+                        'RELEASE_VERSION': ['19.07.EU ', '19.08.EU '], 'SYSTEM': 'T24', 'DEPLOY_DATE': '20th of July'}}
+
+
+class Benchmark:
+    '''
+    Time grab_tickets, clean_json and generate_excel of each report against a JiraStub, for each number of issues.
+    One stub is started per size and every report runs against it. The excel files are written to a temporary folder.
+    Every measure is appended as one JSON line to output so that the runs can be compared over time.
+    Usage:
+    records = Benchmark(['jira_routine_V2'], sizes = (1000, 10000), latency = 0.02).run()
+    '''
+    def __init__(self, reports: list = None, sizes: tuple = SIZES, latency: float = 0.0, repeat: int = 1, engine: str = 'threads',
+                 max_workers: int = 10, processes: int = 1, output: str = OUTPUT, verbose: bool = False) -> None:
+        self.reports = list(reports or REPORTS)
+        self.sizes = tuple(sizes)
+        self.latency = latency
+        self.repeat = repeat
+        self.engine = engine
+        self.max_workers = max_workers
+        self.processes = processes
+        self.output = output
+        self.verbose = verbose
+        self.run_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    def extractor(self, report: str, url: str, folder: str) -> BaseExtractor:
+        ''' The extractor of the report, built like the batch runner builds it, with a dummy credentials module '''
+        module = importlib.import_module(report)
+        extractor = getattr(module, REPORTS[report])(name = module.NAME, verbose = False, cfg = SimpleNamespace(u = ''), parse_cli = False,
+                                                     yml = stub_yml(url, self.engine, self.max_workers, self.processes))
+        extractor.wdirectory = folder
+        return extractor
+
+    def time_report(self, report: str, stub: JiraStub, folder: str) -> list:
+        ''' One measure per stage of one run of the report '''
+        extractor = self.extractor(report, stub.url, folder)
+        measures = list()
+
+        def measure(stage: str, function, *args):
+            calls = sum(stub.requests.values())
+            start = timer()
+            result = function(*args)
+            measures.append({'stage': stage, 'seconds': round(timer() - start, 4), 'requests': sum(stub.requests.values()) - calls})
+            return result
+
+        ''' the BaseExtractor method is called directly, the Memorize cache of the reports would serve the previous run '''
+        json = measure('grab_tickets', BaseExtractor.grab_tickets, extractor, dict())
+        rows = len(json)
+        ''' clean_stage is what report() runs: remove_custom_fields, the linked tickets or the watchers and clean_json '''
+        cleaned = measure('clean_json', extractor.clean_stage, json)
+        ''' deployment_log_UAT also returns the date columns generate_excel needs '''
+        measure('generate_excel', extractor.generate_excel, *(cleaned if isinstance(cleaned, tuple) else (cleaned,)))
+        extractor.session.close()
+        for record in measures:
+            record['rows'] = rows
+        return measures
+
+    def run(self) -> list:
+        ''' Run every report at every size, return the records that were appended to output '''
+        records = list()
+        for size in self.sizes:
+            with JiraStub(issues = size, latency = self.latency) as stub, tempfile.TemporaryDirectory() as folder:
+                for report in self.reports:
+                    try:
+                        importlib.import_module(report)
+                    except ImportError as e:
+                        ''' a report whose dependencies are missing, the img package is only needed once the release email is built '''
+                        records.append(self.record(report, size, {'stage': None, 'skipped': str(e)}))
+                        if self.verbose is True:
+                            print(f"{report:>20} {size:>7}: skipped, {e}")
+                        continue
+                    for _ in range(self.repeat):
+                        for measure in self.time_report(report, stub, folder):
+                            records.append(self.record(report, size, measure))
+                    if self.verbose is True:
+                        print(self.summary(records, report, size))
+        self.save(records)
+        return records
+
+    def record(self, report: str, size: int, measure: dict) -> dict:
+        return {'run_at': self.run_at, 'report': report, 'issues': size, 'latency': self.latency, 'engine': self.engine,
+                'max_workers': self.max_workers, 'processes': self.processes, 'python': platform.python_version(), **measure}
+
+    @staticmethod
+    def summary(records: list, report: str, size: int) -> str:
+        ''' Median seconds of each stage of one report at one size '''
+        parts = list()
+        for stage in STAGES:
+            seconds = [record['seconds'] for record in records if record['report'] == report and record['issues'] == size and record['stage'] == stage]
+            if len(seconds) > 0:
+                parts.append(f"{stage} {statistics.median(seconds):8.3f}s")
+        return f"{report:>20} {size:>7}: " + '  '.join(parts)
+
+    def save(self, records: list) -> None:
+        if self.output is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.output)), exist_ok=True)
+        with open(self.output, 'a') as file:
+            for record in records:
+                file.write(json.dumps(record) + '\n')
+        if self.verbose is True:
+            print(f"{len(records)} measures appended to {self.output}")
+
+
+def generate_argparser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Time the stages of the reports against a local JIRA stub')
+    parser.add_argument('reports', nargs='*', help = f'reports to time, every report by default: {list(REPORTS)}')
+    parser.add_argument('-n', '--sizes', type = int, nargs='+', help = 'numbers of issues', default=list(SIZES))
+    parser.add_argument('-l', '--latency', type = float, help = 'seconds the stub adds to every answer', default=0.0)
+    parser.add_argument('-r', '--repeat', type = int, help = 'runs of each report at each size', default=1)
+    parser.add_argument('-e', '--engine', choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument('-w', '--workers', type = int, help = 'MAX_WORKERS of the extractors', default=10)
+    parser.add_argument('-p', '--processes', type = int, help = 'PROCESSES of the extractors', default=1)
+    parser.add_argument('-o', '--output', help = 'JSON lines file the measures are appended to', default=OUTPUT)
+    return parser
+
+def main() -> None:
+    args = generate_argparser().parse_args()
+    Benchmark(args.reports, sizes = args.sizes, latency = args.latency, repeat = args.repeat, engine = args.engine,
+              max_workers = args.workers, processes = args.processes, output = args.output, verbose = True).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+from __future__ import annotations
+import os, time
+from utils import lazy_import
+pd = lazy_import('pandas')
+
+
+class ColumnarStore:
+    '''
+    Parquet copy of the output of clean_json, one dataset per report and one partition per run date:
+    datasets/<report>/run_date=2019-07-20/<report>.parquet
+    Re-rendering an excel, diffing two runs or loading the history into pandas then reads only the needed columns,
+    memory-mapped, instead of running the extraction again or parsing the monthly .xlsx archives.
+    A second run on the same day replaces the partition of that day.
+    pyarrow is only imported when COLUMNAR is switched on in config.yml.
+    Usage:
+    store = ColumnarStore(folder, 'JIRA')
+    store.write(final_json)
+    store.read(columns=['Status'])
+    store.history(columns=['Status'])
+    '''
+    PARTITION = 'run_date'
+    FORMAT = '%Y-%m-%d'
+
+    def __init__(self, folder: str, name: str) -> None:
+        self.name = str(name)
+        self.folder = os.path.join(folder, self.name)
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import pyarrow
+        except ImportError:
+            return False
+        return True
+
+    def partition(self, run_date: str) -> str:
+        return os.path.join(self.folder, self.PARTITION + '=' + run_date, self.name + '.parquet')
+
+    def run_dates(self) -> list:
+        ''' Run dates with a partition on disk, oldest first '''
+        if not os.path.isdir(self.folder):
+            return list()
+        prefix = self.PARTITION + '='
+        return sorted(entry[len(prefix):] for entry in os.listdir(self.folder) if entry.startswith(prefix))
+
+    @staticmethod
+    def to_frame(dictionary: dict) -> pd.DataFrame:
+        ''' Issue key -> row, like the dataframe of generate_excel '''
+        df = pd.DataFrame.from_dict(dictionary, orient='index')
+        df.index.name = 'key'
+        ''' Arrow needs one type per column, values mixing types (None aside) are stored as text '''
+        for column in df.columns[df.dtypes == object]:
+            types = {type(value) for value in df[column] if value is not None and value == value}
+            if len(types) > 1:
+                df[column] = df[column].map(lambda value: value if value is None or value != value else str(value))
+        return df
+
+    def write(self, dictionary: dict, run_date: str = None) -> str:
+        ''' Write the partition of run_date (today by default) and return its path '''
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if run_date is None:
+            run_date = time.strftime(self.FORMAT)
+        path = self.partition(run_date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(self.to_frame(dictionary), preserve_index=True)
+        ''' write next to the partition and swap so that a reader never opens half a file '''
+        temp = path + '.tmp'
+        pq.write_table(table, temp, compression='snappy')
+        os.replace(temp, path)
+        return path
+
+    def read(self, columns: list = None, run_date: str = None) -> pd.DataFrame:
+        ''' Load one run, the latest by default. Only the requested columns are read from disk '''
+        import pyarrow.parquet as pq
+        if run_date is None:
+            dates = self.run_dates()
+            if len(dates) == 0:
+                raise FileNotFoundError(f"No columnar dataset for {self.name} in {self.folder}")
+            run_date = dates[-1]
+        table = pq.read_table(self.partition(run_date), columns=columns, memory_map=True, use_pandas_metadata=True)
+        return table.to_pandas()
+
+    def history(self, columns: list = None) -> pd.DataFrame:
+        ''' Load every run into a single dataframe with a run_date column '''
+        frames = list()
+        for run_date in self.run_dates():
+            df = self.read(columns, run_date)
+            df[self.PARTITION] = run_date
+            frames.append(df)
+        if len(frames) == 0:
+            return pd.DataFrame()
+        return pd.concat(frames, sort=False)
@@ -7,13 +7,12 @@ from functools import partial
 from grab_tickets_json import grab_tickets_json
 from contextlib import contextmanager
 from utils import Loader
+from decorator_base import Memorize
 from json.decoder import JSONDecodeError
 
 
-found_cache = partial(Loader.cache_exists,[(str('deployment_log_uat_grab_tickets_'+time.strftime("%Y%m%d")),".cache"),
-                                    (str('deployment_log_uat_clean_json_'+time.strftime("%Y%m%d")),".cache"),
-                                    (str('jira_routine_v2_grab_tickets_'+time.strftime("%Y%m%d")),".cache"),
-                                    (str('jira_routine_v2_clean_json_'+time.strftime("%Y%m%d")),".cache")])
+found_cache = partial(Memorize.cache_exists, ['deployment_log_uat_grab_tickets_', 'deployment_log_uat_clean_json_',
+                                               'jira_routine_v2_grab_tickets_', 'jira_routine_v2_clean_json_'])
 
 
 class BeforeProgramStartTests(unittest.TestCase, Loader):
@@ -309,6 +308,7 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
     4. limit variability in the tests
     @patch('base_class.requests')
     or with patch('base_class.requests') as mock_requests:
+    requests.get goes through the pooled session of the extractor: mock_requests.Session.return_value.get
     
     '''
 
@@ -324,41 +324,43 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
             response_mock.json.return_value = json_res
             
             # Set the side effect of requests.get()
-            mock_requests.get.side_effect = [Timeout, response_mock, response_mock]
+            mock_requests.Session.return_value.get.side_effect = [Timeout, response_mock, response_mock]
             instance = DeployExtractor(NAME, False)
+            # the mocked responses only implement .json()
+            instance.stream_decode = False
             if not found_cache():
                 with self.assertRaises(Timeout):
                     inst = instance.grab_tickets(dict())
                     assert isinstance(inst, dict)
                     assert inst == json_res
-                    mock_requests.get.assert_called_once()
+                    mock_requests.Session.return_value.get.assert_called_once()
                 assert instance.grab_tickets(dict())['T2L-422']['summary'] == 'Test Summary'
-                assert mock_requests.get.call_count == 3
+                assert mock_requests.Session.return_value.get.call_count == 2
 
     @unittest.skipIf(found_cache() is True, "No HTTP request as grab_tickets is cached")
     def test_call_count(self) -> None:
         with patch('base_class.requests') as mock_requests:
             from deployment_log_UAT import DeployExtractor, NAME
-            DeployExtractor(NAME, False).grab_tickets(dict())
-            assert mock_requests.get.call_count == 2
+            instance = DeployExtractor(NAME, False)
+            instance.stream_decode = False
+            instance.grab_tickets(dict())
+            assert mock_requests.Session.return_value.get.call_count == 1
 
     @unittest.skipIf(found_cache() is True, "No HTTP request as grab_tickets is cached")
     def test_clean_json_patch_ConnectionError(self) -> None:
-        with patch('jira_routine_V2.requests') as mock_requests:
+        with patch('base_class.requests') as mock_requests:
             from jira_routine_V2 import LogExtractor, NAME
 
             dic = dict()
             dic['T2L-249'] = grab_tickets_json['T2L-249']
-            mock_requests.get.side_effect = [ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError]
+            mock_requests.Session.return_value.get.side_effect = [ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError]
             with self.assertRaises(ConnectionError):
                 LogExtractor(NAME, False).clean_json(dic)
-            configuration = Loader.grab_configuration(self)
-            creds = f"Basic {configuration.u}"
-            mock_requests.assert_has_calls([call.get(self.TEST_call_1, headers={'Authorization': creds, 'Content-Type': 'application/json'}, verify=False)])
+            mock_requests.Session.return_value.get.assert_has_calls([call(self.TEST_call_1, timeout=(5, 60), stream=False)])
             
     @unittest.skipIf(found_cache() is True, "No HTTP request as grab_tickets is cached")
     def test_clean_json_patch_JSONDecodeError(self) -> None:
-        with patch('jira_routine_V2.requests') as mock_requests:
+        with patch('base_class.requests') as mock_requests:
             from jira_routine_V2 import LogExtractor, NAME
 
             dic = dict()
@@ -367,8 +369,8 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
             response_mock = Mock()
             response_mock.json.return_value = {'total':1, 'issues': [{"key":'T2L-422',"fields":{'summary': 'Test Summary', 'customfield_13191': None}}]}
             
-            mock_requests.get.side_effect = [response_mock, response_mock, response_mock, response_mock, response_mock, response_mock]
-            mock_requests.get.json.side_effect = [JSONDecodeError, JSONDecodeError, JSONDecodeError, JSONDecodeError, JSONDecodeError, JSONDecodeError]
+            mock_requests.Session.return_value.get.side_effect = [response_mock, response_mock, response_mock, response_mock, response_mock, response_mock]
+            mock_requests.Session.return_value.get.json.side_effect = [JSONDecodeError, JSONDecodeError, JSONDecodeError, JSONDecodeError, JSONDecodeError, JSONDecodeError]
             
             with self.assertRaises(KeyError):
                 LogExtractor(NAME, False).clean_json(dic)
@@ -382,16 +384,14 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
             dic = dict()
             dic['T2L-249'] = grab_tickets_json['T2L-249']
             
-            mock_requests.get.side_effect = [ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError]
+            mock_requests.Session.return_value.get.side_effect = [ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError]
             with self.assertRaises(ConnectionError): # testing 2 linked tickets so the asynchronous call is triggered
                 TestExtractor(NAME, False).clean_json(dic)
             with self.assertRaises(ConnectionError): # testing 2 linked tickets so the asynchronous call is triggered
                 DeployExtractor(NAME, False).clean_json(dic)
             with self.assertRaises(ConnectionError): # testing 2 linked tickets so the asynchronous call is triggered
                 BarrosExtractor(NAME, False).clean_json(dic)
-            configuration = Loader.grab_configuration(self)
-            creds = f"Basic {configuration.u}"
-            mock_requests.assert_has_calls([call.get(self.TEST_call_2, headers={'Authorization': creds, 'Content-Type': 'application/json'}, verify=False)])
+            mock_requests.Session.return_value.get.assert_has_calls([call(self.TEST_call_2, timeout=(5, 60), stream=False)])
 
     @unittest.skipIf(found_cache() is True, "No HTTP request as grab_tickets is cached")
     def test_clean_json_linkedIssues_JSONDecodeError_real_data(self) -> None:
@@ -405,7 +405,7 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
             response_mock = Mock()
             response_mock.json.return_value = JSONDecodeError
             
-            mock_requests.get.side_effect = [response_mock, response_mock, response_mock, response_mock, response_mock, response_mock]
+            mock_requests.Session.return_value.get.side_effect = [response_mock, response_mock, response_mock, response_mock, response_mock, response_mock]
             with self.assertRaises(TypeError): # testing 2 linked tickets so the asynchronous call is triggered
                 print(TestExtractor(NAME, False).clean_json(dic))
             with self.assertRaises(TypeError): # testing 2 linked tickets so the asynchronous call is triggered
@@ -437,7 +437,7 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
     
     @unittest.skipIf(found_cache() is True, "No HTTP request as grab_tickets is cached")
     def test_clean_json_linkedIssues_ConnectionError_2links(self) -> None:
-        with patch('base_class.BaseExtractor.grab_linked_tickets') as mock_grab_linked_tickets:
+        with patch('base_class.BaseExtractor.resolve_linked_issues') as mock_resolve_linked_issues:
             from test_extraction_V2 import TestExtractor, NAME
             from deployment_log_UAT import DeployExtractor
             from barros_request import BarrosExtractor
@@ -446,7 +446,7 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
             dic['T2L-249'] = {'issuelinks': [{'id': '419070', 'self': 'https://jira.com/rest/api/2/issueLink/419070', 'type': {'id': '10031', 'name': 'Cause', 'inward': 'is caused by', 'outward': 'causes', 'self': 'https://jira.com/rest/api/2/issueLinkType/10031'}, 'outwardIssue': {'id': '430893', 'key': 'CM-31975', 'self': 'https://jira.com/rest/api/2/issue/430893', 'fields': {'summary': 'T24 TEMOS MCO changes', 'status': {'self': 'https://jira.com/rest/api/2/status/6', 'description': 'The issue is considered finished, the resolution is correct. Issues which are closed can be reopened.', 'iconUrl': 'https://jira.com/images/icons/statuses/closed.png', 'name': 'Closed', 'id': '6', 'statusCategory': {'self': 'https://jira.com/rest/api/2/statuscategory/3', 'id': 3, 'key': 'done', 'colorName': 'green', 'name': 'Done'}}, 'issuetype': {'self': 'https://jira.com/rest/api/2/issuetype/21', 'id': '21', 'description': 'Request for a Normal Change', 'iconUrl': 'https://jira.com/secure/viewavatar?size=xsmall&avatarId=18724&avatarType=issuetype', 'name': 'Normal Change', 'subtask': False, 'avatarId': 18724}}}}, {'id': '418945', 'self': 'https://jira.com/rest/api/2/issueLink/418945', 'type': {'id': '10031', 'name': 'Cause', 'inward': 'is caused by', 'outward': 'causes', 'self': 'https://jira.com/rest/api/2/issueLinkType/10031'}, 'inwardIssue': {'id': '433704', 'key': 'EUHT-7091', 'self': 'https://jira.com/rest/api/2/issue/433704', 'fields': {'summary': 'T24 - Interface - Temos : Negative MD amounts for Guarantees', 'status': {'self': 'https://jira.com/rest/api/2/status/6', 'description': 'The issue is considered finished, the resolution is correct. Issues which are closed can be reopened.', 'iconUrl': 'https://jira.com/images/icons/statuses/closed.png', 'name': 'Closed', 'id': '6', 'statusCategory': {'self': 'https://jira.com/rest/api/2/statuscategory/3', 'id': 3, 'key': 'done', 'colorName': 'green', 'name': 'Done'}}, 'priority': {'self': 'https://jira.com/rest/api/2/priority/3', 'iconUrl': 'https://jira.com/images/icons/priorities/major.svg', 'name': 'Major', 'id': '3'}, 'issuetype': {'self': 'https://jira.com/rest/api/2/issuetype/1', 'id': '1', 'description': 'A problem which impairs or prevents the functions of the product.', 'iconUrl': 'https://jira.com/secure/viewavatar?size=xsmall&avatarId=15923&avatarType=issuetype', 'name': 'Bug', 'subtask': False, 'avatarId': 15923}}}}]}
             # Create a new Mock to imitate a Response
             
-            mock_grab_linked_tickets.side_effect = [ConnectionError, ConnectionError, ConnectionError, ConnectionError]
+            mock_resolve_linked_issues.side_effect = [ConnectionError, ConnectionError, ConnectionError, ConnectionError]
             with self.assertRaises(ConnectionError): # testing 2 linked tickets so the asynchronous call is triggered
                 TestExtractor(NAME, False).clean_json(dic) 
             with self.assertRaises(ConnectionError): # testing 2 linked tickets so the asynchronous call is triggered
@@ -456,11 +456,11 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
 
     @unittest.skipIf(found_cache() is True, "No HTTP request as grab_tickets is cached")
     def test_clean_json_watchers_ConnectionError(self) -> None:
-        with patch('jira_routine_V2.requests') as mock_requests:
+        with patch('base_class.requests') as mock_requests:
             from jira_routine_V2 import LogExtractor, NAME
             dic = dict()
             dic['T2L-249'] = grab_tickets_json['T2L-249']
-            mock_requests.get.side_effect = [ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError]
+            mock_requests.Session.return_value.get.side_effect = [ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError]
             with self.assertRaises(ConnectionError): # testing 2 linked tickets so the asynchronous call is triggered
                 LogExtractor(NAME, False).clean_json(dic)
                 
@@ -470,7 +470,7 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
             
             # Create a new Mock to imitate a Response
             response_mock = Mock()
-            response_mock.json.return_value = {'fields': {'issuetype': {'name': 'Bug'}, 'summary': 'Yellow Bug'}}
+            response_mock.json.return_value = {'total': 1, 'issues': [{'key': 'T2L-250', 'fields': {'issuetype': {'name': 'Bug'}, 'summary': 'Yellow Bug'}}]}
             mock_consult_url.side_effect = [response_mock, response_mock, response_mock, response_mock]
             
             from test_extraction_V2 import TestExtractor, NAME
@@ -483,11 +483,11 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
 
     @unittest.skipIf(found_cache() is True, "No HTTP request as grab_tickets is cached")
     def test_clean_json_linked_tickets_TestExtractor(self) -> None:
-        with patch('base_class.BaseExtractor.grab_linked_tickets') as mock_grab_linked_tickets:
+        with patch('base_class.BaseExtractor.resolve_linked_issues') as mock_resolve_linked_issues:
             
             # Create a new Mock to imitate a Response
             response_mock = {'T2L-250': {'issuetype': {'name': 'Bug'}, 'summary': 'Yellow Bug'}, 'T2L-251': {'issuetype': {'name': 'Bug'}, 'summary': 'Blue Bug'}}
-            mock_grab_linked_tickets.side_effect = [response_mock, response_mock, response_mock, response_mock]
+            mock_resolve_linked_issues.side_effect = [response_mock, response_mock, response_mock, response_mock]
             
             from test_extraction_V2 import TestExtractor, NAME
             _json = {'T2L-249': {'Reporter': 'Tester', 'issuetype': {'name': 'Test'}, 'issuelinks': [{'inwardIssue': {'key': 'T2L-250'}}, {'outwardIssue': {'key': 'T2L-251'}}]}}
@@ -505,7 +505,7 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
             
             # Create a new Mock to imitate a Response
             response_mock = Mock()
-            response_mock.json.return_value = {'fields': {'issuetype': {'name': 'Bug'}, 'summary': 'Red Bug'}}
+            response_mock.json.return_value = {'total': 1, 'issues': [{'key': 'EUHT-1', 'fields': {'issuetype': {'name': 'Bug'}, 'summary': 'Red Bug'}}]}
             mock_consult_url.side_effect = [response_mock, response_mock, response_mock, response_mock]
             
             from test_extraction_V2 import TestExtractor, NAME
@@ -517,13 +517,13 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
             assert _json['T2L-249']['Bug_1_url'] == 'http://EUHT-1'
 
     @patch('jira_routine_V2.logging')
-    @patch('jira_routine_V2.requests')
+    @patch('base_class.requests')
     def test_clean_json_watchers_ConnectionError_logger(self, mock_requests, mock_log) -> None:
         from jira_routine_V2 import LogExtractor, NAME
         dic = dict()
         dic['T2L-249'] = grab_tickets_json['T2L-249']
 
-        mock_requests.get.side_effect = [ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError]
+        mock_requests.Session.return_value.get.side_effect = [ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError, ConnectionError]
         with self.assertRaises(ConnectionError):
             try:
                 logger = mock_log.error("BB")
@@ -536,6 +536,548 @@ class BeforeProgramStartTests(unittest.TestCase, Loader):
                 mock_log.error.assert_called_with("BB")
                 print(mock_log.mock_calls)
 
+class OfflineTests(unittest.TestCase):
+    ''' Tests that run without JIRA nor credentials '''
+
+    def test_issue_stream(self) -> None:
+        import io, json
+        from streaming import IssueStream
+        body = {'startAt': 0, 'maxResults': 1000, 'total': 2, 'issues': [{'key': 'T2L-1', 'fields': {'summary': 'A', 'votes': {'votes': 1}}}, {'key': 'T2L-2', 'fields': {'summary': None}}]}
+        response_mock = Mock()
+        response_mock.raw = io.BytesIO(json.dumps(body).encode())
+        issues = IssueStream(response_mock)
+        assert list(issues) == body['issues']
+        assert issues.total == 2
+
+    def test_resolve_linked_issues_fetches_each_key_once(self) -> None:
+        from base_class import BaseExtractor
+        inst = BaseExtractor.__new__(BaseExtractor)
+        inst.yml, inst.verbose, inst.shared_issues = {'jira': {'SEARCH': 'http://jira/search?jql='}}, False, dict()
+        dic = {'T2L-1': {'issuelinks': [{'inwardIssue': {'key': 'CM-1'}}, {'outwardIssue': {'key': 'CM-2'}}]},
+               'T2L-2': {'issuelinks': [{'outwardIssue': {'key': 'CM-1'}}]}}
+        payload = {'total': 2, 'issues': [{'key': 'CM-1', 'fields': {'summary': 'a'}}, {'key': 'CM-2', 'fields': {'summary': 'b'}}]}
+        with patch.object(BaseExtractor, 'fetch_json', return_value=[payload]) as mock_fetch_json:
+            linked = inst.resolve_linked_issues(dic)
+        urls = mock_fetch_json.call_args[0][0]
+        assert len(urls) == 1
+        assert 'CM-1%2CCM-2' in urls[0]
+        assert linked == {'CM-1': {'summary': 'a'}, 'CM-2': {'summary': 'b'}}
+
+    def test_issue_store_merges_and_moves_the_watermark(self) -> None:
+        import tempfile
+        from incremental import IssueStore
+        with tempfile.TemporaryDirectory() as folder:
+            store = IssueStore(folder, 'JIRA', overlap=0).load().bind('jql=project = T2L&fields=summary')
+            assert store.watermark is None
+            store.merge({'T2L-1': {'summary': 'A'}, 'T2L-2': {'summary': 'B'}})
+            store.save(time.mktime((2019, 7, 20, 6, 55, 0, 0, 0, -1)))
+            store = IssueStore(folder, 'JIRA', overlap=0).load().bind('jql=project = T2L&fields=summary')
+            assert store.watermark == '2019/07/20 06:55'
+            assert store.merge({'T2L-2': {'summary': 'C'}}) == {'T2L-1': {'summary': 'A'}, 'T2L-2': {'summary': 'C'}}
+            ''' another projection, the store starts over '''
+            store = IssueStore(folder, 'JIRA', overlap=0).load().bind('jql=project = T2L&fields=summary,status')
+            assert store.watermark is None and store.issues == {}
+
+    def test_incremental_search_urls_close_the_jql_before_the_watermark(self) -> None:
+        from incremental import IssueStore
+        from benchmark import stub_yml
+        from test_extraction_V2 import TestExtractor
+        from release_notes import ReleaseNoteExtractor
+        yml = stub_yml('http://jira')
+        yml['jira']['INCREMENTAL'] = True
+        yml['test'].update({'URL_1': 'http://jira/search?jql=project = T2L AND PSP in (', 'URL_2': ')&maxResults=1000'})
+        yml['release'].update({'URL_1': "http://jira/search?jql=fixVersion in ('", 'URL_2': "')&maxResults=1000"})
+
+        def load(store):
+            store.watermark = '2019/07/20 06:55'
+            return store
+
+        with patch.object(IssueStore, 'load', load), patch.object(IssueStore, 'bind'):
+            test = TestExtractor(name = 'Test', cfg = Mock(), yml = yml, parse_cli = False)
+            release = ReleaseNoteExtractor(name = 'Release', cfg = Mock(), yml = yml, parse_cli = False)
+        assert test.URL == 'http://jira/search?jql=(project = T2L AND PSP in (P3304)) AND updated >= "2019/07/20 06:55"&maxResults=1000'
+        assert release.URL == ("http://jira/search?jql=(fixVersion in ('19.07.EU ', '19.08.EU ')) AND updated >= \"2019/07/20 06:55\""
+                               "&maxResults=1000")
+        test.store = None
+        assert test.search_url(yml['test']['URL_1'], 'P3304', yml['test']['URL_2']) == 'http://jira/search?jql=project = T2L AND PSP in (P3304)&maxResults=1000'
+
+    def test_standalone_release_notes_merge_the_store_behind_the_watermark(self) -> None:
+        import tempfile
+        import release_notes
+        from incremental import IssueStore
+        from benchmark import stub_yml
+        from jira_stub import JiraStub
+        from decorator_base import Memorize
+        with JiraStub(issues = 5) as stub, tempfile.TemporaryDirectory() as folder:
+            yml = stub_yml(stub.url)
+            yml['jira']['INCREMENTAL'] = True
+            load = IssueStore.load
+
+            def load_from_folder(store):
+                store.folder, store.path = folder, os.path.join(folder, 'release.store')
+                return load(store)
+
+            with patch.object(IssueStore, 'load', load_from_folder), patch.object(Memorize, 'FOLDER', folder):
+                first = release_notes.ReleaseNoteExtractor(name = release_notes.NAME, cfg = Mock(), yml = yml, parse_cli = False)
+                first.store.merge({'T2L-99': {'summary': 'Released before the watermark'}})
+                first.store.save(time.time())
+                extractor = release_notes.ReleaseNoteExtractor(name = release_notes.NAME, cfg = Mock(), yml = yml, parse_cli = False)
+                assert 'updated >=' in extractor.search
+                extractor.wdirectory, extractor.metrics.folder = folder, None
+                with patch.object(release_notes, 'ReleaseNoteExtractor', return_value = extractor), patch.object(extractor, 'report') as report:
+                    release_notes.main(release_notes.NAME)
+                extractor.session.close()
+        json = report.call_args[0][0]
+        assert 'T2L-99' in json and all(f'T2L-{number}' in json for number in range(1, 6))
+
+    def test_memorize_keys_on_the_jql_and_evicts(self) -> None:
+        import tempfile
+        from decorator_base import Memorize
+        calls = list()
+        with tempfile.TemporaryDirectory() as folder, patch.object(Memorize, 'FOLDER', folder):
+            @Memorize(file_name = 'report.py', func_name = 'grab_tickets', max_size = 0)
+            def grab_tickets(instance, dictionary):
+                calls.append(instance.search)
+                return {'T2L-1': instance.search}
+            first, second = Mock(search = 'jql=A'), Mock(search = 'jql=B')
+            assert grab_tickets(first, dict()) == {'T2L-1': 'jql=A'}
+            assert grab_tickets(second, dict()) == {'T2L-1': 'jql=B'}
+            assert calls == ['jql=A', 'jql=B']
+            ''' max_size 0 evicts every entry right after it is written '''
+            assert Memorize.cache_exists(['report_grab_tickets_']) is False
+
+    def test_memorize_evicts_orphaned_temporary_files_and_tolerates_concurrent_evictions(self) -> None:
+        import tempfile
+        from decorator_base import Memorize
+        with tempfile.TemporaryDirectory() as folder, patch.object(Memorize, 'FOLDER', folder):
+            orphan, running = os.path.join(folder, 'orphan.tmp'), os.path.join(folder, 'running.tmp')
+            for path in (orphan, running, os.path.join(folder, 'report_grab_tickets_1.cache')):
+                with open(path, 'wb') as f:
+                    f.write(b'0')
+            os.utime(orphan, (time.time() - 2 * Memorize.TEMP_TTL, time.time() - 2 * Memorize.TEMP_TTL))
+            remove = os.remove
+            def evicted_by_another_process(path):
+                remove(path)
+                raise FileNotFoundError(path)
+            with patch('decorator_base.os.remove', side_effect = evicted_by_another_process):
+                Memorize(max_size = 0).evict()
+            assert sorted(os.listdir(folder)) == ['running.tmp']
+
+    def test_columnar_store_reads_back_the_requested_columns(self) -> None:
+        import tempfile
+        from columnar import ColumnarStore
+        if ColumnarStore.available() is False:
+            self.skipTest('pyarrow is not installed')
+        with tempfile.TemporaryDirectory() as folder:
+            store = ColumnarStore(folder, 'JIRA')
+            store.write({'T2L-1': {'Status': 'Open', 'Duration': 1}, 'T2L-2': {'Status': 'Done', 'Duration': '2h'}}, '2019-07-19')
+            store.write({'T2L-1': {'Status': 'Done', 'Duration': 1}}, '2019-07-20')
+            assert store.run_dates() == ['2019-07-19', '2019-07-20']
+            latest = store.read(columns=['Status'])
+            assert list(latest.columns) == ['Status'] and latest.loc['T2L-1', 'Status'] == 'Done'
+            assert len(store.history(columns=['Status'])) == 3
+
+    def test_report_writer_streams_the_dictionary_with_a_csv_sidecar(self) -> None:
+        import tempfile, csv
+        from report_writer import ReportWriter
+        _json = {'T2L-1': {'Status': 'Open', 'Watchers': ['jose.barros@.com']}, 'T2L-2': {'Status': 'Done', 'Duration': 2}}
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'JIRA', 'JIRA_1.xlsx')
+            with ReportWriter(path, sidecar = 'csv') as writer:
+                assert writer.write_sheet('LEO and MISC', _json, numbers = ['Duration']) == 2
+            assert os.path.isfile(path) is True
+            with open(os.path.join(folder, 'JIRA', 'JIRA_1_LEO_and_MISC.csv'), newline='') as f:
+                rows = list(csv.reader(f))
+            assert rows[0] == ['', 'Status', 'Watchers', 'Duration']
+            assert rows[2] == ['T2L-2', 'Done', '', '2']
+
+    def test_report_writer_picks_the_writer_of_a_column_once(self) -> None:
+        import tempfile
+        import pandas as pd
+        import report_writer
+        _json = {'T2L-1': {'Status': 'Open', 'Duration': None}, 'T2L-2': {'Status': 'Done', 'Duration': 2},
+                 'T2L-3': {'Status': 'Done', 'Duration': '2h'}}
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'JIRA_1.xlsx')
+            with patch('report_writer._value_writer', wraps = report_writer._value_writer) as picked:
+                with report_writer.ReportWriter(path) as writer:
+                    writer.write_sheet('LEO and MISC', _json)
+            assert [c.args[0] for c in picked.call_args_list] == ['Open', 2]
+            df = pd.read_excel(path, index_col = 0)
+            assert list(df['Duration'].iloc[1:]) == [2, '2h'] and list(df['Status']) == ['Open', 'Done', 'Done']
+
+    def test_normalize_timestamps_converts_the_column_and_reports_unparsed_rows(self) -> None:
+        import pandas as pd
+        from timestamps import normalize_timestamps, unparsed
+        values = pd.Series(['2017-11-17T16:18:14.000+0000', '2017-11-17', None, 'Missing link'], index=['T2L-1', 'T2L-2', 'T2L-3', 'T2L-4'])
+        parsed = normalize_timestamps(values, 'Europe/Luxembourg')
+        assert parsed['T2L-1'] == pd.Timestamp('2017-11-17 17:18:14')
+        assert parsed['T2L-2'] == pd.Timestamp('2017-11-17')
+        assert list(unparsed(values, parsed)) == ['T2L-4']
+
+    def test_generate_excel_writes_the_parsed_dates_without_touching_the_rows(self) -> None:
+        import copy, tempfile
+        from benchmark import Benchmark
+        with tempfile.TemporaryDirectory() as folder:
+            extractor = Benchmark().extractor('jira_routine_V2', 'http://jira', folder)
+            _json = {'T2L-1': {'Summary': 'A', 'created': '2017-11-17T16:18:14.000+0000', 'updated': '2017-11-17'},
+                     'T2L-2': {'Summary': 'B', 'created': None}}
+            before = copy.deepcopy(_json)
+            extractor.generate_excel(_json)
+            assert _json == before
+            assert len(os.listdir(os.path.join(folder, extractor.name))) == 1
+
+    def test_normalize_dates_keeps_the_text_of_the_values_it_cannot_parse(self) -> None:
+        import tempfile
+        import pandas as pd
+        from benchmark import Benchmark
+        with tempfile.TemporaryDirectory() as folder:
+            extractor = Benchmark().extractor('jira_routine_V2', 'http://jira', folder)
+            df = pd.DataFrame({'created': ['2017-11-17T16:18:14.000+0000', 'Missing link', None]}, index=['T2L-1', 'T2L-2', 'T2L-3'])
+            df = extractor.normalize_dates(df, ['created'])
+            assert df.loc['T2L-1', 'created'] == pd.Timestamp('2017-11-17 17:18:14')
+            assert df.loc['T2L-2', 'created'] == 'Missing link' and pd.isnull(df.loc['T2L-3', 'created'])
+            extractor.generate_excel({'T2L-1': {'Summary': 'A', 'created': 'Missing link'}})
+            path = os.path.join(folder, extractor.name, os.listdir(os.path.join(folder, extractor.name))[0])
+            assert pd.read_excel(path, index_col = 0).loc['T2L-1', 'created'] == 'Missing link'
+
+    def test_identify_missing_links_walks_the_deployment_chain(self) -> None:
+        import pandas as pd
+        from deployment_log_UAT import DeployExtractor
+        instance = Mock(chain = list(DeployExtractor.CHAIN))
+        instance.rules = DeployExtractor.missing_link_rules(instance.chain, list())
+        envs = ['EU TEST Deployment Date', 'EU UAT Deployment Date', 'PRD Deployment Date']
+        df = pd.DataFrame([[None, 1, None], [None, None, 1], [1, None, 1], [None, None, None]], index=['T2L-1', 'T2L-2', 'T2L-3', 'T2L-4'], columns=envs)
+        df = DeployExtractor.identify_missing_links(instance, df, envs)
+        assert list(df.loc['T2L-1', envs[:2]]) == ['Missing link to the UAT deployment ticket', 1]
+        assert list(df.loc['T2L-2', envs[:2]]) == ['Missing link to the UAT deployment ticket', 'Missing link to the PRD deployment ticket']
+        assert list(df.loc['T2L-3', envs[:2]]) == [1, 'Missing link to the PRD deployment ticket']
+        assert df.loc['T2L-4'].isnull().all()
+
+    def test_field_mapping_compiles_paths_and_matches_the_vectorized_path(self) -> None:
+        from field_mapping import FieldMapping, Field
+        mapping = FieldMapping([Field('Assignee', 'assignee.displayName', True),
+                                Field('PSP', 'customfield_12706[0]', True),
+                                Field('Test step', 'customfield_17284.steps[0].step', True),
+                                Field('Summary', 'summary'),
+                                Field('Labels', 'labels', True, ','.join)])
+        _json = {'T2L-1': {'assignee': {'displayName': 'Tester'}, 'customfield_12706': ['P3304'], 'customfield_17284': {'steps': [{'step': 'derp'}]}, 'summary': 'A', 'labels': ['EU', 'LU']},
+                 'T2L-2': {'assignee': None, 'customfield_12706': [], 'summary': 'B', 'labels': []}}
+        rows = mapping.apply_all(_json)
+        assert rows == {'T2L-1': {'Assignee': 'Tester', 'PSP': 'P3304', 'Test step': 'derp', 'Summary': 'A', 'Labels': 'EU,LU'},
+                        'T2L-2': {'Summary': 'B'}}
+        assert mapping.apply_all(_json, vectorized = True) == rows
+
+    def test_vectorized_mapping_returns_the_rows_of_apply(self) -> None:
+        import requests
+        from field_mapping import FieldMapping, Field
+        from jira_stub import JiraStub
+        import jira_routine_V2, deployment_log_UAT, test_extraction_V2
+        mapping = FieldMapping([Field('Estimate', 'timeestimate'),
+                                Field('Votes', 'votes.votes', False, lambda value: -1 if value is None else value + 1),
+                                Field('Watched', 'watches', False, str),
+                                Field('First label', 'labels[0]', False, str)])
+        _json = {'T2L-1': {'timeestimate': 3600, 'votes': {'votes': 2}, 'watches': {'watchCount': 1}, 'labels': ['EU']},
+                 'T2L-2': {'timeestimate': None, 'votes': {'votes': None}, 'watches': {'watchCount': 0}, 'labels': []}}
+        rows = mapping.apply_all(_json)
+        assert rows['T2L-1'] == {'Estimate': 3600, 'Votes': 3, 'Watched': "{'watchCount': 1}", 'First label': 'EU'}
+        assert rows['T2L-2'] == {'Estimate': None, 'Votes': -1, 'Watched': "{'watchCount': 0}", 'First label': None}
+        assert mapping.apply_all(_json, vectorized = True) == rows
+        assert type(mapping.apply_all(_json, vectorized = True)['T2L-1']['Estimate']) is int
+        with JiraStub(issues = 50, watched = 0.5) as stub:
+            issues = {issue['key']: issue['fields'] for issue in requests.get(stub.url + '/rest/api/2/search?jql=project = T2L').json()['issues']}
+        for module in (jira_routine_V2, deployment_log_UAT, test_extraction_V2):
+            for extractor in [value for value in vars(module).values() if isinstance(value, type) and len(getattr(value, 'MAPPING', ())) > 0]:
+                mapping = FieldMapping(extractor.MAPPING)
+                assert mapping.apply_all(issues, vectorized = True) == mapping.apply_all(issues)
+
+    def test_safe_path_resolves_missing_paths_without_touching_the_fields(self) -> None:
+        from utils import SafePath
+        _json = {'fixVersions': [{'name': '19.07.EU '}], 'assignee': None}
+        fields = SafePath(_json)
+        assert fields.get('fixVersions', 0, 'name') == '19.07.EU '
+        assert fields.get('assignee', 'displayName') is None
+        assert fields.get('fixVersions', 3, 'name') is None
+        assert fields.get('customfield_14791', 'value', default = 'n/a') == 'n/a'
+        assert _json == {'fixVersions': [{'name': '19.07.EU '}], 'assignee': None}
+
+    def test_strip_markup_matches_the_historical_regex(self) -> None:
+        import re
+        from markup import strip_markup, strip_markup_all
+        legacy = re.compile(r'\{[^(aeiu)]*\}')
+        for text in ['no markup', '{code}x = 1{code} done', '{color:#ff0000}red{color}', '{a}', '{}}{', '}{{x}', '{' * 5000, '{' * 5000 + '}']:
+            assert strip_markup(text) == legacy.sub('', text)
+        assert strip_markup_all(['{color:#ff0000}red{color}', None, 12]) == ['red', None, '12']
+
+    def test_release_email_streams_one_row_per_issue_with_its_icon(self) -> None:
+        import tempfile, types
+        from datetime import datetime
+        from email_template import ReleaseEmail, FRAGMENTS, ICONS, DEFAULT_ICON
+        resources = types.SimpleNamespace(**{name: f'<{name}>' for name in FRAGMENTS + tuple(ICONS.values()) + (DEFAULT_ICON,)})
+        rows = {'T2L-1': {'Issue Type': 'Bug', 'Summary': 'A'}, 'T2L-2': {'Issue Type': 'Sub-task', 'Summary': 'B {{ x }}'}}
+        with tempfile.TemporaryDirectory() as folder:
+            path = ReleaseEmail(resources, 'T24', '20th of July').render(os.path.join(folder, 'email.html'), '19.07.EU ', rows, ['a', 'b'], datetime(2019, 7, 20))
+            with open(path) as file:
+                html = file.read()
+        assert html.startswith('<HEAD>20.07.2019<SUB_HEAD>T24 Release July 2019 19.07.EU <SUB_HEAD_2>SUBJECT: T24 Freeze notification')
+        assert '<OBJ_1_BUG>https://jira.com/browse/T2L-1<OBJ_2>T2L-1<OBJ_3>A<OBJ_4>a<OBJ_5>' in html
+        assert '<OBJ_1>https://jira.com/browse/T2L-2<OBJ_2>T2L-2<OBJ_3>B {{ x }}<OBJ_4>b<OBJ_5><TABLE_2>' in html
+        assert 'The 2 tickets' in html
+
+    def test_batch_runner_fetches_each_search_and_each_issue_once(self) -> None:
+        from batch_runner import BatchRunner
+        def extractor(url, fields, found):
+            return Mock(URL = url, fields = fields, expand = (), LINK_BATCH_SIZE = 100, PAGE_SIZE = 1000, **{'grab_tickets.return_value': found})
+        log = extractor('project = T2L', ('summary',), {'T2L-1': {'summary': 'A', 'status': 'Open'}, 'T2L-2': {'summary': 'B', 'status': 'Done'}})
+        release = extractor('project = T2L', ('status',), None)
+        deploy = extractor('project = DPL', ('status',), {'T2L-2': {'updated': '2019'}, 'DPL-1': {'updated': '2019'}})
+        deploy.fetch_keys.return_value = {'DPL-1': {'summary': 'C', 'status': 'Open'}}
+        runner = BatchRunner.__new__(BatchRunner)
+        runner.extractors, runner.issues, runner.verbose = [log, release, deploy], dict(), False
+        matched = runner.fetch()
+        log.widen_projection.assert_called_once_with(('summary', 'status'), ())
+        release.grab_tickets.assert_not_called()
+        deploy.widen_projection.assert_called_once_with(BatchRunner.KEYS_ONLY, ())
+        deploy.fetch_keys.assert_called_once_with(['DPL-1'], ('summary', 'status'), ())
+        assert matched == {log: ['T2L-1', 'T2L-2'], release: ['T2L-1', 'T2L-2'], deploy: ['T2L-2', 'DPL-1']}
+        assert runner.issues_of(release, matched[release]) == {'T2L-1': {'status': 'Open'}, 'T2L-2': {'status': 'Done'}}
+        assert runner.issues_of(deploy, matched[deploy]) == {'T2L-2': {'status': 'Done'}, 'DPL-1': {'status': 'Open'}}
+
+    def test_clean_stage_shards_over_processes_like_the_main_process(self) -> None:
+        import pickle
+        from jira_routine_V2 import LogExtractor
+        from field_mapping import FieldMapping
+        from metrics import RunMetrics
+        inst = LogExtractor.__new__(LogExtractor)
+        inst.__dict__.update(mapping = FieldMapping(LogExtractor.MAPPING), vectorized_mapping = False, verbose = False, extra_fields = [], engine = 'threads',
+                             max_workers = 2, watchers_cache = dict(), session = Mock(), cfg = Mock(), store = None, columnar = None, shared_issues = dict(),
+                             metrics = RunMetrics('JIRA'))
+        assert pickle.loads(pickle.dumps(inst)).session is None
+        _json = {f'T2L-{i}': {'summary': str(i), 'customfield_12706': ['P3304'], 'customfield_17284': 'dropped', 'watches': {'watchCount': 0}} for i in range(10)}
+        inst.processes, inst.SHARD_MIN_ISSUES = 1, 0
+        expected = inst.clean_stage(_json)
+        assert (expected['T2L-0']['PSP'], expected['T2L-0']['summary']) == ('P3304', '0')
+        inst.processes = 3
+        sharded = inst.clean_stage(_json)
+        assert sharded == expected
+        assert list(sharded) == list(_json)
+
+    def test_async_fetcher_holds_the_endpoint_slots_of_the_scheduler(self) -> None:
+        from async_engine import AsyncFetcher
+        from scheduler import RequestScheduler
+        from jira_stub import JiraStub
+        scheduler = RequestScheduler(rate = 1e6, burst = 1000, endpoint_concurrency = 3)
+        with JiraStub(issues = 20, latency = 0.05) as stub:
+            urls = [stub.url + f'/rest/api/2/issue/T2L-{number}/watchers' for number in range(1, 13)]
+            payloads = AsyncFetcher(dict(), concurrency = 12, scheduler = scheduler, endpoint_concurrency = 3).fetch(urls)
+            ''' without an endpoint limit of its own the loop keeps its whole concurrency on one endpoint '''
+            unbounded = RequestScheduler(rate = 1e6, burst = 1000, endpoint_concurrency = 3)
+            AsyncFetcher(dict(), concurrency = 12, scheduler = unbounded).fetch(urls)
+        key, = scheduler.peak
+        assert key.endswith('/rest/api/2/issue/{id}/watchers')
+        assert scheduler.peak[key] == 3 and scheduler.in_flight[key] == 0
+        assert len(payloads) == 12 and scheduler.counters['calls'] == 12
+        assert unbounded.peak[key] == 12
+
+    def test_asyncio_engine_returns_the_issues_of_the_threads(self) -> None:
+        import tempfile
+        from base_class import BaseExtractor
+        from benchmark import Benchmark
+        from jira_stub import JiraStub
+        results = dict()
+        with JiraStub(issues = 45, page_size = 10) as stub, tempfile.TemporaryDirectory() as folder:
+            for engine in ('threads', 'asyncio'):
+                extractor = Benchmark(engine = engine).extractor('jira_routine_V2', stub.url, folder)
+                extractor.PAGE_SIZE = 10
+                results[engine] = BaseExtractor.grab_tickets(extractor, dict())
+                extractor.session.close()
+            assert stub.requests['search'] == 10
+        assert list(results['asyncio']) == [f'T2L-{number}' for number in range(1, 46)]
+        assert results['asyncio'] == results['threads']
+
+    def test_projection_asks_only_for_the_fields_clean_json_reads(self) -> None:
+        import tempfile
+        from base_class import BaseExtractor
+        from benchmark import Benchmark
+        from jira_stub import JiraStub
+        from jira_routine_V2 import LogExtractor
+        with JiraStub(issues = 5) as stub, tempfile.TemporaryDirectory() as folder:
+            extractor = Benchmark().extractor('jira_routine_V2', stub.url, folder)
+            assert set(LogExtractor.FIELDS) <= set(extractor.fields)
+            assert extractor.projection() == '&fields=' + ','.join(extractor.fields)
+            assert extractor.projection() in extractor.search
+            issues = BaseExtractor.grab_tickets(extractor, dict())
+            assert len(issues) == 5 and all(set(fields) <= set(extractor.fields) for fields in issues.values())
+            assert 'customfield_17284' not in issues['T2L-1']
+            ''' no fields at all, JIRA returns every field '''
+            extractor.widen_projection((), ())
+            assert extractor.projection() == '' and '&fields=' not in extractor.search
+            assert 'customfield_17284' in BaseExtractor.grab_tickets(extractor, dict())['T2L-1']
+            extractor.session.close()
+
+    def test_collector_merges_every_page_once_in_the_chosen_order(self) -> None:
+        import tempfile
+        from base_class import BaseExtractor
+        from benchmark import Benchmark
+        from jira_stub import JiraStub
+        with JiraStub(issues = 45, page_size = 10) as stub, tempfile.TemporaryDirectory() as folder:
+            extractor = Benchmark().extractor('jira_routine_V2', stub.url, folder)
+            extractor.PAGE_SIZE = 10
+            wrapper, collect = extractor.wrapper, extractor.collect
+            pages = list()
+
+            def slow_second_page(url):
+                ''' the page that starts at 10 lands last '''
+                time.sleep(0.2 if url.endswith('startAt=10') else 0)
+                return wrapper(url)
+
+            def count(dictionary, page):
+                pages.append(list(page))
+                return collect(dictionary, page)
+
+            with patch.object(extractor, 'wrapper', slow_second_page), patch.object(extractor, 'collect', count):
+                extractor.ordered_merge = True
+                ordered = BaseExtractor.grab_tickets(extractor, dict())
+                assert [page[0] for page in pages] == ['T2L-1', 'T2L-11', 'T2L-21', 'T2L-31', 'T2L-41']
+                pages.clear()
+                extractor.ordered_merge = False
+                landed = BaseExtractor.grab_tickets(extractor, dict())
+                assert [page[0] for page in pages][-1] == 'T2L-11' and len(pages) == 5
+            extractor.session.close()
+        assert list(ordered) == [f'T2L-{number}' for number in range(1, 46)]
+        assert landed == ordered and list(landed) != list(ordered)
+
+    def test_watchers_are_prefetched_once_per_url(self) -> None:
+        import tempfile
+        from base_class import BaseExtractor
+        from benchmark import Benchmark
+        from jira_stub import JiraStub
+        with JiraStub(issues = 30, watched = 0.5) as stub, tempfile.TemporaryDirectory() as folder:
+            extractor = Benchmark().extractor('jira_routine_V2', stub.url, folder)
+            issues = BaseExtractor.grab_tickets(extractor, dict())
+            watched = [key for key, fields in issues.items() if fields['watches']['watchCount'] > 0]
+            watchers = extractor.prefetch_watchers(issues)
+            assert sorted(watchers) == sorted(watched) and len(watched) > 0
+            assert stub.requests['watchers'] == len(watched)
+            key = watched[0]
+            assert len(watchers[key]) == issues[key]['watches']['watchCount']
+            assert all('@' in address for address in watchers[key])
+            ''' the second report of the run is served by the cache '''
+            assert extractor.prefetch_watchers(issues) == watchers
+            assert stub.requests['watchers'] == len(watched)
+            extractor.session.close()
+
+    def test_scheduled_adapter_honors_retry_after_and_only_retries_idempotent_calls(self) -> None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from scheduler import RequestScheduler, ScheduledAdapter
+        scheduler = RequestScheduler(rate = 1000, burst = 10, max_retries = 3)
+        adapter = ScheduledAdapter(scheduler)
+        answers = [Mock(status_code = 429, headers = {'Retry-After': '7'}), Mock(status_code = 502, headers = {}), Mock(status_code = 200, headers = {})]
+        get = requests.Request('GET', 'https://jira/rest/api/2/issue/T2L-1/watchers').prepare()
+        with patch.object(HTTPAdapter, 'send', side_effect = answers), patch('scheduler.time.sleep') as sleep:
+            assert adapter.send(get).status_code == 200
+        assert 6 < sleep.call_args_list[0][0][0] <= 7
+        assert scheduler.counters['throttled'] == 1 and scheduler.counters['retries'] == 2
+        assert scheduler.rate < 1000
+        assert scheduler.peak == {'jira/rest/api/2/issue/{id}/watchers': 1}
+        post = requests.Request('POST', 'https://jira/rest/api/2/issue').prepare()
+        with patch.object(HTTPAdapter, 'send', side_effect = [Mock(status_code = 500, headers = {})]) as send, patch('scheduler.time.sleep'):
+            assert adapter.send(post).status_code == 500
+        assert send.call_count == 1
+
+    def test_jira_stub_pages_projects_and_feeds_the_benchmark(self) -> None:
+        import requests
+        from jira_stub import JiraStub
+        from benchmark import Benchmark
+        with JiraStub(issues = 25, page_size = 10) as stub:
+            page = requests.get(stub.url + '/rest/api/2/search?jql=project = T2L&fields=summary,issuelinks&startAt=20&maxResults=50')
+            assert list(page.json())[:4] == ['expand', 'startAt', 'maxResults', 'total']
+            assert (page.json()['total'], page.json()['maxResults'], len(page.json()['issues'])) == (25, 10, 5)
+            assert set(page.json()['issues'][0]['fields']) == {'summary', 'issuelinks'}
+            linked = page.json()['issues'][0]['fields']['issuelinks'][0]['outwardIssue']['key']
+            found = requests.get(stub.url + '/rest/api/2/search?jql=key in (' + linked + ',CM-999)').json()
+            assert [issue['key'] for issue in found['issues']] == [linked]
+            assert requests.get(stub.url + '/rest/api/2/issue/T2L-26').status_code == 404
+        records = Benchmark(['deployment_log_UAT'], sizes = (30,), output = None).run()
+        assert [record['stage'] for record in records] == ['grab_tickets', 'clean_json', 'generate_excel']
+        assert all(record['rows'] == 30 for record in records)
+        assert records[1]['requests'] == 1
+
+    def test_run_metrics_time_every_stage_and_write_the_summaries(self) -> None:
+        import json, tempfile
+        from jira_stub import JiraStub
+        from benchmark import Benchmark
+        with JiraStub(issues = 20) as stub, tempfile.TemporaryDirectory() as folder:
+            extractor = Benchmark().extractor('deployment_log_UAT', stub.url, folder)
+            extractor.metrics.folder, extractor.metrics.textfile = folder, folder
+            extractor.startTimer
+            extractor.report(extractor.grab_incremental(dict()))
+            extractor.closeTimer
+            path, = [os.path.join(folder, file) for file in os.listdir(folder) if file.endswith('_metrics.json')]
+            with open(path) as file:
+                summary = json.load(file)
+            with open(os.path.join(folder, extractor.name + '.prom')) as file:
+                prometheus = file.read()
+        assert list(summary['stages']) == ['decode', 'fetch', 'linked_fetch', 'remove_custom_fields', 'clean_json', 'generate_excel']
+        assert summary['counters']['issues'] == 20 and summary['counters']['bytes'] > 0
+        assert summary['requests']['calls'] == 2 and summary['requests']['retries'] == 0
+        assert 'jira_report_stage_seconds{report="JIRA_UAT_Deploy-Log",stage="fetch"}' in prometheus
+
+    def test_profiler_writes_each_stage_only_when_enabled(self) -> None:
+        import tempfile
+        from profiling import Profiler
+        with tempfile.TemporaryDirectory() as folder:
+            with Profiler('JIRA', folder).stage('clean_json'):
+                sorted(range(1000))
+            assert os.listdir(folder) == []
+            cprofile = Profiler('JIRA', folder, enabled = True)
+            with cprofile.stage('clean_json'), cprofile.stage('generate_excel'), cprofile.stage('decode'):
+                sorted(range(1000))
+            sampling = Profiler('JIRA', folder, enabled = True, mode = 'sampling', memory = False, interval = 0.001)
+            with sampling.stage('fetch'):
+                time.sleep(0.05)
+            written = sorted(path.rsplit('_', 1)[-1] for path in cprofile.files + sampling.files)
+            assert written == ['excel.memory.txt', 'fetch.folded', 'fetch.txt', 'json.memory.txt', 'json.prof', 'json.txt']
+            with open(os.path.join(folder, f'JIRA_{cprofile.stamp}_clean_json.txt')) as file:
+                assert 'sorted' in file.read()
+            with open(os.path.join(folder, f'JIRA_{sampling.stamp}_fetch.folded')) as file:
+                assert 'test_profiler_writes_each_stage_only_when_enabled' in file.read()
+            ''' two reports of a batch overlap, the first one out must not stop tracemalloc under the second '''
+            first, second = Profiler('A', folder, enabled = True), Profiler('B', folder, enabled = True)
+            outer = first.trace_memory('clean_json')
+            outer.__enter__()
+            with second.trace_memory('clean_json'):
+                outer.__exit__(None, None, None)
+            import tracemalloc
+            assert tracemalloc.is_tracing() is False
+            assert len(first.files) == len(second.files) == 1
+
+    def test_config_snapshot_and_credentials_load_without_yaml_or_chdir(self) -> None:
+        import sys, tempfile
+        from utils import load_config, load_module, _CONFIGS
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'config.yml')
+            with open(path, 'w') as file:
+                file.write("jira:\n    MAX_WORKERS : 10\n")
+            with open(os.path.join(folder, 'configuration.py'), 'w') as file:
+                file.write("u = 'user'\n")
+            cfg = load_config(path)
+            cfg['jira']['MAX_WORKERS'] = 1
+            assert load_config(path) == {'jira': {'MAX_WORKERS': 10}}
+            ''' a new process only reads the pickled snapshot '''
+            _CONFIGS.clear()
+            with patch.dict(sys.modules, {'yaml': None}):
+                assert load_config(path) == {'jira': {'MAX_WORKERS': 10}}
+            with open(path, 'w') as file:
+                file.write("jira:\n    MAX_WORKERS : 20\n")
+            os.utime(path, ns = (0, 0))
+            assert load_config(path)['jira']['MAX_WORKERS'] == 20
+            cwd, syspath = os.getcwd(), list(sys.path)
+            assert load_module(os.path.join(folder, 'configuration.py'), 'configuration').u == 'user'
+            assert os.getcwd() == cwd and sys.path == syspath
+
+
 if __name__ == '__main__':
 #    unittest.main()
     suite = unittest.TestSuite()
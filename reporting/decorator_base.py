@@ -1,10 +1,12 @@
 import functools
+import hashlib
 import pickle
-import inspect
 import os, time
+import tempfile
 import re
 import unicodedata
-from pandas import DataFrame
+from utils import lazy_import
+pd = lazy_import('pandas')
 
 class Debug:
     '''
@@ -27,112 +29,127 @@ class Debug:
 
 class Memorize:
     ''' 
-    Memorize checks whether a clean json pickle exists in cache. 
-    If the arguments to the function are the same then the pickle is loaded and the function is bypassed 
-    (ie. the function is not reevaluated)
-    Otherwise the function is loaded and a pickle is saved in a .cache file. 
-    The filename is passed to clean json so that it can be used in the naming of the pickle file. 
-    This ensures the unicity of the pickle file accross reports
+    Memorize checks whether a pickle of the function output exists in cache. 
+    The cache key is a stable hash of the data arguments (dict, list, DataFrame) and of the JQL of the extractor, 
+    so a call with the same JQL and the same arguments is served from disk and the function is bypassed.
+    Entries older than ttl seconds are ignored, the least recently used entries are evicted once the folder
+    grows past max_size bytes. Files are written once, atomically, and read once per call.
+    The file name and the function name prefix the pickle file name so that each report can be traced back.
     fork: https://github.com/brmscheiner/memorize.py
     '''
-    def __init__(self, file_name="unknown file", func_name="unknown function"):
+    FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+    ''' a .tmp of save_cache older than this was left by an interrupted process, a save still running is never that old '''
+    TEMP_TTL = 3600
+
+    def __init__(self, file_name="unknown file", func_name="unknown function", ttl=8*3600, max_size=512*2**20):
         self.file_name = file_name
         self.func_name = func_name
-        self.set_cache_filename
-        self.set_parent_file
+        self.ttl = ttl
+        self.max_size = max_size
+        self.prefix = _slugify(self.file_name.replace('.py', '')) + '_' + _slugify(self.func_name) + '_'
 
-    def __call__(self, func, *args):
+    def __call__(self, func):
+        @functools.wraps(func)
         def wrapper(*args):
-            params = list()
-            for arg in args:
-                if isinstance(arg, (dict, list, DataFrame)):
-                    params.append(arg)
-                    if self.cache_exists():
-                        self.read_cache()
-                        if self.params == params:
-                            print(f"Reading cache of function: {self.func_name} from {self.file_name}")
-                            return self.cache
-            self.save_params(params)
-            self.cache = func(*args)
-            self.save_cache
-            return self.cache
+            path = os.path.join(self.FOLDER, self.prefix + self.make_key(args) + '.cache')
+            found, cache = self.read_cache(path)
+            if found is True:
+                print(f"Reading cache of function: {self.func_name} from {self.file_name}")
+                return cache
+            cache = func(*args)
+            self.save_cache(path, cache)
+            self.evict()
+            return cache
         return wrapper
 
-    @property
-    def set_parent_file(self):
-        """
-        Sets self.parent_file to the absolute path of the
-        file containing the memoized function.
-        """
-        rel_parent_file = inspect.stack()[-1].filename
-        self.parent_filepath = os.path.abspath(rel_parent_file)
-        
-    @property
-    def set_cache_filename(self):
-        """
-        Sets self.cache_filename to an os-compliant
-        version of "file_function.cache"
-        """
-        file_name = _slugify(self.file_name.replace('.py', ''))
-        func_name = _slugify(self.func_name)
-        timerz = time.strftime("%Y%m%d")
-        self.cache_filename = file_name + '_' + func_name + '_' + timerz + '.cache'
+    @staticmethod
+    def make_key(args) -> str:
+        '''
+        Hash the data arguments together with the JQL of the extractor instance, if any.
+        The first page url holds the JQL, the incremental watermark and the field projection
+        '''
+        params = list()
+        for arg in args:
+            ''' only a pandas object can be a DataFrame, pandas is not loaded for the other arguments '''
+            if isinstance(arg, (dict, list)) or (type(arg).__module__.startswith('pandas') and isinstance(arg, pd.DataFrame)):
+                params.append(arg)
+            elif hasattr(arg, 'search'):
+                params.append(arg.search)
+        return hashlib.sha256(pickle.dumps(params, protocol=4)).hexdigest()[:32]
 
-    def get_last_update(self):
-        """
-        Returns the time that the parent file was last
-        updated.
-        """
-        last_update = os.path.getmtime(self.parent_filepath)
-        return last_update
+    def read_cache(self, path: str) -> tuple:
+        '''
+        Return (True, cache) on a hit and (False, None) when the entry is missing, expired or unreadable.
+        The modification time is the creation time of the entry, the access time is bumped on every hit for the LRU eviction
+        '''
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False, None
+        if time.time() - stat.st_mtime > self.ttl:
+            return False, None
+        try:
+            with open(path, 'rb') as f:
+                cache = pickle.load(f)
+        except (EOFError, pickle.UnpicklingError):
+            return False, None
+        os.utime(path, (time.time(), stat.st_mtime))
+        return True, cache
 
-    def read_cache(self):
-        """
-        Read a pickled dictionary into self.timestamp and
-        self.cache. See self.save_cache.
-        """
-        with open(self.cache_filename, 'rb') as f:
-            data = pickle.loads(f.read())
-            self.timestamp = data['timestamp']
-            self.params = data['params']
-            self.cache = data['cache']
+    def save_cache(self, path: str, cache) -> None:
+        ''' Pickle into a temporary file and swap it in so that a concurrent reader never sees half a pickle '''
+        os.makedirs(self.FOLDER, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=self.FOLDER, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, path)
+        except BaseException:
+            os.remove(temp)
+            raise
 
-    def save_params(self, params):
-        """
-        Separating the save cache from the save params is an inevitable workaround 
-        because calling the decorated function func(*args) 
-        somehow messes up the parameter variable in the __call__ method
-        """
-        with open(self.cache_filename, 'wb+') as f:
-            out = dict()
-            out['params'] = params
-            f.write(pickle.dumps(out))
-    
-    @property
-    def save_cache(self):
-        """
-        Pickle the file's timestamp and the function's cache
-        in a dictionary object.
-        """
-        out = open(self.cache_filename, 'rb')
-        out = pickle.loads(out.read())
-        with open(self.cache_filename, 'wb+') as f:
-            out['timestamp'] = self.get_last_update()
-            out['cache'] = self.cache
-            f.write(pickle.dumps(out))
-        
-    def cache_exists(self):     
+    def evict(self) -> None:
         '''
-        Returns True if a matching cache exists in the current directory.
+        Drop the expired entries and the orphaned .tmp files, then the least recently used entries until the folder fits in max_size.
+        Another process may evict the same files at the same time, a file that is already gone is skipped
         '''
-        if os.path.isfile(self.cache_filename):
-            return True
-        return False
+        now = time.time()
+        entries = list()
+        for entry in os.scandir(self.FOLDER):
+            if not entry.name.endswith(('.cache', '.tmp')):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith('.tmp'):
+                if now - stat.st_mtime > self.TEMP_TTL:
+                    _remove(entry.path)
+            elif now - stat.st_mtime > self.ttl:
+                _remove(entry.path)
+            else:
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            _remove(path)
+            size -= entry_size
 
+    @classmethod
+    def cache_exists(cls, prefixes: list) -> bool:
+        '''
+        Returns True if a cache entry exists for any of the file_function prefixes.
+        '''
+        if not os.path.isdir(cls.FOLDER):
+            return False
+        return any(name.startswith(tuple(prefixes)) and name.endswith('.cache') for name in os.listdir(cls.FOLDER))
 
-    def __get__(self, obj, objtype):
-        """ Support instance methods. """
-        return functools.partial(self.__call__, obj)
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
 def _slugify(value):
     """
@@ -1,53 +1,104 @@
+from __future__ import annotations
 import time, logging, os
-import pandas as pd
 from requests.exceptions import ConnectionError
 from base_class import BaseExtractor
-from pandas import DataFrame
 from typing import Union
 from decorator_base import Memorize
-from utils import MyDefaultDict
+from field_mapping import Field
+from utils import lazy_import
+pd = lazy_import('pandas')
 
 NAME = 'JIRA_UAT_Deploy-Log'
 
 
 class DeployExtractor(BaseExtractor):
     
-    def __init__(self, name: str, verbose = None) -> None:
-        super().__init__(name = name, verbose = verbose) 
+    ''' Fields read by clean_json '''
+    FIELDS = ('summary', 'reporter', 'assignee', 'status', 'issuelinks', 'customfield_11880', 'customfield_13180',
+              'customfield_12705', 'customfield_16880', 'customfield_12706', 'customfield_10091')
+    ''' Custom fields kept by remove_custom_fields '''
+    CUSTOM_FIELDS = ('customfield_12705', 'customfield_13180', 'customfield_11880', 'customfield_16880', 'customfield_12706', 'customfield_10091')
+    ''' CM start date and time: customfield_11483 '''
+    LINKED_FIELDS = ('issuetype', 'customfield_11483', 'customfield_11880', 'customfield_10091')
+    ''' Columns of the excel: column, path in the fields, optional, transform '''
+    MAPPING = (Field('Target Environment', 'customfield_11880[0].value'),
+               Field('Summary', 'summary'),
+               Field('Reporter', 'reporter.displayName'),
+               Field('Assignee', 'assignee.displayName', True),
+               Field('Status', 'status.name'),
+               Field('Deployment Duration', 'customfield_13180'),
+               Field('Applications', 'customfield_12705[0]', True),
+               Field('Deployment Type', 'customfield_16880.value', True),
+               Field('PSP', 'customfield_12706[0]', True))
+    ''' Deployment chain, first environment first: deploy date column and name used in the messages. Overriden by CHAIN in config.yml '''
+    CHAIN = ({'column': 'EU TEST Deployment Date', 'label': 'TEST'},
+             {'column': 'EU UAT Deployment Date', 'label': 'UAT'},
+             {'column': 'PRD Deployment Date', 'label': 'PRD'})
+
+    def __init__(self, name: str, verbose = None, yml: dict = None, cfg = None, parse_cli: bool = True) -> None:
+        super().__init__(name = name, verbose = verbose, yml = yml, cfg = cfg, parse_cli = parse_cli)
         ''' constants '''
-        self.URL = self.yml['deploy']['URL_1'] + self.yml['deploy']['JQL'] + str(self.yml['deploy']['URL_2'])
-        self.search = self.URL + self.yml['jira']['LINK'] + str(self.yml['jira']['START_AT'])
+        self.URL = self.search_url(self.yml['deploy']['URL_1'], self.yml['deploy']['JQL'], self.yml['deploy']['URL_2'])
+        self.search = self.page_url(self.yml['jira']['START_AT'])
+        self.chain = self.yml['deploy'].get('CHAIN') or list(self.CHAIN)
+        self.rules = self.missing_link_rules(self.chain, self.yml['deploy'].get('MISSING_LINK_RULES') or list())
         
+    @staticmethod
+    def missing_link_rules(chain: list, extra: list) -> list:
+        ''' Business Logic, once a package reached an environment every previous environment of the chain should hold a JIRA link '''
+        ''' A rule sets `missing` to `message` when `missing` is empty and any column of `when` is filled, the first matching rule wins '''
+        rules = list()
+        for j, env in enumerate(chain[:-1]):
+            rules.append({'when': [later['column'] for later in chain[j+1:]],
+                          'missing': env['column'],
+                          'message': f"Missing link to the {chain[j+1]['label']} deployment ticket"})
+        for rule in extra:
+            when = rule['when']
+            rules.append({'when': [when] if isinstance(when, str) else list(when), 'missing': rule['missing'], 'message': rule['message']})
+        return rules
+
     def custom_validation(self, envs: list) -> None:
-        for element in ['EU UAT Deployment Date','EU TEST Deployment Date', 'PRD Deployment Date']:
+        for element in [env['column'] for env in self.chain]:
             if element not in envs:
                 message = "{} is not available in the 'dataframe' column index: {}".format(element, envs)
                 raise Exception(message)
                 logging.getLogger(__name__).error(message)
     
-    def identify_missing_links(self, dataframe: DataFrame, envs: list) -> DataFrame:
+    def identify_missing_links(self, dataframe: pd.DataFrame, envs: list) -> pd.DataFrame:
         ''' Business Logic, if the package was deployed in PRD a JIRA link should populate the UAT and TEST environment date fields'''
         ''' Same thing for UAT, if the package was deployed in UAT a JIRA link should populate the TEST environment date fields'''
         
-        self.custom_validation(envs)
-        
-        new_dataframe = pd.isnull(dataframe[['EU UAT Deployment Date','EU TEST Deployment Date']])
-        new_dataframe = new_dataframe[new_dataframe['EU UAT Deployment Date']==False]
-        new_dataframe = new_dataframe[new_dataframe['EU TEST Deployment Date']==True]
-        dataframe.loc[new_dataframe.index,'EU TEST Deployment Date'] = 'Missing link to the UAT deployment ticket'
-
-        new_dataframe = pd.isnull(dataframe[['PRD Deployment Date','EU UAT Deployment Date','EU TEST Deployment Date']])
-        new_dataframe = new_dataframe[new_dataframe['PRD Deployment Date']==False]
-        new_dataframe = new_dataframe[new_dataframe['EU TEST Deployment Date']==True]
-        dataframe.loc[new_dataframe.index,'EU TEST Deployment Date'] = 'Missing link to the UAT deployment ticket'
+        ''' The rules are evaluated against a single null mask computed once, before any message is written '''
         
-        new_dataframe = pd.isnull(dataframe[['PRD Deployment Date','EU UAT Deployment Date','EU TEST Deployment Date']])
-        new_dataframe = new_dataframe[new_dataframe['PRD Deployment Date']==False]
-        new_dataframe = new_dataframe[new_dataframe['EU UAT Deployment Date']==True]
-        dataframe.loc[new_dataframe.index,'EU UAT Deployment Date'] = 'Missing link to the PRD deployment ticket'
+        self.custom_validation(envs)
         
+        columns = list(dict.fromkeys(column for rule in self.rules for column in rule['when'] + [rule['missing']]))
+        filled = dataframe.reindex(columns=columns).notnull()
+        ''' applied last rule first so that the first matching rule has the final word '''
+        for rule in reversed(self.rules):
+            hit = ~filled[rule['missing']] & filled[rule['when']].any(axis=1)
+            if hit.any():
+                column = dataframe.reindex(columns=[rule['missing']])[rule['missing']]
+                dataframe[rule['missing']] = column.astype(object).mask(hit, rule['message'])
         return dataframe
     
+    def report(self, dictionary: dict) -> dict:
+        ''' clean_json also returns the deploy date columns that generate_excel formats as dates '''
+        json, envs = self.clean_stage(dictionary)
+        self.save_columnar(json)
+        with self.metrics.span('generate_excel'):
+            self.generate_excel(json, envs)
+        return json
+
+    @staticmethod
+    def merge_shards(results: list) -> tuple:
+        final_json = dict()
+        envs = list()
+        for json, shard_envs in results:
+            final_json.update(json)
+            envs.extend(shard_envs)
+        return final_json, envs
+
     def generate_excel(self, dictionary: dict, envs: list) -> None:
         ''' Generate an excel from the dictionary provided in the input section '''
         ''' Transform certain columns into datetime objects so that excel can sort them properly ''' 
@@ -55,23 +106,29 @@ class DeployExtractor(BaseExtractor):
         timerz=time.strftime("%Y%m%d_%H%M%S_"+str(len(dictionary)))
         filename = str(self.name)+'_'+timerz+'.xlsx'
         df = pd.DataFrame.from_dict(dictionary,orient='index')
-        for env in envs:
-            df[env] = pd.to_datetime(df[env], format="%Y/%m/%d", errors='ignore', utc=True)
-            df[env] = df[env].apply(lambda x: x.tz_convert('Europe/Luxembourg'))
-
-        writer = pd.ExcelWriter(filename, engine='xlsxwriter', options={'remove_timezone': True})
+        ''' envs holds one entry per ticket, each column is parsed once '''
+        df = self.normalize_dates(df, envs)
         df = self.identify_missing_links(df, envs)
-        df.to_excel(writer, sheet_name=self.name, header=True, index=True)
-        # Close the Pandas Excel writer and output the Excel file
-        self.save_excel(writer)
+        with self.report_writer(filename) as writer:
+            writer.write_sheet(self.name, df)
         self.test_file_creation
 
 #    @Memorize(func_name = "grab_tickets", file_name = os.path.basename(__file__))
     def grab_tickets(self, dictionary: dict) -> dict:
         return super().grab_tickets(dictionary)
     
+    def prefetch(self, dictionary: dict) -> dict:
+        ''' linked CM and deployment tickets are fetched once for the whole report instead of once per link and per parent '''
+        try:
+            return {'linked': self.resolve_linked_issues(dictionary)}
+        except ConnectionError as e:
+            if self.verbose is True:
+                print(e)
+            logging.getLogger(__name__).error(f'Connection Error when consulting CM ticket: {e}')
+            raise
+
 #    @Memorize(func_name = "clean_json", file_name = os.path.basename(__file__))
-    def clean_json(self, dictionary: dict) -> Union[DataFrame, list]:
+    def clean_json(self, dictionary: dict, linked: dict = None) -> Union[pd.DataFrame, list]:
         ''' Mapping function '''
         ''' Go through the json and pick the right values to add to the excel ''' 
         '''
@@ -83,73 +140,39 @@ class DeployExtractor(BaseExtractor):
         # Deployment Time : customfield_10091
         '''
         
+        if linked is None:
+            linked = self.prefetch(dictionary)['linked']
         final_json = dict()
         envs = list()
+        rows = self.map_fields(dictionary)
         for jira_key, val in dictionary.items():
-            json_trash = dict()
-            val_ = MyDefaultDict(val)
-            val = val_
-            environment_acronym = val['customfield_11880'][0]['value']
-            json_trash['Target Environment'] = environment_acronym
-            json_trash['Summary'] = val['summary']
-            # json_trash['Description'] = val['description']
-            json_trash['Reporter'] = val['reporter']['displayName']
-            if val['assignee'] is not None:
-                json_trash['Assignee'] = val['assignee']['displayName']
-            json_trash['Status'] = val['status']['name']
-            json_trash['Deployment Duration'] = val['customfield_13180']
-            if len(val['customfield_12705']) > 0:
-                json_trash['Applications'] = val['customfield_12705'][0]
-            if val['customfield_16880'] is not None:
-                json_trash['Deployment Type'] = val['customfield_16880']['value']
-            if len(val['customfield_12706']) > 0:
-                json_trash['PSP'] = val['customfield_12706'][0]
+            json_trash = rows[jira_key]
+            environment_acronym = json_trash['Target Environment']
             
             if isinstance(environment_acronym, str):
                 deploy_env = environment_acronym + ' Deployment Date'
                 if 'PRD' not in deploy_env:
                     ''' append column name so that it can be formatted as date in the generate_excel method '''
                     envs.append(deploy_env)
-                json_trash[deploy_env] = val['customfield_10091']
+                json_trash[deploy_env] = val.get('customfield_10091')
             
             ''' handle the linked tickets so that we can grab their deploy date '''
-            liste = list()
-            if len(val['issuelinks']) > 0:
-                for i in range(len(val['issuelinks'])):
-                    try:
-                        liste.append(self.cfg.BASE_URL + val['issuelinks'][i]['inwardIssue']['key'])
-                    except KeyError:
-                        pass
-                    try:
-                        liste.append(self.cfg.BASE_URL + val['issuelinks'][i]['outwardIssue']['key'])
-                    except KeyError:
-                        pass
-            for i in range(len(liste)):
+            for key in self.linked_keys(val):
+                ticket = linked.get(key)
+                if ticket is None:
+                    ''' the link points to a ticket the JQL user cannot see or that was deleted '''
+                    continue
                 try:
-                    '''
-                    # Other scripts query the API 3 times at most
-                    # I'm mitigating the potential denial of service here with the 1 second sleep as the total number of queries can potentially be high. 
-                    # The total number of queries is increased by the number of issue links. 
-                    '''
-                    if len(liste) > 1:
-                        ticket = self.grab_linked_tickets(liste)
-                    else:
-                        ticket = self.consult_url(liste[0]).json()
-                    issuetype = ticket['fields']['issuetype']['name']
+                    issuetype = ticket['issuetype']['name']
                     if issuetype == "Normal Change" or issuetype == "Standard Change":
                         ''' Grab 'start date and time' from CM '''
-                        json_trash['PRD Deployment Date'] = ticket['fields']['customfield_11483']
+                        json_trash['PRD Deployment Date'] = ticket['customfield_11483']
                         ''' Append column name so that it can be formatted as date in the generate_excel method '''
                         envs.append('PRD Deployment Date')
                     if issuetype == "Deployment":
-                        environment_acronym = ticket['fields']['customfield_11880'][0]['value']                        
+                        environment_acronym = ticket['customfield_11880'][0]['value']                        
                         deploy_env = environment_acronym + ' Deployment Date'
-                        json_trash[deploy_env] = ticket['fields']['customfield_10091']
-                except ConnectionError as e:
-                    if self.verbose is True:
-                        print(e)
-                    logging.getLogger(__name__).error(f'Connection Error when consulting CM ticket: {e}')
-                    raise
+                        json_trash[deploy_env] = ticket['customfield_10091']
                 except TypeError as e: # add to TEST
                     if self.verbose is True:
                         print(e)
@@ -169,10 +192,8 @@ def main(name):
         extractor.run_tests()
     
     extractor.startTimer
-    json = extractor.grab_tickets(dict())
-    json = extractor.remove_custom_fields(json, 'customfield_12705', 'customfield_13180', 'customfield_11880', 'customfield_16880', 'customfield_12706', 'customfield_10091')
-    json, envs = extractor.clean_json(json)
-    extractor.generate_excel(json, envs)
+    json = extractor.grab_incremental(dict())
+    extractor.report(json)
     extractor.closeTimer
     
 
@@ -0,0 +1,70 @@
+from datetime import datetime
+from typing import Iterable
+from jinja2 import Environment
+
+
+''' Issue type -> icon fragment of img.RESOURCES, any other type gets OBJ_1 '''
+ICONS = {'Bug': 'OBJ_1_BUG',
+         'New Feature': 'OBJ_1_FEAT',
+         'Task': 'OBJ_1_TSK',
+         'Change Request': 'OBJ_1_CR',
+         'Story': 'OBJ_1_STR',
+         'Requirement': 'OBJ_1_REQ',
+         'Epic': 'OBJ_1_EPC'}
+DEFAULT_ICON = 'OBJ_1'
+FRAGMENTS = ('HEAD', 'SUB_HEAD', 'SUB_HEAD_2', 'SUB_HEAD_2_1', 'SUB_HEAD_2_2', 'SUB_HEAD_3',
+             'TABLE_1', 'TABLE_2', 'OBJ_2', 'OBJ_3', 'OBJ_4', 'OBJ_5')
+LINK = 'https://jira.com/browse/'
+
+''' The html fragments are passed as variables, they are written as they are and never parsed by jinja '''
+SOURCE = (
+    "{{ r.HEAD }}{{ date.strftime('%d.%m.%Y') }}"
+    "{{ r.SUB_HEAD }}{{ system }} Release {{ date.strftime('%B %Y') }} {{ release }}{{ r.SUB_HEAD_2 }}"
+    "SUBJECT: {{ system }} Freeze notification{{ r.SUB_HEAD_2_1 }}{{ r.SUB_HEAD_2_2 }}"
+    "The {{ count }} tickets outlined below will be deployed on the \n"
+    "        weekend of the {{ deploy_date }}. Please note that no further deployment requests\n"
+    "        will be accepted. "
+    "{{ r.SUB_HEAD_3 }}{{ r.TABLE_1 }}"
+    "{% for key, row, description in issues %}"
+    "{{ icons.get(row['Issue Type'], default_icon) }}{{ link }}{{ key }}{{ r.OBJ_2 }}{{ key }}"
+    "{{ r.OBJ_3 }}{{ row['Summary'] }}{{ r.OBJ_4 }}{{ description }}{{ r.OBJ_5 }}"
+    "{% endfor %}"
+    "{{ r.TABLE_2 }}"
+)
+''' compiled once at import, every email of the run reuses it '''
+TEMPLATE = Environment(autoescape=False, keep_trailing_newline=True).from_string(SOURCE)
+
+
+class ReleaseEmail:
+    '''
+    Render the release note email with a precompiled template instead of concatenating the html fragments.
+    The document is streamed to the file chunk by chunk, it is never built in memory as a whole.
+    Usage:
+    email = ReleaseEmail(RESOURCES, system='T24', deploy_date='20th of July')
+    email.render('JIRA_Release_Notes.html', '19.07.EU ', final_json, descriptions)
+    '''
+    def __init__(self, resources, system: str, deploy_date: str, link: str = LINK) -> None:
+        ''' the fragments and the icon of every issue type are looked up once, not once per issue '''
+        self.fragments = {name: getattr(resources, name) for name in FRAGMENTS}
+        self.icons = {issue_type: getattr(resources, name) for issue_type, name in ICONS.items()}
+        self.default_icon = getattr(resources, DEFAULT_ICON)
+        self.system = system
+        self.deploy_date = deploy_date
+        self.link = link
+
+    def render(self, path: str, release: str, dictionary: dict, descriptions: Iterable, date: datetime = None) -> str:
+        ''' Write the email of one release, dictionary is issue key -> row of clean_json and descriptions are in the same order '''
+        stream = TEMPLATE.stream(r = self.fragments,
+                                 icons = self.icons,
+                                 default_icon = self.default_icon,
+                                 link = self.link,
+                                 date = date or datetime.now(),
+                                 system = self.system,
+                                 release = release,
+                                 deploy_date = self.deploy_date,
+                                 count = len(dictionary),
+                                 issues = ((key, row, description) for (key, row), description in zip(dictionary.items(), descriptions)))
+        stream.enable_buffering(64)
+        with open(path, 'w') as file:
+            stream.dump(file)
+        return path
@@ -0,0 +1,192 @@
+from __future__ import annotations
+import re
+from collections import namedtuple
+from typing import Callable
+from utils import lazy_import
+pd = lazy_import('pandas')
+
+
+''' One column of a report: column name, path in the JIRA fields, skip the column when the value is missing, function applied to the value '''
+Field = namedtuple('Field', ['column', 'path', 'optional', 'transform'])
+Field.__new__.__defaults__ = (False, None)
+
+MISSING = object()
+_STEP = re.compile(r'([^.\[\]]+)|\[(\d+)\]')
+
+
+def parse_path(path: str) -> list:
+    '''
+    Split a path expression into keys and list indexes
+    parse_path('customfield_17284.steps[0].step')
+    >> ['customfield_17284', 'steps', 0, 'step']
+    '''
+    steps = list()
+    for key, index in _STEP.findall(path):
+        steps.append(int(index) if index else key)
+    if len(steps) == 0:
+        raise ValueError(f"Empty field path: '{path}'")
+    return steps
+
+
+def compile_path(path: str) -> Callable:
+    '''
+    Compile a path expression into a function reading it from the fields of an issue.
+    The lookups are generated as plain subscriptions so that no loop nor parsing is left at run time.
+    A missing key, a null parent or an index out of range returns MISSING instead of raising.
+    get = compile_path('assignee.displayName')
+    get({'assignee': {'displayName': 'Jose'}})
+    >> 'Jose'
+    '''
+    lookups = ''.join(f'[{step!r}]' for step in parse_path(path))
+    source = ('def get(fields):\n'
+              '    try:\n'
+              f'        return fields{lookups}\n'
+              '    except (KeyError, IndexError, TypeError):\n'
+              '        return MISSING\n')
+    namespace = {'MISSING': MISSING}
+    exec(compile(source, f'<path {path}>', 'exec'), namespace)
+    return namespace['get']
+
+
+def _empty(value) -> bool:
+    return value is MISSING or value is None or (isinstance(value, (list, dict)) and len(value) == 0)
+
+
+def _missing(value) -> bool:
+    ''' MISSING, or the NaN a dataframe holds for a column an issue does not have '''
+    return value is MISSING or (isinstance(value, float) and value != value)
+
+
+def _blank(value) -> bool:
+    ''' _empty, NaN included, for the values read from a dataframe '''
+    return _empty(value) or _missing(value)
+
+
+def _step(value, step):
+    ''' One step of a compiled path, for the values of a column '''
+    try:
+        return value[step]
+    except (KeyError, IndexError, TypeError):
+        return MISSING
+
+
+def _map(values, function: Callable, index) -> pd.Series:
+    ''' Series.map infers the dtype of the result, integers next to a NaN would come back as floats '''
+    return pd.Series([function(value) for value in values], index=index, dtype=object)
+
+
+def flatten(fields: dict, prefix: str = '', flat: dict = None) -> dict:
+    '''
+    Nested dictionaries as dotted keys, like json_normalize. Lists and empty dictionaries are left as values
+    flatten({'assignee': {'displayName': 'Jose'}, 'labels': []})
+    >> {'assignee.displayName': 'Jose', 'labels': []}
+    '''
+    if flat is None:
+        flat = dict()
+    for key, value in fields.items():
+        if isinstance(value, dict) and len(value) > 0:
+            flatten(value, prefix + key + '.', flat)
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+class FieldMapping:
+    '''
+    Declarative clean_json: each Field is compiled once and applied to every issue.
+    Required columns are always written (None when the path is missing), optional columns only when the value is neither
+    missing, None nor an empty list. transform receives the value found at the path.
+    Usage:
+    mapping = FieldMapping([Field('Assignee', 'assignee.displayName', True), Field('PSP', 'customfield_12706[0]', True)])
+    mapping.apply(fields)
+    >> {'Assignee': 'Jose', 'PSP': 'P3304'}
+    '''
+    def __init__(self, fields: list) -> None:
+        self.fields = [Field(*field) if not isinstance(field, Field) else field for field in fields]
+        self.accessors = [(field.column, compile_path(field.path), field.optional, field.transform) for field in self.fields]
+
+    def __getstate__(self) -> dict:
+        ''' The compiled accessors cannot be pickled, they are compiled again in the worker process '''
+        return {'fields': self.fields}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state['fields'])
+
+    @classmethod
+    def from_config(cls, fields: list, columns: list) -> 'FieldMapping':
+        ''' Append the extra columns of config.yml, given as {column: ..., path: ..., optional: ...} '''
+        extra = [Field(column['column'], column['path'], column.get('optional', True)) for column in columns or list()]
+        return cls(list(fields) + extra)
+
+    def top_fields(self) -> list:
+        ''' JIRA fields the mapping reads, for the projection of the search API '''
+        return list(dict.fromkeys(parse_path(field.path)[0] for field in self.fields))
+
+    def apply(self, fields: dict, row: dict = None) -> dict:
+        ''' Map the fields of one issue, the columns are added to row when given '''
+        if row is None:
+            row = dict()
+        for column, get, optional, transform in self.accessors:
+            value = get(fields)
+            if optional is True and _empty(value):
+                continue
+            if value is MISSING:
+                value = None
+            elif transform is not None:
+                value = transform(value)
+            row[column] = value
+        return row
+
+    def apply_all(self, dictionary: dict, vectorized: bool = False) -> dict:
+        ''' Map every issue, issue key -> row. vectorized goes through a frame of the flattened issues, the rows are the same '''
+        if vectorized is True:
+            return self.rows_from_frame(self.frame(dictionary))
+        return {jira_key: self.apply(fields) for jira_key, fields in dictionary.items()}
+
+    def frame(self, dictionary: dict) -> pd.DataFrame:
+        '''
+        Vectorized path: flatten every issue once and read each column as a whole.
+        Dotted paths are flat columns already, list indexes and what follows them are read value by value.
+        A path no column starts with (a dictionary every issue has) is read from the issues with its compiled accessor.
+        The frame holds objects only so that integers stay integers next to a missing value,
+        and transform is skipped like apply() skips it: on missing values and on the empty values of optional columns.
+        '''
+        flat = pd.DataFrame([flatten(fields) for fields in dictionary.values()], index=list(dictionary), dtype=object)
+        columns = dict()
+        for field, (_, get, _, _) in zip(self.fields, self.accessors):
+            steps = parse_path(field.path)
+            series, rest = self.flat_column(flat, steps)
+            if series is None:
+                series, rest = _map(dictionary.values(), get, flat.index), list()
+            for step in rest:
+                series = _map(series, lambda value, step=step: _step(value, step), flat.index)
+            if field.transform is not None:
+                skip = _blank if field.optional is True else _missing
+                series = _map(series, lambda value, transform=field.transform, skip=skip: value if skip(value) else transform(value), flat.index)
+            columns[field.column] = series
+        return pd.DataFrame(columns, index=flat.index, dtype=object)
+
+    @staticmethod
+    def flat_column(flat: pd.DataFrame, steps: list) -> tuple:
+        ''' Longest dotted prefix of the path that flatten turned into a column and the steps left to apply, None when there is none '''
+        for end in range(len(steps), 0, -1):
+            head = steps[:end]
+            if all(isinstance(step, str) for step in head):
+                name = '.'.join(head)
+                if name in flat.columns:
+                    return flat[name], steps[end:]
+        return None, steps
+
+    def rows_from_frame(self, df: pd.DataFrame) -> dict:
+        optional = {field.column for field in self.fields if field.optional is True}
+        rows = dict()
+        for jira_key, values in zip(df.index, df.itertuples(index=False, name=None)):
+            row = dict()
+            for column, value in zip(df.columns, values):
+                if column in optional and _blank(value):
+                    continue
+                if _missing(value):
+                    value = None
+                row[column] = value
+            rows[jira_key] = row
+        return rows
@@ -0,0 +1,72 @@
+import hashlib, logging, os, pickle, time
+
+
+class IssueStore:
+    '''
+    Local copy of the raw field values of one report together with the watermark of its last run.
+    Only the issues updated since the watermark are fetched again and merged on top of the copy.
+    Issues that were deleted on JIRA or that no longer match the JQL stay in the store until it is deleted.
+    The store is bound to the search that built it: a store of another JQL or projection is dropped by bind().
+    Usage:
+    store = IssueStore(folder, 'JIRA').load()
+    store.bind(search_url_without_watermark)
+    store.watermark
+    >> '2019/07/20 06:55'
+    store.merge(changed_issues)
+    store.save(started_at)
+    '''
+    ''' JQL date format, minutes are the finest granularity JIRA accepts '''
+    FORMAT = "%Y/%m/%d %H:%M"
+
+    def __init__(self, folder: str, name: str, overlap: int = 5) -> None:
+        self.folder = folder
+        self.path = os.path.join(folder, str(name) + '.store')
+        ''' minutes substracted from the watermark to cover clock drift between this host and JIRA '''
+        self.overlap = overlap
+        self.watermark = None
+        self.issues = dict()
+        ''' hash of the search the issues come from, None for a store saved before the search was recorded '''
+        self.key = None
+
+    def load(self) -> 'IssueStore':
+        if os.path.isfile(self.path):
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+            self.watermark = data['watermark']
+            self.issues = data['issues']
+            self.key = data.get('key')
+        return self
+
+    @staticmethod
+    def search_key(search: str) -> str:
+        return hashlib.sha256(search.encode('utf-8')).hexdigest()[:32]
+
+    def bind(self, search: str) -> 'IssueStore':
+        '''
+        Bind the store to the search URL and projection of the report, without the watermark clause.
+        Issues fetched by another JQL, PSP, release or set of fields would be served stale or without some fields,
+        the store starts over and the next run fetches every issue.
+        '''
+        key = self.search_key(search)
+        if key != self.key and (self.watermark is not None or len(self.issues) > 0):
+            logging.getLogger(__name__).info(f"{self.path} was built by another search, every issue is fetched again")
+            self.watermark = None
+            self.issues = dict()
+        self.key = key
+        return self
+
+    def merge(self, changed: dict) -> dict:
+        ''' Newer field values replace the stored ones, untouched issues are kept as they are '''
+        self.issues.update(changed)
+        return self.issues
+
+    def save(self, started_at: float) -> None:
+        ''' started_at is the time the fetch started so that issues updated during the run are picked up next time '''
+        self.watermark = time.strftime(self.FORMAT, time.localtime(started_at - self.overlap * 60))
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        ''' write next to the store and swap so that an interrupted run never leaves a truncated store behind '''
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as f:
+            pickle.dump({'watermark': self.watermark, 'issues': self.issues, 'key': self.key}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, self.path)
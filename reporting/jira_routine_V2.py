@@ -1,45 +1,150 @@
-import requests, time, re, logging, os
-import pandas as pd
+import time, logging, os
+from requests.exceptions import ConnectionError
 from base_class import BaseExtractor
 from decorator_base import Memorize
-from utils import MyDefaultDict
+from field_mapping import Field
+from markup import strip_markup
 from json import JSONDecodeError
+from utils import lazy_import
+pd = lazy_import('pandas')
 
 NAME = 'JIRA'
 
 
+def first_version(versions: list) -> str:
+    try:
+        return versions[0]['name']
+    except KeyError:
+        logging.getLogger(__name__).error("fixVersions exception logged")
+        raise
+
+def link_keys(issuelinks: list) -> list:
+    keys = list()
+    for link in issuelinks:
+        try:
+            keys.append(link['inwardIssue']['key'])
+        except KeyError:
+            keys.append(link['outwardIssue']['key'])
+    return keys
+
+def subtask_keys(subtasks: list) -> list:
+    try:
+        return [subtask['key'] for subtask in subtasks]
+    except KeyError:
+        logging.getLogger(__name__).error("subtasks exception logged")
+        raise
+
+def clean_description(description) -> str:
+    return strip_markup(str(description))
+
+
 class LogExtractor(BaseExtractor):
     
-    def __init__(self, name: str, verbose = None) -> None:
-        super().__init__(name = name, verbose = verbose) 
+    ''' Fields read by clean_json '''
+    FIELDS = ('watches', 'versions', 'fixVersions', 'issuelinks', 'subtasks', 'labels', 'priority', 'resolution',
+              'description', 'environment', 'assignee', 'aggregateprogress', 'progress', 'summary', 'resolutiondate',
+              'updated', 'timeoriginalestimate', 'aggregatetimeoriginalestimate', 'lastViewed', 'duedate', 'timeestimate',
+              'aggregatetimeestimate', 'timespent', 'parent', 'aggregatetimespent', 'reporter', 'workratio', 'created',
+              'votes', 'issuetype', 'project', 'creator', 'status', 'customfield_12706', 'customfield_10100', 'customfield_12383')
+    ''' Custom fields kept by remove_custom_fields '''
+    CUSTOM_FIELDS = ('customfield_12383', 'customfield_10100', 'customfield_12706')
+    ''' Columns of the excel: column, path in the fields, optional, transform. More columns can be added with EXTRA_COLUMNS in config.yml '''
+    MAPPING = (Field('versions', 'versions[0].name', True),
+               Field('PSP', 'customfield_12706[0]', True),
+               Field('fixVersions', 'fixVersions', True, first_version),
+               Field('issuelinks', 'issuelinks', True, link_keys),
+               Field('subtasks', 'subtasks', True, subtask_keys),
+               Field('labels', 'labels', True),
+               Field('priority', 'priority.name', True),
+               Field('resolution', 'resolution.name', True),
+               Field('description', 'description', True, clean_description),
+               Field('environment', 'environment', True),
+               Field('Business Representative', 'customfield_10100.emailAddress', True),
+               Field('Business Analyst', 'customfield_12383[0].emailAddress', True),
+               Field('assignee', 'assignee.displayName', True),
+               Field('aggregateprogress', 'aggregateprogress.percent', True),
+               Field('progress', 'progress.percent', True),
+               Field('summary', 'summary'),
+               Field('resolutiondate', 'resolutiondate'),
+               Field('updated', 'updated'),
+               Field('timeoriginalestimate', 'timeoriginalestimate'),
+               Field('aggregatetimeoriginalestimate', 'aggregatetimeoriginalestimate'),
+               Field('lastViewed', 'lastViewed'),
+               Field('duedate', 'duedate'),
+               Field('timeestimate', 'timeestimate'),
+               Field('aggregatetimeestimate', 'aggregatetimeestimate'),
+               Field('timespent', 'timespent'),
+               Field('parent', 'parent.key'),
+               Field('aggregatetimespent', 'aggregatetimespent'),
+               Field('reporter', 'reporter.displayName'),
+               Field('workratio', 'workratio'),
+               Field('created', 'created'),
+               Field('votes', 'votes.votes'),
+               Field('issuetype', 'issuetype.name'),
+               Field('project', 'project.name'),
+               Field('creator', 'creator.displayName'),
+               Field('status', 'status.name'))
+
+    def __init__(self, name: str, verbose = None, yml: dict = None, cfg = None, parse_cli: bool = True) -> None:
+        super().__init__(name = name, verbose = verbose, yml = yml, cfg = cfg, parse_cli = parse_cli)
         ''' constants '''
-        self.URL = self.yml['jira']['URL_1'] + self.yml['jira']['JQL'] + str(self.yml['jira']['URL_2'])
-        self.search = self.URL + self.yml['jira']['LINK'] + str(self.yml['jira']['START_AT'])
+        self.URL = self.search_url(self.yml['jira']['URL_1'], self.yml['jira']['JQL'], self.yml['jira']['URL_2'])
+        self.search = self.page_url(self.yml['jira']['START_AT'])
+        ''' watchers url -> email addresses, shared by every clean_json call of this run '''
+        self.watchers_cache = dict()
         
     def generate_excel(self, dictionary: dict) -> None:
         ''' Generate an excel from the dictionary provided in the input section '''
         ''' Transform certain columns into datetime objects so that excel can sort them properly ''' 
         timerz=time.strftime("%Y%m%d_%H%M%S_"+str(len(dictionary)))
         filename = str(self.name)+'_'+timerz+'.xlsx'
-        df = pd.DataFrame.from_dict(dictionary,orient='index')
-        
         date_headers = ['lastViewed', 'resolutiondate', 'updated', 'duedate', 'created']
-        for i in date_headers:
-            df[i] = pd.to_datetime(df[i], format="%Y/%m/%d", errors='ignore')
-            
-        writer = pd.ExcelWriter(filename, engine='xlsxwriter', options={'remove_timezone': True})
-        df.to_excel(writer, sheet_name='LEO and MISC', header=True, index=True)
-        
-        ''' Close the Pandas Excel writer and output the Excel file '''
-        self.save_excel(writer)
+        ''' Only the date columns are put in a dataframe, parsed column by column and written into copies of the rows '''
+        ''' the dictionary is returned by report() and handed to the store and the columnar copy, it keeps the JIRA strings '''
+        dates = self.normalize_dates(pd.DataFrame({header: [val.get(header) for val in dictionary.values()] for header in date_headers}, index=list(dictionary)), date_headers)
+        rows = {jira_key: dict(val) for jira_key, val in dictionary.items()}
+        for header in date_headers:
+            for jira_key, value in zip(dates.index, dates[header].tolist()):
+                if header in rows[jira_key]:
+                    rows[jira_key][header] = value
+        ''' Rows are streamed from the dictionary, no dataframe is built '''
+        with self.report_writer(filename) as writer:
+            writer.write_sheet('LEO and MISC', rows, dates=date_headers)
         self.test_file_creation
 
     @Memorize(func_name = "grab_tickets", file_name = os.path.basename(__file__))
     def grab_tickets(self, dictionary: dict) -> dict:
         return super().grab_tickets(dictionary) 
 
+    def prefetch_watchers(self, dictionary: dict) -> dict:
+        ''' Fetch the watchers of every watched issue concurrently, bounded by the fetch engine, before the mapping pass '''
+        ''' Return a lookup table: jira key -> watcher email addresses '''
+        urls = dict()
+        for jira_key, val in dictionary.items():
+            watches = val.get('watches') or dict()
+            if watches.get('watchCount', 0) > 0:
+                urls[jira_key] = watches['self']
+        missing = [url for url in set(urls.values()) if url not in self.watchers_cache]
+        try:
+            for url, value in zip(missing, self.fetch_json(missing)):
+                self.watchers_cache[url] = [watcher['emailAddress'] for watcher in value['watchers'] if len(watcher) > 0]
+        except ConnectionError as e:
+            if self.verbose is True:
+                print(e)
+            logging.getLogger(__name__).error(f'Could not fetch watches URL: {e}')
+            raise
+        except TypeError as e: # add to TEST
+            if self.verbose is True:
+                print(e)
+            logging.getLogger(__name__).error(f'Could not serialize the payload: {e}')
+            raise
+        return {jira_key: self.watchers_cache[url] for jira_key, url in urls.items()}
+
+    def prefetch(self, dictionary: dict) -> dict:
+        return {'watchers': self.prefetch_watchers(dictionary)}
+
 #    @Memorize(func_name = "clean_json", file_name = os.path.basename(__file__))
-    def clean_json(self, dictionary) -> dict:
+    def clean_json(self, dictionary, watchers: dict = None) -> dict:
         ''' Mapping function '''
         ''' Go through the json and pick the right values to add to the excel ''' 
         '''
@@ -47,134 +152,13 @@ class LogExtractor(BaseExtractor):
         # Business Representative: customfield_10100
         # PSP: customfield_12706
         '''
+        if watchers is None:
+            watchers = self.prefetch_watchers(dictionary)
         final_json = dict()
-        for jira_key, val in dictionary.items():
-            json_trash = dict()
-            ''' 
-            Use default dict so that KeyError exceptions dont need to be wrapped around every mapping function, also if val is not a dictionary it is simply ignored
-            Using a custom default dict to customize the class' __repr__ dunder method
-            '''
-            val_ = MyDefaultDict(val)
-            val = val_
-            
-            ''' Grab watchers: this next loop takes a while to get done ~ 4 minutes '''
-            if val["watches"]['watchCount'] > 0:
-                try:
-                    ''' no risk of denial of service because 1 request per ticket maximum '''
-                    value = requests.get(val['watches']['self'], headers = {"Authorization": "Basic %s" % self.cfg.u, "Content-Type": "application/json"}, verify = False).json()
-                except ConnectionError as e:
-                    if self.verbose is True:
-                        print(e)
-                    logging.getLogger(__name__).error(f'Could not fetch watches URL: {e}')
-                    raise
-                except TypeError as e: # add to TEST
-                    if self.verbose is True:
-                        print(e)
-                    logging.getLogger(__name__).error(f'Could not serialize the payload: {e}')
-                    raise
-                    
-                watchers = value['watchers']
-                _liste = [watcher['emailAddress'] for watcher in watchers if len(watcher) > 0]
-                json_trash['watches'] = _liste
-            
-            ''' Versions '''
-            if len(val['versions']) > 0 and val['versions'][0]['name'] is not None:
-                json_trash['versions'] = val['versions'][0]['name']
-
-            ''' PSP '''
-            if len(val['customfield_12706']) > 0:
-                json_trash['PSP'] = val['customfield_12706'][0]
-
-            ''' fixVersions '''
-            if len(val['fixVersions']) > 0:
-                try:
-                    json_trash['fixVersions'] = val['fixVersions'][0]['name']
-                except KeyError:
-                    logging.getLogger(__name__).error("fixVersions exception logged")
-                    raise
-            
-            ''' Issue links ''' 
-            issuelinks = list()
-            if len(val['issuelinks']) > 0:
-                for i in range(len(val['issuelinks'])):
-                    try:
-                        issuelinks.append(val['issuelinks'][i]['inwardIssue']['key'])
-                    except KeyError:
-                        issuelinks.append(val['issuelinks'][i]['outwardIssue']['key'])
-                json_trash['issuelinks'] = issuelinks
-            
-            ''' Subtasks '''
-            subtasks = list()
-            if len(val['subtasks']) > 0:
-                for i in range(len(val['subtasks'])):
-                    try:
-                        subtasks.append(val['subtasks'][i]['key'])
-                    except KeyError:
-                        logging.getLogger(__name__).error("subtasks exception logged")
-                        raise
-                json_trash['subtasks'] = subtasks
-            
-            ''' Lables'''
-            if len(val['labels']) > 0:
-                json_trash['labels'] = val['labels']
-            
-            ''' Priority '''
-            if val['priority'] is not None:
-                json_trash['priority'] = val['priority']['name']
-
-            ''' Resolution '''
-            if val['resolution'] is not None:
-                json_trash['resolution'] = val['resolution']['name']
-            
-            ''' Description '''
-            if val['description'] is not None:
-                json_trash['description'] = re.sub('\{[^(aeiu)]*\}', '', str(val['description']))
-            
-            ''' Environment '''
-            if val['environment'] is not None:
-                json_trash['environment'] = val['environment']
-
-            ''' Business Representative '''
-            if val['customfield_10100'] is not None:
-                json_trash['Business Representative'] = val['customfield_10100']['emailAddress']
-            
-            ''' Business Analyst '''
-            if val['customfield_12383'] is not None:
-                json_trash['Business Analyst'] = val['customfield_12383'][0]['emailAddress']
-            
-            ''' Assignee '''
-            if val['assignee'] is not None:
-                json_trash['assignee'] = val['assignee']['displayName']
-            
-            ''' Aggregateprogress '''
-            if 'percent' in val['aggregateprogress']:
-                json_trash['aggregateprogress'] = val['aggregateprogress']['percent']
-            
-            ''' Progress '''
-            if 'percent' in val['progress']:
-                json_trash['progress'] = val['progress']['percent']
-            
-            json_trash['summary'] = val['summary']
-            json_trash['resolutiondate'] = val['resolutiondate']
-            json_trash['updated'] = val['updated']
-            json_trash['timeoriginalestimate'] = val['timeoriginalestimate']
-            json_trash['aggregatetimeoriginalestimate'] = val['aggregatetimeoriginalestimate']
-            json_trash['lastViewed'] = val['lastViewed']
-            json_trash['duedate'] = val['duedate']
-            json_trash['timeestimate'] = val['timeestimate']
-            json_trash['aggregatetimeestimate'] = val['aggregatetimeestimate']
-            json_trash['timespent'] = val['timespent']
-            json_trash['parent'] = val['parent']['key']
-            json_trash['aggregatetimespent'] = val['aggregatetimespent']
-            json_trash['reporter'] = val['reporter']['displayName']
-            json_trash['workratio'] = val['workratio']
-            json_trash['created'] = val['created']
-            json_trash['votes'] = val['votes']['votes']
-            json_trash['issuetype'] = val['issuetype']['name']
-            json_trash['project'] = val['project']['name']
-            json_trash['creator'] = val['creator']['displayName']
-            json_trash['status'] = val['status']['name']
-
+        for jira_key, json_trash in self.map_fields(dictionary).items():
+            ''' Watchers were prefetched for the whole report, they stay the first column '''
+            if jira_key in watchers:
+                json_trash = {'watches': watchers[jira_key], **json_trash}
             final_json[jira_key] = json_trash
             
         return final_json
@@ -191,10 +175,8 @@ def main(name):
         extractor.run_tests()
     
     extractor.startTimer        
-    json = extractor.grab_tickets(dict())
-    json = extractor.remove_custom_fields(json, 'customfield_12383', 'customfield_10100', 'customfield_12706')
-    json = extractor.clean_json(json)
-    extractor.generate_excel(json)
+    json = extractor.grab_incremental(dict())
+    extractor.report(json)
     extractor.closeTimer
 
 def test_fixtures(NAME) -> LogExtractor:
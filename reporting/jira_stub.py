@@ -0,0 +1,277 @@
+import argparse, json, random, re, threading, time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+''' /rest/api/2/search, /rest/api/2/issue/T2L-1, /rest/api/2/issue/T2L-1/watchers, /rest/api/2/issueLink/1000 '''
+_SEARCH = re.compile(r'^/rest/api/2/search$')
+_ISSUE = re.compile(r'^/rest/api/2/issue/([A-Z][A-Z0-9_]*)-(\d+)(/watchers)?$')
+_ISSUELINK = re.compile(r'^/rest/api/2/issueLink/(\d+)$')
+_KEYS = re.compile(r'\bkey\s+in\s*\(([^)]*)\)', re.IGNORECASE)
+
+''' Issues matched by the searches, and the CM, deployment and bug tickets they link to '''
+PROJECT = 'T2L'
+LINKED_PROJECT = 'CM'
+ISSUE_TYPES = ('Story', 'Bug', 'Task', 'Test', 'New Feature', 'Epic')
+LINKED_TYPES = ('Normal Change', 'Deployment', 'Bug', 'Standard Change')
+STATUSES = ('Open', 'In Progress', 'Resolved', 'Closed')
+PRIORITIES = ('Blocker', 'Critical', 'Major', 'Minor')
+ENVIRONMENTS = ('EU TEST', 'EU UAT')
+XRAY_RESULTS = (0, 2, 3, 1000)
+''' a few custom fields no report reads, remove_custom_fields drops them when the search has no projection '''
+NOISE_FIELDS = ('customfield_10001', 'customfield_10002', 'customfield_11000', 'customfield_14000')
+EPOCH = datetime(2019, 1, 1)
+
+
+def timestamp(rng: random.Random) -> str:
+    ''' JIRA REST timestamp, 2019-03-04T10:21:33.000+0100 '''
+    return (EPOCH + timedelta(seconds=rng.randrange(365 * 86400))).strftime('%Y-%m-%dT%H:%M:%S.000+0100')
+
+
+def user(number: int) -> dict:
+    name = f'user{number % 50}'
+    return {'name': name, 'displayName': f'User {number % 50}', 'emailAddress': f'{name}@jira.com'}
+
+
+class JiraStub:
+    '''
+    Local stand-in of the JIRA REST API for the benchmarks and the offline tests.
+    Serves synthetic issues on the search, issue, watchers and issueLink endpoints of a ThreadingHTTPServer.
+    Every issue is generated from its number and the seed when it is asked for, nothing is kept in memory,
+    so the same issue is returned by every endpoint and by every run.
+    The searches match T2L-1 to T2L-<issues> whatever the JQL, except key in (...) which returns the keys asked.
+    The fields and maxResults parameters are honoured, total is written before issues like JIRA does.
+    Usage:
+    with JiraStub(issues = 10000, latency = 0.05) as jira:
+        requests.get(jira.url + '/rest/api/2/search?jql=project = T2L&fields=summary&startAt=1000')
+    '''
+    def __init__(self, issues: int = 1000, latency: float = 0.0, page_size: int = 1000, links: int = 2, watched: float = 0.1,
+                 description_size: int = 200, seed: int = 0, host: str = '127.0.0.1', port: int = 0) -> None:
+        ''' latency: seconds added to every answer. page_size: cap of maxResults, JIRA caps it at 1000 '''
+        ''' links: issue links per issue. watched: share of the issues with watchers. description_size: characters per description '''
+        self.issues = issues
+        self.latency = latency
+        self.page_size = page_size
+        self.links = links
+        self.watched = watched
+        self.description_size = description_size
+        self.seed = seed
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+        self.thread = None
+        self.lock = threading.Lock()
+        ''' endpoint -> calls served '''
+        self.requests = {'search': 0, 'issue': 0, 'watchers': 0, 'issuelink': 0}
+
+    def __enter__(self) -> 'JiraStub':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def start(self) -> 'JiraStub':
+        self.thread = threading.Thread(target=self.server.serve_forever, name='jira-stub', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, endpoint: str) -> None:
+        with self.lock:
+            self.requests[endpoint] += 1
+
+    def rng(self, project: str, number: int) -> random.Random:
+        return random.Random(f'{self.seed}-{project}-{number}')
+
+    def exists(self, project: str, number: int) -> bool:
+        if project == PROJECT:
+            return 1 <= number <= self.issues
+        return project == LINKED_PROJECT and 1 <= number <= self.issues * self.links
+
+    def fields(self, project: str, number: int) -> dict:
+        ''' Every field of one issue '''
+        if project == LINKED_PROJECT:
+            return self.linked_fields(number)
+        rng = self.rng(project, number)
+        key = f'{project}-{number}'
+        issuetype = ISSUE_TYPES[number % len(ISSUE_TYPES)]
+        watchers = rng.randint(1, 5) if rng.random() < self.watched else 0
+        resolved = rng.random() < 0.5
+        words = ('{code}', 'lorem', 'ipsum', '{color:#ff0000}', 'dolor', '{color}', 'amet', '\n', 'h1. Title', '*bold*')
+        description = ' '.join(rng.choice(words) for _ in range(self.description_size // 6))[:self.description_size]
+        fields = {'summary': f'Synthetic {issuetype.lower()} {number}',
+                  'issuetype': {'name': issuetype, 'subtask': False},
+                  'project': {'key': project, 'name': project},
+                  'status': {'name': rng.choice(STATUSES)},
+                  'priority': {'name': rng.choice(PRIORITIES)},
+                  'resolution': {'name': 'Done'} if resolved else None,
+                  'resolutiondate': timestamp(rng) if resolved else None,
+                  'reporter': user(rng.randrange(1000)),
+                  'creator': user(rng.randrange(1000)),
+                  'assignee': user(rng.randrange(1000)) if rng.random() < 0.8 else None,
+                  'created': timestamp(rng),
+                  'updated': timestamp(rng),
+                  'lastViewed': timestamp(rng) if rng.random() < 0.3 else None,
+                  'duedate': timestamp(rng)[:10] if rng.random() < 0.3 else None,
+                  'description': description,
+                  'environment': None,
+                  'labels': rng.sample(('EU', 'LU', 'T24', 'TAP', 'hotfix'), rng.randint(0, 2)),
+                  'versions': [{'name': '19.06.EU '}],
+                  'fixVersions': [{'name': rng.choice(('19.07.EU ', '19.08.EU '))}],
+                  'issuelinks': [{'id': str(number * self.links + j), 'type': {'name': 'Relates'},
+                                  'outwardIssue': {'key': f'{LINKED_PROJECT}-{(number - 1) * self.links + j + 1}'}} for j in range(self.links)],
+                  'subtasks': list(),
+                  'watches': {'self': f'{self.url}/rest/api/2/issue/{key}/watchers', 'watchCount': watchers, 'isWatching': False},
+                  'votes': {'votes': rng.randint(0, 3), 'hasVoted': False},
+                  'progress': {'progress': 0, 'total': 0},
+                  'aggregateprogress': {'progress': 0, 'total': 0},
+                  'timeoriginalestimate': None,
+                  'aggregatetimeoriginalestimate': None,
+                  'timeestimate': None,
+                  'aggregatetimeestimate': None,
+                  'timespent': None,
+                  'aggregatetimespent': None,
+                  'workratio': -1,
+                  'customfield_12706': [rng.choice(('P3304', 'P3356'))],
+                  'customfield_10100': user(rng.randrange(1000)),
+                  'customfield_12383': [user(rng.randrange(1000))],
+                  'customfield_11880': [{'value': rng.choice(ENVIRONMENTS)}],
+                  'customfield_10091': timestamp(rng),
+                  'customfield_13180': f'{rng.randint(1, 8)}h',
+                  'customfield_12705': [rng.choice(('T24', 'TAP', 'LEO'))],
+                  'customfield_16880': {'value': rng.choice(('Standard', 'Emergency'))},
+                  'customfield_17284': {'steps': [{'index': 1, 'step': f'Step {number}', 'data': 'data', 'result': 'expected'}]},
+                  'customfield_17290': {'statuses': [{'statusResults': [{'latest': rng.choice(XRAY_RESULTS)}]}]}}
+        for field in NOISE_FIELDS:
+            fields[field] = rng.random()
+        return fields
+
+    def linked_fields(self, number: int) -> dict:
+        rng = self.rng(LINKED_PROJECT, number)
+        return {'summary': f'Linked ticket {number}',
+                'issuetype': {'name': LINKED_TYPES[number % len(LINKED_TYPES)], 'subtask': False},
+                'status': {'name': rng.choice(STATUSES)},
+                'customfield_11483': timestamp(rng),
+                'customfield_11880': [{'value': rng.choice(ENVIRONMENTS)}],
+                'customfield_10091': timestamp(rng)}
+
+    def issue(self, project: str, number: int, fields: list = None) -> dict:
+        ''' One issue as the search and issue endpoints return it, restricted to fields when given '''
+        values = self.fields(project, number)
+        if fields is not None and '*all' not in fields:
+            values = {field: values[field] for field in fields if field in values}
+        key = f'{project}-{number}'
+        return {'id': str(number), 'key': key, 'self': f'{self.url}/rest/api/2/issue/{key}', 'fields': values}
+
+    def search(self, query: dict) -> dict:
+        jql = query.get('jql', [''])[0]
+        fields = query['fields'][0].split(',') if 'fields' in query else None
+        start_at = int(query.get('startAt', ['0'])[0])
+        max_results = min(int(query.get('maxResults', [str(self.page_size)])[0]), self.page_size)
+        keys = _KEYS.search(jql)
+        if keys is None:
+            numbers = [(PROJECT, number) for number in range(1, self.issues + 1)]
+        else:
+            ''' keys that do not exist are left out, as with validateQuery=warn '''
+            numbers = list()
+            for key in keys.group(1).split(','):
+                project, _, number = key.strip().strip('"\'').rpartition('-')
+                if number.isdigit() and self.exists(project, int(number)):
+                    numbers.append((project, int(number)))
+        page = numbers[start_at:start_at + max_results]
+        ''' total comes before issues so that IssueStream knows it before the first issue '''
+        return {'expand': 'schema,names', 'startAt': start_at, 'maxResults': max_results, 'total': len(numbers),
+                'issues': [self.issue(project, number, fields) for project, number in page]}
+
+    def watchers(self, project: str, number: int) -> dict:
+        count = self.fields(project, number)['watches']['watchCount'] if project == PROJECT else 0
+        watchers = [user(number + i) for i in range(count)]
+        return {'self': f'{self.url}/rest/api/2/issue/{project}-{number}/watchers', 'isWatching': False,
+                'watchCount': count, 'watchers': watchers}
+
+    def issuelink(self, link_id: int) -> dict:
+        ''' Links are numbered issue number * links + position, see the issuelinks field '''
+        number, position = divmod(link_id, self.links)
+        if not self.exists(PROJECT, number):
+            return None
+        linked = (number - 1) * self.links + position + 1
+        return {'id': str(link_id), 'type': {'name': 'Relates', 'inward': 'relates to', 'outward': 'relates to'},
+                'inwardIssue': {'key': f'{PROJECT}-{number}'}, 'outwardIssue': {'key': f'{LINKED_PROJECT}-{linked}'}}
+
+    def answer(self, path: str, query: dict) -> tuple:
+        ''' Status and payload of one GET '''
+        if _SEARCH.match(path):
+            self.count('search')
+            return 200, self.search(query)
+        match = _ISSUE.match(path)
+        if match is not None:
+            project, number, watchers = match.group(1), int(match.group(2)), match.group(3)
+            self.count('issue' if watchers is None else 'watchers')
+            if not self.exists(project, number):
+                return 404, {'errorMessages': ['Issue Does Not Exist'], 'errors': {}}
+            if watchers is not None:
+                return 200, self.watchers(project, number)
+            return 200, self.issue(project, number, query['fields'][0].split(',') if 'fields' in query else None)
+        match = _ISSUELINK.match(path)
+        if match is not None:
+            self.count('issuelink')
+            link = self.issuelink(int(match.group(1)))
+            if link is None:
+                return 404, {'errorMessages': ['No issue link with id ' + match.group(1)], 'errors': {}}
+            return 200, link
+        return 404, {'errorMessages': ['Unknown endpoint ' + path], 'errors': {}}
+
+    def handler(self) -> type:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            ''' keep-alive, the pooled sessions of the extractors reuse their connections '''
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self) -> None:
+                parts = urlsplit(self.path)
+                if stub.latency > 0:
+                    time.sleep(stub.latency)
+                status, payload = stub.answer(parts.path, parse_qs(parts.query))
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json;charset=UTF-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        return Handler
+
+
+def generate_argparser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Serve synthetic JIRA issues on the REST endpoints read by the extractors')
+    parser.add_argument('-n', '--issues', type = int, help = 'issues matched by the searches', default=1000)
+    parser.add_argument('-l', '--latency', type = float, help = 'seconds added to every answer', default=0.0)
+    parser.add_argument('-p', '--port', type = int, help = 'port to listen on', default=8080)
+    parser.add_argument('--page-size', type = int, help = 'cap of maxResults', default=1000)
+    parser.add_argument('--links', type = int, help = 'issue links per issue', default=2)
+    parser.add_argument('--watched', type = float, help = 'share of the issues with watchers', default=0.1)
+    parser.add_argument('--description-size', type = int, help = 'characters per description', default=200)
+    parser.add_argument('--seed', type = int, default=0)
+    return parser
+
+def main() -> None:
+    ''' Point URL_1 and SEARCH of config.yml at the printed url to run a report against the stub '''
+    args = generate_argparser().parse_args()
+    stub = JiraStub(issues = args.issues, latency = args.latency, page_size = args.page_size, links = args.links, watched = args.watched,
+                    description_size = args.description_size, seed = args.seed, port = args.port)
+    print(f"JIRA stub serving {args.issues} issues on {stub.url}/rest/api/2/search?jql=")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import re
+from typing import Iterable
+
+
+r'''
+JIRA wiki markup such as {code}, {noformat} or {color:#ff0000} is removed from the descriptions with the historical rule:
+re.sub('\{[^(aeiu)]*\}', '', text)
+The class [^(aeiu)] accepts the braces themselves, so a match starts at the first '{' of a run of accepted characters
+and ends at the last '}' of that same run. Matches never cross a run boundary.
+The historical pattern backtracks from every '{' of a run without any '}', which is quadratic on long runs of braces.
+Here every run is scanned once: the greedy part below never needs to backtrack and the closing brace is found with rfind.
+'''
+_OPENING = re.compile(r'\{[^(aeiu)]*')
+
+
+def strip_markup(text: str) -> str:
+    r''' Same output as re.sub('\{[^(aeiu)]*\}', '', text) in linear time '''
+    if '{' not in text:
+        return text
+    parts = list()
+    last = 0
+    for match in _OPENING.finditer(text):
+        closing = text.rfind('}', match.start(), match.end())
+        if closing == -1:
+            continue
+        parts.append(text[last:match.start()])
+        last = closing + 1
+    parts.append(text[last:])
+    return ''.join(parts)
+
+
+def strip_markup_all(texts: Iterable) -> list:
+    ''' Batch API over a whole description column, None stays None and other values are read as text '''
+    return [None if text is None else strip_markup(text if isinstance(text, str) else str(text)) for text in texts]
+
+
+def _benchmark() -> None:
+    ''' Compare with the historical re.sub on generated descriptions, re.sub is skipped where it would take minutes '''
+    import random, string, time
+    random.seed(0)
+    alphabet = string.ascii_letters + ' {}()\n:#|*'
+    ''' name -> (description, run re.sub) '''
+    cases = {
+        'plain 1MB': (''.join(random.choice(string.ascii_letters + ' ') for _ in range(2**20)), True),
+        'markup 4MB': ('{code}' + 'x' * 2**22 + '{code} ' + '{color:#ff0000}red{color}' * 1000, True),
+        'random 1MB': (''.join(random.choice(alphabet) for _ in range(2**20)), True),
+        'open braces 20kB': ('{' * 20000, True),
+        'open braces 4MB': ('{' * 2**22, False),
+    }
+    legacy = re.compile(r'\{[^(aeiu)]*\}')
+    for name, (text, compare) in cases.items():
+        start = time.perf_counter()
+        stripped = strip_markup(text)
+        linear = time.perf_counter() - start
+        if compare is True:
+            start = time.perf_counter()
+            assert legacy.sub('', text) == stripped
+            print(f"{name:>18}: strip_markup {linear:8.4f}s  re.sub {time.perf_counter() - start:8.4f}s")
+        else:
+            print(f"{name:>18}: strip_markup {linear:8.4f}s  re.sub skipped (quadratic)")
+
+
+if __name__ == '__main__':
+    _benchmark()
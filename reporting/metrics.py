@@ -0,0 +1,174 @@
+import json, os, sys, threading, time
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    ''' Windows, the peak working set of psutil is read instead when it is installed '''
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def peak_memory() -> int:
+    ''' Peak resident memory of the process in bytes, None when the platform does not tell '''
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        ''' kilobytes on Linux, bytes on macOS '''
+        return peak if sys.platform == 'darwin' else peak * 1024
+    if psutil is not None:
+        return getattr(psutil.Process().memory_info(), 'peak_wset', None)
+    return None
+
+
+def received(response) -> int:
+    ''' Bytes read from the socket for a consumed response, the compressed size when JIRA gzips the answer '''
+    try:
+        return int(response.raw.tell())
+    except (AttributeError, TypeError, ValueError):
+        return 0
+
+
+def _label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RunMetrics:
+    '''
+    Spans, counters and peak memory of one report run.
+    A span adds its duration to the stage it names, the stages run in threads add up their thread time,
+    so decode can exceed the wall time of fetch. Counters are free-form: issues, bytes...
+    The calls, retries, throttled calls and failures come from the RequestScheduler of the process,
+    counted from start() on, together with the peak of calls in flight per endpoint.
+    save() writes a JSON summary into folder and, when textfile is set, a Prometheus textfile for the node exporter.
+    With a profiling.Profiler every span is also a stage of the profiler.
+    Usage:
+    metrics = RunMetrics('JIRA', folder = 'JIRA', scheduler = extractor.scheduler)
+    with metrics.span('fetch'):
+        json = extractor.grab_tickets(dict())
+    metrics.count('issues', len(json))
+    metrics.save()
+    '''
+    def __init__(self, name: str, folder: str = None, textfile: str = None, scheduler = None, profiler = None) -> None:
+        self.name = name
+        self.folder = folder
+        self.textfile = textfile
+        self.scheduler = scheduler
+        self.profiler = profiler
+        self.lock = threading.Lock()
+        ''' stage -> {'calls': ..., 'seconds': ...} in the order the stages first ran '''
+        self.stages = dict()
+        self.counters = dict()
+        self.started = None
+        self.finished = None
+        self.clock = None
+        self.seconds = None
+        self.baseline = dict()
+
+    def start(self) -> 'RunMetrics':
+        self.started = time.time()
+        self.clock = time.perf_counter()
+        if self.scheduler is not None:
+            self.baseline = dict(self.scheduler.counters)
+        return self
+
+    def stop(self) -> 'RunMetrics':
+        self.finished = time.time()
+        if self.clock is not None:
+            self.seconds = time.perf_counter() - self.clock
+        return self
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            if self.profiler is None:
+                yield self
+            else:
+                with self.profiler.stage(stage):
+                    yield self
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            entry = self.stages.setdefault(stage, {'calls': 0, 'seconds': 0.0})
+            entry['calls'] += 1
+            entry['seconds'] += seconds
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def requests(self) -> dict:
+        ''' Calls of the scheduler since start(), every report of the process when several run at once '''
+        if self.scheduler is None:
+            return dict()
+        return {name: value - self.baseline.get(name, 0) for name, value in self.scheduler.counters.items()}
+
+    def summary(self) -> dict:
+        with self.lock:
+            stages = {stage: {'calls': entry['calls'], 'seconds': round(entry['seconds'], 4)} for stage, entry in self.stages.items()}
+            counters = dict(self.counters)
+        return {'report': self.name,
+                'started': None if self.started is None else time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                'seconds': None if self.seconds is None else round(self.seconds, 4),
+                'stages': stages,
+                'counters': counters,
+                'requests': self.requests(),
+                'peak_in_flight': dict(self.scheduler.peak) if self.scheduler is not None else dict(),
+                'peak_memory_bytes': peak_memory()}
+
+    def lines(self) -> list:
+        ''' One readable line per stage for the log '''
+        summary = self.summary()
+        lines = [f"{stage}: {entry['seconds']:.3f}s in {entry['calls']} call(s)" for stage, entry in summary['stages'].items()]
+        lines.append(', '.join(f"{name} {value}" for name, value in {**summary['counters'], **summary['requests']}.items()))
+        if summary['peak_memory_bytes'] is not None:
+            lines.append(f"peak memory {summary['peak_memory_bytes'] / 2**20:.0f} MB")
+        return lines
+
+    def prometheus(self) -> str:
+        ''' Prometheus text exposition format, one gauge per stage, counter and request outcome '''
+        summary = self.summary()
+        report = _label(self.name)
+        lines = list()
+
+        def metric(name: str, help: str, samples: list) -> None:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                lines.append(f'{name}{{report="{report}"{labels}}} {value}')
+
+        metric('jira_report_run_seconds', 'Wall time of the last run', [('', summary['seconds'] or 0)])
+        metric('jira_report_last_run_timestamp_seconds', 'End of the last run', [('', round(self.finished or time.time(), 3))])
+        metric('jira_report_stage_seconds', 'Seconds spent in each stage of the last run',
+               [(f',stage="{_label(stage)}"', entry['seconds']) for stage, entry in summary['stages'].items()])
+        metric('jira_report_count', 'Counters of the last run', [(f',name="{_label(name)}"', value) for name, value in summary['counters'].items()])
+        metric('jira_report_requests', 'JIRA calls of the last run by outcome',
+               [(f',outcome="{_label(name)}"', value) for name, value in summary['requests'].items()])
+        if summary['peak_memory_bytes'] is not None:
+            metric('jira_report_peak_memory_bytes', 'Peak resident memory of the process', [('', summary['peak_memory_bytes'])])
+        return '\n'.join(lines) + '\n'
+
+    def save(self) -> list:
+        ''' Write the JSON summary and the Prometheus textfile, return the paths written '''
+        paths = list()
+        if self.folder is not None:
+            os.makedirs(self.folder, exist_ok=True)
+            stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(self.started or time.time()))
+            path = os.path.join(self.folder, f'{self.name}_{stamp}_metrics.json')
+            with open(path, 'w') as file:
+                json.dump(self.summary(), file, indent=2)
+            paths.append(path)
+        if self.textfile:
+            ''' the collector may read the file at any time, it is replaced in one step '''
+            folder = self.textfile if os.path.isdir(self.textfile) else os.path.dirname(os.path.abspath(self.textfile))
+            path = os.path.join(self.textfile, f'{self.name}.prom') if os.path.isdir(self.textfile) else self.textfile
+            temporary = os.path.join(folder, f'.{os.path.basename(path)}.{os.getpid()}')
+            with open(temporary, 'w') as file:
+                file.write(self.prometheus())
+            os.replace(temporary, path)
+            paths.append(path)
+        return paths
@@ -0,0 +1,183 @@
+import cProfile, io, logging, os, pstats, sys, threading, time, tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+''' stages profiled by default, decode runs once per page in the fetch threads and is seen through fetch '''
+STAGES = ('fetch', 'linked_fetch', 'remove_custom_fields', 'clean_json', 'generate_excel', 'generate_email')
+MODES = ('cprofile', 'sampling')
+
+''' cProfile profiles the thread that enables it and only one can be enabled at a time, nested and concurrent stages run unprofiled '''
+_cprofile = threading.Lock()
+''' tracemalloc is global to the process: the stages of the reports a batch runs in parallel share it, the last one out stops it '''
+_tracemalloc = threading.Lock()
+_tracers = 0
+''' tracemalloc was started by a stage and not by the caller, e.g. python -X tracemalloc '''
+_started = False
+
+
+class Sampler:
+    '''
+    Sampling profiler: a thread reads the stack of every other thread every interval seconds.
+    It sees the fetch and clean threads that cProfile misses, at a cost that does not depend on the number of calls.
+    The stacks are counted in the folded format of flamegraph.pl and speedscope: root;caller;callee count
+    '''
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.sample, name='profiling-sampler', daemon=True)
+
+    def start(self) -> 'Sampler':
+        self.thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self.done.set()
+        self.thread.join()
+        return self.stacks
+
+    def sample(self) -> None:
+        own = threading.get_ident()
+        while not self.done.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = list()
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def top(self, limit: int) -> str:
+        ''' Functions with the most samples, on top of the stack (self) and anywhere in it (total) '''
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        lines = [f'{self.samples} samples every {self.interval * 1000:g} ms', f"{'self':>8} {'total':>8}  function"]
+        for frame, count in own.most_common(limit):
+            lines.append(f'{count:>8} {total[frame]:>8}  {frame}')
+        return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    '''
+    Profile the stages of a run on demand: PROFILE in config.yml or --profile on the command line.
+    mode cprofile: deterministic profile of the thread that runs the stage, a .prof (snakeviz, pstats) and the top functions in a .txt
+    mode sampling: stacks of every thread sampled every interval, a .folded (flamegraph.pl, speedscope) and the top functions in a .txt
+    memory: tracemalloc top allocations of the stage by line and its peak, in a .memory.txt. tracemalloc slows the stage down
+    Every file is written to folder as soon as its stage ends: <name>_<stamp>_<stage>.<ext>
+    Disabled, or for a stage that is not in stages, stage() does nothing.
+    Usage:
+    profiler = Profiler('JIRA', 'profiles', enabled = True, mode = 'sampling')
+    with profiler.stage('clean_json'):
+        extractor.clean_json(json)
+    '''
+    def __init__(self, name: str, folder: str, enabled: bool = False, mode: str = 'cprofile', memory: bool = True, top: int = 25,
+                 stages: tuple = STAGES, interval: float = 0.005) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode}, expected one of {MODES}")
+        self.name = name
+        self.folder = folder
+        self.enabled = enabled
+        self.mode = mode
+        self.memory = memory
+        self.top = top
+        self.stages = None if stages is None else set(stages)
+        self.interval = interval
+        self.stamp = time.strftime('%Y%m%d_%H%M%S')
+        ''' paths written so far '''
+        self.files = list()
+
+    def profiled(self, stage: str) -> bool:
+        return self.enabled is True and (self.stages is None or stage in self.stages)
+
+    @contextmanager
+    def stage(self, stage: str):
+        if not self.profiled(stage):
+            yield self
+            return
+        with self.trace_memory(stage):
+            if self.mode == 'sampling':
+                sampler = Sampler(self.interval).start()
+                try:
+                    yield self
+                finally:
+                    sampler.stop()
+                    self.save_sampling(stage, sampler)
+            elif _cprofile.acquire(blocking=False) is False:
+                logging.getLogger(__name__).info(f"{self.name} {stage} not profiled, another stage holds cProfile")
+                yield self
+            else:
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError as e:
+                    ''' Python 3.12+: another profiler of the process is active '''
+                    _cprofile.release()
+                    logging.getLogger(__name__).info(f"{self.name} {stage} not profiled: {e}")
+                    yield self
+                    return
+                try:
+                    yield self
+                finally:
+                    profile.disable()
+                    _cprofile.release()
+                    self.save_cprofile(stage, profile)
+
+    @contextmanager
+    def trace_memory(self, stage: str):
+        global _tracers, _started
+        if self.memory is not True:
+            yield
+            return
+        with _tracemalloc:
+            if _tracers == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started = True
+            _tracers += 1
+            ''' Python 3.9+, before that the peak covers the whole tracing. Concurrent stages share the peak '''
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            with _tracemalloc:
+                after = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                _tracers -= 1
+                if _tracers == 0 and _started is True:
+                    tracemalloc.stop()
+                    _started = False
+            lines = [f'{self.name} {stage}: peak {peak / 2**20:.1f} MB traced, top {self.top} allocations by line']
+            lines.extend(str(difference) for difference in after.compare_to(before, 'lineno')[:self.top])
+            self.write(stage, 'memory.txt', '\n'.join(lines) + '\n')
+
+    def save_cprofile(self, stage: str, profile: cProfile.Profile) -> None:
+        self.files.append(self.path(stage, 'prof'))
+        profile.dump_stats(self.files[-1])
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(self.top)
+        self.write(stage, 'txt', stream.getvalue())
+
+    def save_sampling(self, stage: str, sampler: Sampler) -> None:
+        self.write(stage, 'folded', ''.join(f'{stack} {count}\n' for stack, count in sampler.stacks.most_common()))
+        self.write(stage, 'txt', sampler.top(self.top))
+
+    def path(self, stage: str, extension: str) -> str:
+        os.makedirs(self.folder, exist_ok=True)
+        return os.path.join(self.folder, f'{self.name}_{self.stamp}_{stage}.{extension}')
+
+    def write(self, stage: str, extension: str, text: str) -> None:
+        path = self.path(stage, extension)
+        with open(path, 'w') as file:
+            file.write(text)
+        self.files.append(path)
+        logging.getLogger(__name__).info(f"Profile of {self.name} {stage} written to {path}")
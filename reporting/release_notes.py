@@ -1,28 +1,55 @@
-import time, re, argparse, os
-import pandas as pd
+from __future__ import annotations
+import time, argparse, os
 from base_class import BaseExtractor
-from pandas import DataFrame
-from datetime import datetime
-import img.RESOURCES as RESOURCES
 from decorator_base import Memorize
+from field_mapping import Field
+from markup import strip_markup_all
+from utils import lazy_import
+pd = lazy_import('pandas')
 
 NAME = 'JIRA_Release_Notes'
 
+def release_names(versions: list) -> str:
+    return ', '.join(version['name'] for version in versions)
+
+def as_list(release_version) -> list:
+    ''' RELEASE_VERSION and -r accept one release or several '''
+    if isinstance(release_version, (list, tuple)):
+        return list(release_version)
+    return [release_version]
+
 class ReleaseNoteExtractor(BaseExtractor):
     
-    def __init__(self, name: str, verbose = None) -> None:
-        super().__init__(name = name, verbose = verbose) 
+    ''' Fields read by clean_json '''
+    FIELDS = ('issuetype', 'summary', 'status', 'description', 'reporter', 'assignee', 'customfield_12706', 'fixVersions')
+    ''' Custom fields kept by remove_custom_fields '''
+    CUSTOM_FIELDS = ('customfield_12706',)
+
+    ''' Columns of the excel and of the email: column, path in the fields, optional, transform '''
+    MAPPING = (Field('Issue Type', 'issuetype.name'),
+               Field('Summary', 'summary'),
+               Field('Status', 'status.name'),
+               Field('Description', 'description'),
+               Field('Reporter', 'reporter.displayName'),
+               Field('Assignee', 'assignee.displayName', True),
+               Field('PSP', 'customfield_12706[0]', True),
+               Field('Fix Version', 'fixVersions', True, release_names))
+
+    def __init__(self, name: str, verbose = None, yml: dict = None, cfg = None, parse_cli: bool = True) -> None:
+        super().__init__(name = name, verbose = verbose, yml = yml, cfg = cfg, parse_cli = parse_cli)
         ''' These parameters can be overriden by CLI parameters with load_argparser() '''
         self.system = self.yml['release']['SYSTEM']
         self.deploy_date = self.yml['release']['DEPLOY_DATE']
         self.release_version = self.yml['release']['RELEASE_VERSION']
+        ''' every release is fetched by the same search, fixVersion in ('19.07.EU ', '19.08.EU ') '''
+        self.release_versions = [str(version) for version in as_list(self.release_version)]
         ''' constants '''
-        self.URL = self.yml['release']['URL_1'] + str(self.release_version) + self.yml['release']['URL_2']
-        self.search = self.URL + self.yml['jira']['LINK'] + str(self.yml['jira']['START_AT'])
+        self.URL = self.search_url(self.yml['release']['URL_1'], "', '".join(self.release_versions), self.yml['release']['URL_2'])
+        self.search = self.page_url(self.yml['jira']['START_AT'])
         
     def generate_argparser(self) -> argparse.ArgumentParser:
         parser = super().generate_argparser()
-        parser.add_argument('-r','--release', choices=['19.07.EU '], help = 'specify a release version in JIRA', required=True)
+        parser.add_argument('-r','--release', choices=['19.07.EU '], nargs='+', help = 'specify one or several release versions in JIRA', required=True)
         parser.add_argument('-sys', '--system', choices=['T24', 'TAP'], help = 'specify the impacted system, this only has impact on the email template', required=True)
         parser.add_argument('-d', '--deploydate', help = 'specify the deploy date, this only has impact on the email template', required=True)
         return parser
@@ -32,106 +59,61 @@ class ReleaseNoteExtractor(BaseExtractor):
         ''' Transform certain columns into datetime objects so that excel can sort them properly ''' 
         timerz=time.strftime("%Y%m%d_%H%M%S_"+str(len(dictionary)))
         filename = str(self.name)+'_'+timerz+'.xlsx'
-        df = pd.DataFrame.from_dict(dictionary,orient='index')
-        writer = pd.ExcelWriter(filename, engine='xlsxwriter', options={'remove_timezone': True})
-        df.to_excel(writer, sheet_name=self.release_version, header=True, index=True)
-        
-        ''' Close the Pandas Excel writer and output the Excel file '''
-        self.save_excel(writer)
+        with self.report_writer(filename) as writer:
+            for release, rows in self.group_by_release(dictionary).items():
+                writer.write_sheet(release, rows)
         self.test_file_creation
     
     @Memorize(func_name = "grab_tickets", file_name = os.path.basename(__file__))
     def grab_tickets(self, dictionary: dict) -> dict:
         return super().grab_tickets(dictionary) 
     
-    def clean_json(self, dictionary: dict) -> DataFrame:
+    def clean_json(self, dictionary: dict) -> pd.DataFrame:
         ''' Mapping function '''
         ''' Go through the json and pick the right values to add to the excel ''' 
         ''' Steps: customfield_17284 '''
         ''' Xray status: customfield_17290 '''
-        final_json = dict()
-        for jira_key, val in dictionary.items():
-            json_trash = dict()
-            json_trash['Issue Type'] = val['issuetype']['name']
-            json_trash['Summary'] = val['summary']
-            json_trash['Status'] = val['status']['name']
-            json_trash['Description'] = val['description']
-            json_trash['Reporter'] = val['reporter']['displayName']
-            if val['assignee'] is not None:
-                json_trash['Assignee'] = val['assignee']['displayName']
-            
-            if len(val['customfield_12706']) > 0:
-                json_trash['PSP'] = val['customfield_12706'][0]
-            
-            final_json[jira_key] = json_trash
-        return final_json
-
-    def generate_email(self, dictionary: dict) -> None:
-        ''' Generate a .html that can later be attached as an email '''
-        DATE_TOP_LEFT = datetime.now()
+        return self.map_fields(dictionary)
 
-        HEAD = RESOURCES.HEAD
-        HEAD += str(DATE_TOP_LEFT.strftime('%d.%m.%Y'))
+    def report(self, dictionary: dict) -> dict:
+        ''' The excel is followed by the email of every release '''
+        if self.verbose is True:
+            print(dictionary)
+        json = self.clean_stage(dictionary)
+        self.save_columnar(json)
+        with self.metrics.span('generate_excel'):
+            self.generate_excel(json)
+        with self.metrics.span('generate_email'):
+            self.generate_email(json)
+        return json
 
-        HEAD += RESOURCES.SUB_HEAD
-        HEAD += '{} Release {} {}'.format(self.system, DATE_TOP_LEFT.strftime('%B %Y'), self.release_version)
-        HEAD += RESOURCES.SUB_HEAD_2
-        
-        SUBJECT = "SUBJECT: {} Freeze notification".format(self.system)
-        HEAD += SUBJECT
-        HEAD += RESOURCES.SUB_HEAD_2_1
-        HEAD += RESOURCES.SUB_HEAD_2_2
-        
-        HEAD += """The {} tickets outlined below will be deployed on the 
-        weekend of the {}. Please note that no further deployment requests
-        will be accepted. """.format(str(len(dictionary)), self.deploy_date)
-        
-        HEAD += RESOURCES.SUB_HEAD_3
-        HEAD += RESOURCES.TABLE_1
+    def group_by_release(self, dictionary: dict) -> dict:
+        ''' Release version -> rows of clean_json, an issue of several of the releases is listed under each of them '''
+        if len(self.release_versions) == 1:
+            return {self.release_versions[0]: dictionary}
+        releases = {release: dict() for release in self.release_versions}
         for key, val in dictionary.items():
-            if val['Issue Type']== "Bug":
-                HEAD += RESOURCES.OBJ_1_BUG
-            elif val['Issue Type'] == "New Feature":
-                HEAD += RESOURCES.OBJ_1_FEAT
-            elif val['Issue Type'] == "Task":
-                HEAD += RESOURCES.OBJ_1_TSK
-            elif val['Issue Type'] == "Change Request":
-                HEAD += RESOURCES.OBJ_1_CR
-            elif val['Issue Type'] == "Story":
-                HEAD += RESOURCES.OBJ_1_STR
-            elif val['Issue Type'] == "Requirement":
-                HEAD += RESOURCES.OBJ_1_REQ
-            elif val['Issue Type'] == "Epic":
-                HEAD += RESOURCES.OBJ_1_EPC
-            else:
-                HEAD += RESOURCES.OBJ_1
-            LINK = "https://jira.com/browse/"+str(key)
-            HEAD += LINK
-            HEAD += RESOURCES.OBJ_2
-            HEAD += str(key)
-         
-            HEAD += RESOURCES.OBJ_3
-            summary = val['Summary']
-            HEAD += summary
-            HEAD += RESOURCES.OBJ_4
-            description = val['Description']
-            new_description = re.sub('\{[^(aeiu)]*\}', '', description)
-            description_paragraph = new_description
-            HEAD += description_paragraph
-            
-            HEAD += RESOURCES.OBJ_5        
-            
-#            HEAD += RESOURCES.OBJ_6
-#            HEAD += "Bullet point example 1"
-#            HEAD += RESOURCES.OBJ_7
-#            HEAD += RESOURCES.OBJ_6
-#            HEAD += "Bullet point example 2"
-#            HEAD += RESOURCES.OBJ_7
-            
-        HEAD += RESOURCES.TABLE_2
-        with open(self.name+str('.html'), 'w') as file:
-            file.write(HEAD)
-            
+            for release in val.get('Fix Version', '').split(', '):
+                if release in releases:
+                    releases[release][key] = val
+        return releases
+
+    def email_path(self, release: str) -> str:
+        if len(self.release_versions) == 1:
+            return self.name + '.html'
+        return self.name + '_' + release.strip().replace(' ', '_') + '.html'
+
+    def generate_email(self, dictionary: dict) -> None:
+        ''' Generate a .html per release that can later be attached as an email '''
+        ''' the html fragments and jinja2 are only imported once an email is built '''
+        import img.RESOURCES as RESOURCES
+        from email_template import ReleaseEmail
+        ''' the markup of every description is stripped in one batch '''
+        descriptions = dict(zip(dictionary, strip_markup_all(val['Description'] for val in dictionary.values())))
+        email = ReleaseEmail(RESOURCES, system = self.system, deploy_date = self.deploy_date)
+        for release, rows in self.group_by_release(dictionary).items():
+            email.render(self.email_path(release), release, rows, (descriptions[key] for key in rows))
+
 def main(name):
     ''' Instantiate the Extractor class, grab the tickets from the JIRA API and output an .html '''
     ''' Confluence and JIRA provide a nice interface for the management of each release but there is no good looking email builder interface '''
@@ -141,12 +123,9 @@ def main(name):
         extractor.run_tests()
     
     extractor.startTimer
-    json = extractor.grab_tickets(dict())
-    json = extractor.remove_custom_fields(json, 'customfield_12706')
-    print(json)
-    json = extractor.clean_json(json)
-    extractor.generate_excel(json)
-    extractor.generate_email(json)
+    ''' with a watermark the search only returns the tickets updated since the last run, the others come from the store '''
+    json = extractor.grab_incremental(dict())
+    extractor.report(json)
     extractor.closeTimer
 
 def test_fixtures(NAME):
@@ -0,0 +1,238 @@
+from __future__ import annotations
+import os, csv
+from datetime import datetime, date
+from typing import Iterable, Union
+from utils import lazy_import
+xlsxwriter = lazy_import('xlsxwriter')
+pd = lazy_import('pandas')
+
+
+class ReportWriter:
+    '''
+    Stream a report into an .xlsx in xlsxwriter constant_memory mode: every row is flushed to disk as soon as
+    the next one starts, the workbook is never held in memory and no intermediate DataFrame is required.
+    Rows come straight from the cleaned dict (issue key -> {column: value}) or from a DataFrame.
+    The writer of a column (date, number or text) is picked once: from dates, numbers or the dtype of a DataFrame,
+    or else from the first value of the column that is not empty. A cell of another type falls back to _write_value.
+    Timezones are removed like pd.ExcelWriter(options={'remove_timezone': True}) does.
+    An optional sidecar repeats every sheet in .csv (streamed alongside the excel) or .parquet (needs pyarrow).
+    Paths are absolute, the working directory is never changed.
+    Usage:
+    with ReportWriter(os.path.join(folder, 'JIRA_20190720.xlsx'), sidecar='csv') as writer:
+        writer.write_sheet('LEO and MISC', final_json, dates=['created', 'updated'])
+    '''
+    SIDECARS = (None, 'csv', 'parquet')
+
+    def __init__(self, path: str, sidecar: str = None, date_format: str = 'yyyy/mm/dd hh:mm:ss') -> None:
+        if sidecar not in self.SIDECARS:
+            raise ValueError(f"Unknown sidecar {sidecar}, expected one of {self.SIDECARS}")
+        self.path = os.path.abspath(path)
+        self.sidecar = sidecar
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.workbook = xlsxwriter.Workbook(self.path, {'constant_memory': True,
+                                                        'remove_timezone': True,
+                                                        'default_date_format': date_format})
+        self.header_format = self.workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+
+    def __enter__(self) -> 'ReportWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.workbook.close()
+
+    def sidecar_path(self, sheet: str) -> str:
+        return os.path.splitext(self.path)[0] + '_' + _safe_name(sheet) + '.' + self.sidecar
+
+    def write_sheet(self, sheet: str, data: Union[dict, pd.DataFrame], columns: list = None, dates: Iterable = (),
+                    numbers: Iterable = (), index: bool = True, index_label: str = None) -> int:
+        '''
+        Write one sheet and return the number of rows written.
+        columns picks and orders the columns. Columns missing from a DataFrame are skipped like DataFrame.filter(items=...),
+        columns missing from a dict are written empty.
+        dates and numbers force the type of a column, the dtypes of a DataFrame are used otherwise.
+        '''
+        if type(data).__module__.startswith('pandas') and isinstance(data, pd.DataFrame):
+            index_label = index_label or data.index.name
+            columns, rows, dates, numbers = self.frame_rows(data, columns, set(dates), set(numbers))
+        else:
+            columns, rows = self.dict_rows(data, columns)
+        writers = [self.cell_writer(column, dates, numbers) for column in columns]
+        header = ([index_label or ''] if index is True else list()) + [str(column) for column in columns]
+        offset = 1 if index is True else 0
+
+        worksheet = self.workbook.add_worksheet(sheet)
+        for j, title in enumerate(header):
+            worksheet.write_string(0, j, title, self.header_format)
+        sidecar = self.open_sidecar(sheet, header)
+        count = 0
+        for count, (key, values) in enumerate(rows, 1):
+            if index is True:
+                _write_value(worksheet, count, 0, key)
+            for j, value in enumerate(values):
+                if writers[j] is None:
+                    if _missing(value):
+                        continue
+                    writers[j] = _value_writer(value)
+                writers[j](worksheet, count, j + offset, value)
+            if sidecar is not None:
+                sidecar.add(([key] if index is True else list()) + [_plain(value) for value in values])
+        if sidecar is not None:
+            sidecar.close()
+        return count
+
+    @staticmethod
+    def dict_rows(dictionary: dict, columns: list = None) -> tuple:
+        ''' Columns appear in the order they are first seen, like DataFrame.from_dict(orient='index') '''
+        if columns is None:
+            seen = dict()
+            for row in dictionary.values():
+                seen.update(dict.fromkeys(row))
+            columns = list(seen)
+        rows = ((key, [row.get(column) for column in columns]) for key, row in dictionary.items())
+        return columns, rows
+
+    @staticmethod
+    def frame_rows(df: pd.DataFrame, columns: list, dates: set, numbers: set) -> tuple:
+        if columns is not None:
+            df = df.filter(items=columns)
+        for column in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[column]):
+                dates.add(column)
+                if getattr(df[column].dt, 'tz', None) is not None:
+                    ''' keep the wall clock time, once for the whole column '''
+                    df = df.assign(**{column: df[column].dt.tz_localize(None)})
+            elif pd.api.types.is_numeric_dtype(df[column]) and df[column].dtype != bool:
+                numbers.add(column)
+        rows = ((row[0], row[1:]) for row in df.itertuples(index=True, name=None))
+        return list(df.columns), rows, dates, numbers
+
+    @staticmethod
+    def cell_writer(column: str, dates: set, numbers: set):
+        ''' None until the first value of the column that is not empty picks the writer, see _value_writer '''
+        if column in dates:
+            return _write_date
+        if column in numbers:
+            return _write_number
+        return None
+
+    def open_sidecar(self, sheet: str, header: list):
+        if self.sidecar == 'csv':
+            return _CsvSidecar(self.sidecar_path(sheet), header)
+        if self.sidecar == 'parquet':
+            return _ParquetSidecar(self.sidecar_path(sheet), header)
+        return None
+
+
+class _CsvSidecar:
+    def __init__(self, path: str, header: list) -> None:
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(header)
+
+    def add(self, row: list) -> None:
+        self.writer.writerow(row)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _ParquetSidecar:
+    ''' Parquet is columnar, the values of one sheet are kept until the sheet is complete '''
+    def __init__(self, path: str, header: list) -> None:
+        ''' fail before the sheet is written rather than after '''
+        import pyarrow
+        self.path = path
+        self.header = [title or 'index' for title in header]
+        self.columns = [list() for _ in header]
+
+    def add(self, row: list) -> None:
+        for values, value in zip(self.columns, row):
+            values.append(value)
+
+    def close(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        arrays = list()
+        for values in self.columns:
+            types = {type(value) for value in values if value is not None}
+            if len(types) > 1:
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(pa.array(values))
+        pq.write_table(pa.Table.from_arrays(arrays, names=self.header), self.path)
+
+
+def _missing(value) -> bool:
+    ''' None, NaN and NaT are written as blank cells '''
+    return value is None or (not isinstance(value, (str, list, dict, tuple)) and value != value)
+
+
+def _write_date(worksheet, row: int, col: int, value) -> None:
+    if _missing(value):
+        return
+    if isinstance(value, (datetime, date)):
+        worksheet.write_datetime(row, col, value)
+    else:
+        _write_value(worksheet, row, col, value)
+
+
+def _write_number(worksheet, row: int, col: int, value) -> None:
+    if _missing(value):
+        return
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        worksheet.write_number(row, col, value)
+    else:
+        _write_value(worksheet, row, col, value)
+
+
+def _write_text(worksheet, row: int, col: int, value) -> None:
+    if isinstance(value, str):
+        worksheet.write_string(row, col, value)
+    else:
+        _write_value(worksheet, row, col, value)
+
+
+def _value_writer(value):
+    if isinstance(value, str):
+        return _write_text
+    if isinstance(value, (datetime, date)):
+        return _write_date
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _write_number
+    return _write_value
+
+
+def _write_value(worksheet, row: int, col: int, value) -> None:
+    if _missing(value):
+        return
+    if isinstance(value, str):
+        worksheet.write_string(row, col, value)
+    elif isinstance(value, bool):
+        worksheet.write_boolean(row, col, value)
+    elif isinstance(value, (int, float)):
+        worksheet.write_number(row, col, value)
+    elif isinstance(value, (datetime, date)):
+        worksheet.write_datetime(row, col, value)
+    elif hasattr(value, 'item'):
+        ''' numpy scalars '''
+        _write_value(worksheet, row, col, value.item())
+    else:
+        worksheet.write_string(row, col, str(value))
+
+
+def _plain(value):
+    if _missing(value):
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (list, dict, tuple)):
+        return str(value)
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def _safe_name(value: str) -> str:
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in str(value))
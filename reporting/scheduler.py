@@ -0,0 +1,221 @@
+import asyncio, random, re, threading, time
+from contextlib import contextmanager, asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+
+''' issue keys and numeric ids are folded so that /issue/T2L-1/watchers and /issue/T2L-2/watchers are one endpoint, /api/2 is kept '''
+_ID = re.compile(r'/(?:[A-Z][A-Z0-9_]*-\d+|\d{3,})(?=/|$)')
+''' methods that can be sent again after a 5xx or a broken connection without creating anything twice '''
+IDEMPOTENT = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+
+def endpoint(url: str) -> str:
+    parts = urlsplit(url)
+    return parts.netloc + _ID.sub('/{id}', parts.path)
+
+
+def retry_after(headers) -> float:
+    ''' Seconds asked by a Retry-After header, given as seconds or as an HTTP date, None when there is none '''
+    value = (headers or dict()).get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    '''
+    Throttling and retries of every JIRA call of the process.
+    A token bucket spreads the calls at `rate` per second with bursts of `burst` calls. The rate is adaptive:
+    it is halved on every 429 and grows back by `recovery` per successful call, up to the configured rate.
+    A Retry-After header pauses the whole bucket, not only the call that received it.
+    5xx answers and broken connections are retried with an exponential backoff with full jitter, idempotent methods only.
+    Each endpoint has at most `endpoint_concurrency` calls in flight, the peak is kept in self.peak.
+    Usage:
+    session = requests.Session()
+    mount(session, shared_scheduler(rate = 20))
+    session.get(url)
+    '''
+    def __init__(self, rate: float = 20, burst: int = 10, max_retries: int = 5, backoff: float = 0.5, max_backoff: float = 60,
+                 endpoint_concurrency: int = 10, min_rate: float = 0.5, recovery: float = 0.5) -> None:
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.recovery = recovery
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.endpoint_concurrency = endpoint_concurrency
+        self.lock = threading.Lock()
+        self.semaphores = dict()
+        self.in_flight = dict()
+        self.peak = dict()
+        self.counters = {'calls': 0, 'throttled': 0, 'retries': 0, 'failures': 0}
+
+    def reserve(self) -> float:
+        ''' Take a token and return the seconds to wait before using it, the bucket may go into debt '''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            self.counters['calls'] += 1
+            return max(0.0, -self.tokens / self.rate, self.paused_until - now)
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def endpoint_semaphore(self, key: str) -> threading.BoundedSemaphore:
+        with self.lock:
+            if key not in self.semaphores:
+                self.semaphores[key] = threading.BoundedSemaphore(self.endpoint_concurrency)
+                self.in_flight[key] = 0
+                self.peak[key] = 0
+            return self.semaphores[key]
+
+    def enter(self, key: str) -> None:
+        with self.lock:
+            self.in_flight[key] += 1
+            self.peak[key] = max(self.peak[key], self.in_flight[key])
+
+    def leave(self, key: str) -> None:
+        with self.lock:
+            self.in_flight[key] -= 1
+
+    @contextmanager
+    def slot(self, url: str):
+        ''' Hold one of the concurrent calls of the endpoint of url '''
+        key = endpoint(url)
+        with self.endpoint_semaphore(key):
+            self.enter(key)
+            try:
+                yield key
+            finally:
+                self.leave(key)
+
+    @asynccontextmanager
+    async def async_slot(self, url: str, semaphores: dict, limit: int = None):
+        '''
+        slot() for the coroutines of an event loop: a thread semaphore would block the loop, the endpoint is limited by an
+        asyncio.Semaphore of the loop instead, kept in semaphores by the caller. The calls in flight and their peak are shared with the threads.
+        limit replaces endpoint_concurrency for this loop, see AsyncFetcher
+        '''
+        key = endpoint(url)
+        self.endpoint_semaphore(key)
+        if key not in semaphores:
+            semaphores[key] = asyncio.Semaphore(limit or self.endpoint_concurrency)
+        async with semaphores[key]:
+            self.enter(key)
+            try:
+                yield key
+            finally:
+                self.leave(key)
+
+    def backoff_delay(self, attempt: int) -> float:
+        ''' Full jitter: anywhere between 0 and the exponential ceiling so that the threads do not retry in step '''
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def retry_delay(self, status: int, headers, attempt: int, method: str = 'GET') -> float:
+        ''' Seconds to wait before sending the call again, None when the answer is final '''
+        if status == 429:
+            with self.lock:
+                self.counters['throttled'] += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+        elif status < 500 or method.upper() not in IDEMPOTENT:
+            if status < 400:
+                with self.lock:
+                    self.rate = min(self.max_rate, self.rate + self.recovery)
+            return None
+        if attempt >= self.max_retries:
+            with self.lock:
+                self.counters['failures'] += 1
+            return None
+        with self.lock:
+            self.counters['retries'] += 1
+        delay = retry_after(headers)
+        if delay is None:
+            return self.backoff_delay(attempt)
+        if status in (429, 503):
+            ''' the next acquire waits for the pause, of this call and of every other one '''
+            self.pause(delay)
+            return 0.0
+        return min(delay, self.max_backoff)
+
+    def pause(self, seconds: float) -> None:
+        ''' Hold every call of the bucket, JIRA asked the whole client to slow down '''
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def error_delay(self, attempt: int, method: str = 'GET') -> float:
+        ''' Seconds to wait after a broken connection or a timeout, None when the error has to be raised '''
+        if method.upper() not in IDEMPOTENT or attempt >= self.max_retries:
+            with self.lock:
+                self.counters['failures'] += 1
+            return None
+        with self.lock:
+            self.counters['retries'] += 1
+        return self.backoff_delay(attempt)
+
+
+class ScheduledAdapter(HTTPAdapter):
+    ''' HTTPAdapter that sends every call of the session through a RequestScheduler '''
+    def __init__(self, scheduler: RequestScheduler, **kwargs) -> None:
+        self.scheduler = scheduler
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            self.scheduler.acquire()
+            try:
+                with self.scheduler.slot(request.url):
+                    response = super().send(request, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                delay = self.scheduler.error_delay(attempt, request.method)
+                if delay is None:
+                    raise
+            else:
+                delay = self.scheduler.retry_delay(response.status_code, response.headers, attempt, request.method)
+                if delay is None:
+                    return response
+                ''' give the connection back to the pool before waiting '''
+                response.close()
+            if delay > 0:
+                time.sleep(delay)
+            attempt += 1
+
+
+def mount(session: requests.Session, scheduler: RequestScheduler, **kwargs) -> requests.Session:
+    ''' Route the http and https calls of an existing session, e.g. the one of atlassian.Jira, through the scheduler '''
+    adapter = ScheduledAdapter(scheduler, **kwargs)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler(**kwargs) -> RequestScheduler:
+    ''' The scheduler of the process, created with the arguments of the first call. Every extractor and client shares its budget '''
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RequestScheduler(**kwargs)
+        return _shared
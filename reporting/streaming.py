@@ -0,0 +1,40 @@
+from requests.models import Response
+try:
+    import ijson
+except ImportError:
+    ''' Optional dependency, BaseExtractor falls back on response.json() without it '''
+    ijson = None
+
+
+class IssueStream:
+    '''
+    Iterate over the issues of a JIRA search page while the body is still being read from the socket.
+    Only one issue is materialized at a time instead of the raw bytes, the text and the object tree of 1000 issues.
+    JIRA sends "total" before "issues" so self.total is known as soon as the first issue is yielded.
+    The response has to be requested with stream=True.
+    Usage:
+    with session.get(url, stream=True) as response:
+        issues = IssueStream(response)
+        for issue in issues:
+            print(issue['key'], issues.total)
+    '''
+    def __init__(self, response: Response) -> None:
+        self.response = response
+        self.total = None
+
+    def __iter__(self):
+        raw = self.response.raw
+        ''' let urllib3 inflate the gzip body negotiated by the session '''
+        raw.decode_content = True
+        builder = None
+        for prefix, event, value in ijson.parse(raw, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == 'issues.item' and event == 'end_map':
+                    yield builder.value
+                    builder = None
+            elif prefix == 'issues.item' and event == 'start_map':
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            elif prefix == 'total':
+                self.total = int(value)
@@ -0,0 +1,33 @@
+from __future__ import annotations
+from utils import lazy_import
+pd = lazy_import('pandas')
+
+
+''' JIRA REST timestamps: 2017-11-17T16:18:14.000+0100, date fields (duedate) come as 2017-11-17 '''
+JIRA_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%z'
+DATE_FORMAT = '%Y-%m-%d'
+TIMEZONE = 'Europe/Luxembourg'
+
+
+def normalize_timestamps(values: pd.Series, timezone: str = TIMEZONE) -> pd.Series:
+    '''
+    Parse a whole column of JIRA timestamps at once and return naive datetimes in the wall clock time of timezone.
+    The fixed format keeps pandas on its fast path instead of guessing the format value by value,
+    the timezone is converted once for the column. Values that match neither format become NaT.
+    Usage:
+    normalize_timestamps(pd.Series(['2017-11-17T16:18:14.000+0100', '2017-11-17', None]))
+    >> [2017-11-17 16:18:14, 2017-11-17 00:00:00, NaT]
+    '''
+    text = values.astype(object)
+    parsed = pd.to_datetime(text, format=JIRA_FORMAT, errors='coerce', utc=True)
+    parsed = parsed.dt.tz_convert(timezone).dt.tz_localize(None)
+    ''' date fields have no time nor offset, they are already a local date '''
+    missing = parsed.isnull() & text.notnull()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(text[missing], format=DATE_FORMAT, errors='coerce')
+    return parsed
+
+
+def unparsed(values: pd.Series, parsed: pd.Series) -> pd.Index:
+    ''' Index of the rows holding a value that normalize_timestamps could not read '''
+    return values.index[values.notnull() & parsed.isnull()]
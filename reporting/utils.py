@@ -1,8 +1,80 @@
 from typing import Callable
-import os, yaml
+import os, sys, pickle
+import importlib.util
 import logging, time
 from timeit import default_timer as timer
-from collections import defaultdict
+
+
+def lazy_import(name: str):
+    '''
+    Module that is only executed on the first access to one of its attributes, through importlib.util.LazyLoader.
+    pandas and xlsxwriter are imported this way so that --help and the stages that never build a frame do not pay for them.
+    A module that is already imported is returned as it is.
+    Usage:
+    pd = lazy_import('pandas')
+    pd.DataFrame() # pandas is executed here
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+''' path -> module, see load_module '''
+_MODULES = dict()
+
+def load_module(path: str, name: str):
+    ''' Import a .py file by its path, once per process. sys.path and the working directory are left untouched '''
+    path = os.path.abspath(path)
+    if path not in _MODULES:
+        if not os.path.isfile(path):
+            raise ModuleNotFoundError(f"No module named '{name}' at {path}", name=name)
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _MODULES[path] = module
+    return _MODULES[path]
+
+''' path -> (modification time and size, pickled config), see load_config '''
+_CONFIGS = dict()
+
+def load_config(path: str) -> dict:
+    '''
+    Parsed yml file, served from a snapshot as long as the file keeps its modification time and size.
+    The snapshot is kept for the process and pickled under .cache/ for the processes that follow,
+    so yaml is only imported and run after the file changed. Every call returns a copy that can be modified.
+    '''
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if path in _CONFIGS and _CONFIGS[path][0] == stamp:
+        return pickle.loads(_CONFIGS[path][1])
+    snapshot = os.path.join(os.path.dirname(os.path.abspath(path)), '.cache', os.path.basename(path) + '.pickle')
+    try:
+        with open(snapshot, 'rb') as file:
+            saved, payload = pickle.load(file)
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+        saved, payload = None, None
+    if saved != stamp:
+        import yaml
+        with open(path, 'r') as ymlfile:
+            payload = pickle.dumps(yaml.load(ymlfile, yaml.SafeLoader))
+        try:
+            os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+            temporary = f'{snapshot}.{os.getpid()}'
+            with open(temporary, 'wb') as file:
+                pickle.dump((stamp, payload), file)
+            os.replace(temporary, snapshot)
+        except OSError:
+            ''' read-only deployment, the next process parses the file again '''
+            pass
+    _CONFIGS[path] = (stamp, payload)
+    return pickle.loads(payload)
 
 
 class Loader:
@@ -17,16 +89,10 @@ class Loader:
             return False
     @staticmethod
     def grab_configuration() -> Callable:
-        curdir = os.getcwd()
         path = 'C:\\Users\\u46022\\Documents'
-        os.chdir(path)
-        import configuration
-        os.chdir(curdir)
-        return configuration
+        return load_module(os.path.join(path, 'configuration.py'), 'configuration')
     def load_yml(self):
-        with open(os.path.join(self.wdirectory, "config.yml"), 'r') as ymlfile:
-            cfg = yaml.load(ymlfile, yaml.SafeLoader)
-        return cfg
+        return load_config(os.path.join(self.wdirectory, "config.yml"))
 
 class MyLogger:
     @staticmethod
@@ -48,49 +114,66 @@ class MyLogger:
             return logger
     @property
     def startTimer(self) -> None:
-        ''' Start the timewatch '''
+        ''' Start the timewatch and the metrics of the run when the job has some, see metrics.RunMetrics '''
         logging.getLogger(__name__).info(f"Timer started for job: {self}")
         if self.verbose is True:
             print("Timer started @ "+time.strftime("%H:%M"))
+        if getattr(self, 'metrics', None) is not None:
+            self.metrics.start()
     @property
     def closeTimer(self) -> None:
-        ''' Stop the timewatch '''
+        ''' Stop the timewatch, log the time of every stage and write the metrics next to the report '''
         self.end = timer()
-        elapsed = round((self.end-self.start)/60)
+        elapsed = round((self.end-self.start)/60, 2)
         stats = self.stats(elapsed)
         logging.getLogger(__name__).info(stats)
         if self.verbose is True:
             print(stats)
+        if getattr(self, 'metrics', None) is None:
+            return
+        self.metrics.stop()
+        for line in self.metrics.lines():
+            logging.getLogger(__name__).info(f"{self} {line}")
+        for path in self.metrics.save():
+            logging.getLogger(__name__).info(f"Metrics of {self} written to {path}")
+            if self.verbose is True:
+                print(f"Metrics written to {path}")
 
-class MyDefaultDict(defaultdict):
+class SafePath:
     """
+    Read-only view over the fields of an issue, a missing key, a null parent or an index out of range resolves to None.
+    Nothing is copied, nothing is written back into the fields and no object is allocated on a miss.
     Usage: 
-    _json = {'fixVersions': {'customfield_14791': None}]}
-    someddict = mydefaultdict(_json)
-    print(someddict['fixVersions'])
-    >> {'customfield_14791': None}
-    print(someddict['customfield_14791'])
+    _json = {'fixVersions': [{'name': '19.07.EU '}], 'assignee': None}
+    fields = SafePath(_json)
+    print(fields.get('fixVersions', 0, 'name'))
+    >> 19.07.EU 
+    print(fields.get('assignee', 'displayName'))
     >> None
-    print(someddict['customfield_14791']['customfield_14791'])
+    print(fields.get('customfield_14791', 'value'))
     >> None
-    print(someddict['fixVersions']['customfield_14792'])
-    KeyError: 'customfield_14792'
     """
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(MyDefaultDict, *args, **kwargs)
-    def __repr__(self):
-        return repr(self.dictify())
-    def dictify(self):
-        '''Get a standard dictionary of the items in the tree.
-        
-        d = dict()
-        for k, v in self.items():
-            if isinstance(v, dict) :
-                d[k] = v.dictify()
-            else:
-                d[k] = v
-        '''
-        dictionary = dict((k, (v.dictify() if isinstance(v, dict) else v)) for k, v in self.items())
-        if len(dictionary) > 0:
-            return dictionary
+    __slots__ = ('fields',)
+
+    def __init__(self, fields: dict) -> None:
+        self.fields = fields
+
+    def get(self, *path, default = None):
+        value = self.fields
+        for step in path:
+            try:
+                value = value[step]
+            except (KeyError, IndexError, TypeError):
+                return default
+            if value is None:
+                return default
+        return value
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __repr__(self) -> str:
+        return f"SafePath({self.fields!r})"
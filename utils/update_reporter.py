@@ -1,6 +1,9 @@
-import requests, time
+import requests
 import json
+import time
 import configuration as cfg 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 liste = {'https://jira.com/rest/api/2/issue/T2L-249': 'John',
@@ -16,10 +19,15 @@ liste = {'https://jira.com/rest/api/2/issue/T2L-249': 'John',
 
 headers = {"Authorization": "Basic %s" % cfg.u, "Content-Type": "application/json"}
 
+#the PUTs JIRA throttles or fails on are retried, waiting Retry-After or an exponential backoff
+session = requests.Session()
+session.mount('https://', HTTPAdapter(max_retries = Retry(total = 5, backoff_factor = 1, status_forcelist = (429, 500, 502, 503, 504),
+                                                          allowed_methods = frozenset({'PUT'}), raise_on_status = False)))
 
 for key, value in liste.items():
-    response = requests.put(key, data=json.dumps({"update":{"reporter":[{"set":{'name':value}}]}}), headers=headers, verify = False)
+    response = session.put(key, data=json.dumps({"update":{"reporter":[{"set":{'name':value}}]}}), headers=headers, verify = False)
     print(key,response.text)
+    #one PUT per second
     time.sleep(1)
 
 print(response.text)